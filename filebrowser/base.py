@@ -1,28 +1,53 @@
+import collections
 import datetime
+import heapq
+import itertools
+import logging
+import math
 import mimetypes
 import os
 import platform
 import tempfile
 import time
+from operator import attrgetter
 
 from django.core.files import File
+from django.dispatch import receiver
 from django.utils.encoding import force_str
 from django.utils.functional import cached_property
 from filebrowser.settings import (
     ADMIN_VERSIONS,
     DEFAULT_PERMISSIONS,
-    EXTENSIONS,
     IMAGE_MAXBLOCK,
-    SELECT_FORMATS,
     STRICT_PIL,
     VERSION_QUALITY,
     VERSIONS,
     VERSIONS_BASEDIR,
 )
-from filebrowser.utils import get_modified_time, path_strip, process_image
+from filebrowser.utils import (
+    VERSIONS_CACHE_TIMEOUT,
+    get_dimensions_cache,
+    get_dimensions_cache_key,
+    get_extension_lookup,
+    get_image_dimensions,
+    get_listing_cache,
+    get_listing_cache_key,
+    get_listing_generation,
+    get_modified_time,
+    get_versions_cache,
+    get_versions_cache_key,
+    listing_changed,
+    path_strip,
+    process_image,
+    scale_and_crop_ratio,
+    uses_default_processors,
+)
 
+from . import signals
 from .namers import get_namer
 
+logger = logging.getLogger("filebrowser")
+
 if STRICT_PIL:
     from PIL import Image
     from PIL import ImageFile
@@ -62,12 +87,19 @@ class FileListing:
     _results_walk_total = None
 
     def __init__(
-        self, path, filter_func=None, sorting_by=None, sorting_order=None, site=None
+        self,
+        path,
+        filter_func=None,
+        sorting_by=None,
+        sorting_order=None,
+        site=None,
+        folders_first=False,
     ):
         self.path = path
         self.filter_func = filter_func
         self.sorting_by = sorting_by
         self.sorting_order = sorting_order
+        self.folders_first = folders_first
         if not site:
             from filebrowser.sites import site as default_site
 
@@ -77,22 +109,90 @@ class FileListing:
     # HELPER METHODS
     # sort_by_attr
 
-    def sort_by_attr(self, seq, attr):
+    # Aliases for sorting attributes (used with the admin)
+    sorting_aliases = {"folder": "dirname", "filetype_checked": "filetype"}
+
+    def sort_by_attr(self, seq, attr, reverse=False, folders_first=False):
         """
         Sort the sequence of objects by object's attribute
 
         Arguments:
         seq  - the list or any sequence (including immutable one) of objects to sort.
-        attr - the name of attribute to sort by
+        attr - the name of attribute to sort by (or a tuple of names)
+        reverse - reverse the sorted list (including objects with equal values)
+        folders_first - folders before files (regardless of reverse)
 
         Returns:
-        the sorted list of objects.
-        """
-        from operator import attrgetter
+        a new sorted list of objects.
 
-        if isinstance(attr, str):  # Backward compatibility hack
+        Values requiring site.storage (e.g. date or filesize) are fetched
+        with a single listing per folder before sorting (see
+        StorageMixin.listdir_with_stats), None is sorted after all values.
+        """
+        if not attr:
+            attr = ()
+        elif isinstance(attr, str):  # Backward compatibility hack
             attr = (attr,)
-        return sorted(seq, key=attrgetter(*attr))
+        attr = tuple(self.sorting_aliases.get(name, name) for name in attr)
+        seq = list(seq)
+        self._prefetch_stats(seq, self._sort_stat_attrs(attr, folders_first))
+        if attr:
+            seq.sort(key=self._sort_key(attr))
+        if reverse:
+            seq.reverse()
+        if folders_first:
+            seq.sort(key=lambda item: not item.is_folder)
+        return seq
+
+    def _sort_key(self, attr, reverse=False, folders_first=False):
+        """
+        Key function with a tuple of values for attr (with folders first, in
+        reverse order if reverse is True)
+        """
+        getters = [attrgetter(self.sorting_aliases.get(name, name)) for name in attr]
+
+        def key(item):
+            values = []
+            if folders_first:
+                values.append(item.is_folder if reverse else not item.is_folder)
+            for getter in getters:
+                value = getter(item)
+                values.append((value is None, value))
+            return tuple(values)
+
+        return key
+
+    def _sort_stat_attrs(self, attr, folders_first):
+        "Attributes taken from stat which are needed for sorting"
+        needed = set(self.sorting_aliases.get(name, name) for name in attr)
+        if folders_first or "filetype" in needed:
+            needed.add("is_folder")
+        return needed.intersection(FileEntry.stat_attrs)
+
+    def _prefetch_stats(self, seq, attrs):
+        """
+        Fetches the unknown values of attrs for all objects of seq with a
+        single listing of their folders (instead of calling site.storage
+        for every object).
+        """
+        if not attrs:
+            return
+        missing = collections.defaultdict(list)
+        for item in seq:
+            if not all(item._stat_known(name) for name in attrs):
+                missing[item.head].append(item)
+        for head, items in missing.items():
+            # Listing a folder for a single object is more expensive
+            if len(items) < 2:
+                continue
+            try:
+                stats = dict(self._listdir_with_stats(head))
+            except (NotImplementedError, OSError):
+                continue
+            for item in items:
+                stat = stats.get(item.filename)
+                if stat:
+                    item._stat_update(stat)
 
     @cached_property
     def is_folder(self):
@@ -105,90 +205,305 @@ class FileListing:
             return (f for f in dirs + files)
         return []
 
-    def _walk(self, path, filelisting):
+    def listing_with_stats(self):
         """
-        Recursively walks the path and collects all files and
-        directories.
-
-        Danger: Symbolic links can create cycles and this function
-        ends up in a regression.
+        List all files for path as tuples (name, stat), where stat is a
+        dict with already known attributes of the FileObject (see
+        StorageMixin.listdir_with_stats)
         """
+        if self.is_folder:
+            return self._listdir_with_stats(self.path)
+        return []
+
+    def _listdir_with_stats(self, path):
+        cache = get_listing_cache()
+        if cache is not None:
+            version = self.listing_version(path)
+            key = get_listing_cache_key(self.site, path, ":" + version)
+            items = cache.get(key)
+            if items is None:
+                items = self._storage_listdir_with_stats(path)
+                cache.set(key, items)
+            return items
+        return self._storage_listdir_with_stats(path)
+
+    def _storage_listdir_with_stats(self, path):
+        if hasattr(self.site.storage, "listdir_with_stats"):
+            return list(self.site.storage.listdir_with_stats(path))
         dirs, files = self.site.storage.listdir(path)
+        return [(item, None) for item in dirs + files]
 
-        if dirs:
-            for d in dirs:
-                self._walk(os.path.join(path, d), filelisting)
-                filelisting.extend(
-                    [path_strip(os.path.join(path, d), self.site.directory)]
-                )
+    def listing_version(self, path=None):
+        """
+        Token for the current state of the folder path (defaults to the
+        path of the listing), changed whenever the folder is changed with
+        the FileBrowser and with the modification time of local folders.
+        Returns None without LISTING_CACHE.
+        """
+        if path is None:
+            path = self.path
+        generation = get_listing_generation(self.site, path)
+        if generation is None:
+            return None
+        try:
+            mtime = os.stat(self.site.storage.path(path)).st_mtime_ns
+        except (NotImplementedError, OSError, ValueError):
+            mtime = ""
+        return "%s.%s" % (generation, mtime)
 
-        if files:
-            for f in files:
-                filelisting.extend(
-                    [path_strip(os.path.join(path, f), self.site.directory)]
-                )
+    def _folder_id(self, path):
+        """
+        Identifies a folder with (st_dev, st_ino) in order to detect cycles
+        with symbolic links. Returns None with storages without local paths.
+        """
+        try:
+            st = os.stat(self.site.storage.path(path))
+        except (NotImplementedError, OSError, ValueError):
+            return None
+        return (st.st_dev, st.st_ino)
+
+    def iter_walk(self, max_depth=None, filter_folder=None):
+        """
+        Walks the path and yields FileObjects of all files and folders
+        below path, while walking the directory (a folder is yielded after
+        the items within the folder).
+
+        The walk is iterative and can be stopped early. Every folder is
+        walked only once, so symbolic links creating cycles are not followed.
+        max_depth limits the number of levels (1: only the items of path).
+        Folders are not walked into if filter_folder (called with the
+        FileObject of the folder) returns False.
+        """
+        return self._iter_walk(FileObject, max_depth, filter_folder)
+
+    def iter_entries(self, max_depth=None, filter_folder=None):
+        """
+        Same as iter_walk, but yields lightweight FileEntry records instead
+        of FileObjects (see FileEntry).
+        """
+        return self._iter_walk(FileEntry, max_depth, filter_folder)
+
+    def _iter_walk(self, factory, max_depth, filter_folder):
+        if not self.is_folder:
+            return
+        visited = set()
+        root_id = self._folder_id(self.path)
+        if root_id is not None:
+            visited.add(root_id)
+        # (path, remaining items, FileObject of the folder)
+        stack = [(self.path, iter(self._listdir_with_stats(self.path)), None)]
+        while stack:
+            path, items, folder = stack[-1]
+            for name, stat in items:
+                fileobject = factory(os.path.join(path, name), site=self.site, stat=stat)
+                if (
+                    fileobject.is_folder
+                    and (max_depth is None or len(stack) < max_depth)
+                    and (filter_folder is None or filter_folder(fileobject))
+                ):
+                    folder_id = self._folder_id(fileobject.path)
+                    if folder_id not in visited:
+                        if folder_id is not None:
+                            visited.add(folder_id)
+                        stack.append(
+                            (
+                                fileobject.path,
+                                iter(self._listdir_with_stats(fileobject.path)),
+                                fileobject,
+                            )
+                        )
+                        break
+                yield fileobject
+            else:
+                stack.pop()
+                if folder is not None:
+                    yield folder
 
     def walk(self):
         "Walk all files for path"
-        filelisting = []
-        if self.is_folder:
-            self._walk(self.path, filelisting)
-        return filelisting
+        return [
+            path_strip(fileobject.path, self.site.directory)
+            for fileobject in self.iter_walk()
+        ]
 
     # Cached results of files_listing_total (without any filters and sorting applied)
     _fileobjects_total = None
+    # Cached results of files_listing_total per sorting
+    _fileobjects_sorted = None
 
-    def files_listing_total(self):
-        "Returns FileObjects for all files in listing"
+    def _get_index(self):
+        "The metadata index of the site (if any)"
+        return getattr(self.site, "index", None)
+
+    def files_listing_total(self, sort=True):
+        """
+        Returns FileObjects for all files in listing (in the order of the
+        listing without sort)
+        """
+        if self._fileobjects_total is None:
+            index = self._get_index()
+            if index is not None:
+                self._fileobjects_total = index.listdir(self.path)
         if self._fileobjects_total is None:
             self._fileobjects_total = []
-            for item in self.listing():
-                fileobject = FileObject(os.path.join(self.path, item), site=self.site)
+            for item, stat in self.listing_with_stats():
+                fileobject = FileObject(
+                    os.path.join(self.path, item), site=self.site, stat=stat
+                )
                 self._fileobjects_total.append(fileobject)
 
-        files = self._fileobjects_total
+        if not sort:
+            files = list(self._fileobjects_total)
+            self._results_listing_total = len(files)
+            return files
 
-        if self.sorting_by:
-            files = self.sort_by_attr(files, self.sorting_by)
-        if self.sorting_order == "desc":
-            files.reverse()
+        # Sorted listings are cached per sorting (a copy is returned)
+        sorting = (self._sorting_by_tuple(), self.sorting_order, self.folders_first)
+        if self._fileobjects_sorted is None:
+            self._fileobjects_sorted = {}
+        if sorting not in self._fileobjects_sorted:
+            self._fileobjects_sorted[sorting] = self.sort_files(self._fileobjects_total)
+        files = list(self._fileobjects_sorted[sorting])
 
         self._results_listing_total = len(files)
         return files
 
-    def files_walk_total(self):
-        "Returns FileObjects for all files in walk"
-        files = []
-        for item in self.walk():
-            fileobject = FileObject(
-                os.path.join(self.site.directory, item), site=self.site
+    def _iter_walk_total(self, entries=False):
+        """
+        FileObjects of the walk (from the metadata index, if available),
+        or FileEntry records with entries
+        """
+        index = self._get_index()
+        if index is not None:
+            files = index.walk(self.path)
+            if files is not None:
+                return files
+        if entries:
+            return self.iter_entries()
+        return self.iter_walk()
+
+    def sort_files(self, files, offset=0, limit=None):
+        """
+        Returns a new list of files sorted with sorting_by, sorting_order
+        and folders_first (only the files from offset to offset + limit,
+        if limit is given).
+
+        With a limit which is small compared to the number of files (e.g.
+        the first pages of a listing), only the requested files are sorted
+        with a heap instead of sorting all files.
+        """
+        files = list(files)
+        if limit is not None and (offset + limit) * 4 < len(files):
+            sorting_by = self._sorting_by_tuple()
+            self._prefetch_stats(
+                files, self._sort_stat_attrs(sorting_by, self.folders_first)
             )
-            files.append(fileobject)
-        if self.sorting_by:
-            files = self.sort_by_attr(files, self.sorting_by)
+            return self._sort_top(files, offset + limit)[offset:]
+        files = self.sort_by_attr(
+            files,
+            self.sorting_by,
+            reverse=self.sorting_order == "desc",
+            folders_first=self.folders_first,
+        )
+        if limit is not None:
+            return files[offset : offset + limit]
+        return files[offset:] if offset else files
+
+    def _sorting_by_tuple(self):
+        if not self.sorting_by:
+            return ()
+        if isinstance(self.sorting_by, str):
+            return (self.sorting_by,)
+        return tuple(self.sorting_by)
+
+    def _sort_top(self, files, count):
+        """
+        Returns the first count files of sort_files(files) without sorting
+        all files (files may be an iterator which is consumed completely).
+        """
+        sorting_by = self._sorting_by_tuple()
+        if sorting_by or self.folders_first:
+            if self.sorting_order == "desc":
+                # Same order as sort_files with equal values (the reversed
+                # order of files)
+                key = self._sort_key(
+                    sorting_by, reverse=True, folders_first=self.folders_first
+                )
+                return [
+                    fileobject
+                    for position, fileobject in heapq.nlargest(
+                        count,
+                        enumerate(files),
+                        key=lambda item: (key(item[1]), item[0]),
+                    )
+                ]
+            key = self._sort_key(sorting_by, folders_first=self.folders_first)
+            return heapq.nsmallest(count, files, key=key)
         if self.sorting_order == "desc":
-            files.reverse()
+            # The last files
+            return list(reversed(collections.deque(files, maxlen=count)))
+        files = iter(files)
+        listing = list(itertools.islice(files, count))
+        for fileobject in files:
+            pass
+        return listing
+
+    def files_walk_total(self, entries=False, sort=True):
+        """
+        Returns FileObjects for all files in walk (or FileEntry records with
+        entries, see FileEntry.fileobject), in the order of the walk without
+        sort
+        """
+        files = self._iter_walk_total(entries)
+        files = self.sort_files(files) if sort else list(files)
         self._results_walk_total = len(files)
         return files
 
-    def files_listing_filtered(self):
-        "Returns FileObjects for filtered files in listing"
+    def files_listing_filtered(self, sort=True):
+        """
+        Returns FileObjects for filtered files in listing (in the order of
+        the listing without sort)
+        """
         if self.filter_func:
-            listing = list(filter(self.filter_func, self.files_listing_total()))
+            listing = list(filter(self.filter_func, self.files_listing_total(sort)))
         else:
-            listing = self.files_listing_total()
+            listing = self.files_listing_total(sort)
         self._results_listing_filtered = len(listing)
         return listing
 
-    def files_walk_filtered(self):
-        "Returns FileObjects for filtered files in walk"
+    def files_walk_filtered(self, entries=False, sort=True):
+        """
+        Returns FileObjects for filtered files in walk (or FileEntry records
+        with entries, see FileEntry.fileobject), in the order of the walk
+        without sort
+        """
         if self.filter_func:
-            listing = list(filter(self.filter_func, self.files_walk_total()))
+            # Filter while walking, only the filtered files are sorted
+            listing = filter(self.filter_func, self._iter_walk_total(entries))
+            listing = self.sort_files(listing) if sort else list(listing)
         else:
-            listing = self.files_walk_total()
+            listing = self.files_walk_total(entries, sort)
         self._results_walk_filtered = len(listing)
         return listing
 
+    def files_walk_limited(self, limit):
+        """
+        Returns the first limit FileObjects of files_walk_total together
+        with the number of all files in walk (without keeping all
+        FileObjects in memory, only the returned files are FileObjects).
+        """
+        total = 0
+
+        def counted(files):
+            nonlocal total
+            for fileobject in files:
+                total += 1
+                yield fileobject
+
+        listing = self._sort_top(counted(self._iter_walk_total(entries=True)), limit)
+        self._results_walk_total = total
+        return [promote_entry(fileobject) for fileobject in listing], total
+
     def results_listing_total(self):
         "Counter: all files"
         if self._results_listing_total is not None:
@@ -214,6 +529,207 @@ class FileListing:
         return len(self.files_walk_filtered())
 
 
+class SortedFiles:
+    """
+    A lazy, sliceable list of files sorted with a FileListing (see
+    FileListing.sort_files), e.g. for a Paginator. Only the requested
+    slice is being sorted.
+    """
+
+    def __init__(self, filelisting, files):
+        self.filelisting = filelisting
+        self.files = list(files)
+
+    def count(self):
+        return len(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            if key < 0:
+                key += len(self.files)
+            items = self[key : key + 1]
+            if not items:
+                raise IndexError(key)
+            return items[0]
+        start, stop, step = key.indices(len(self.files))
+        if stop <= start:
+            return []
+        return self.filelisting.sort_files(
+            self.files, offset=start, limit=stop - start
+        )[::step]
+
+
+_unknown = object()
+
+
+class FileEntry:
+    """
+    A lightweight, immutable record of a file (or directory) used with
+    large listings (e.g. walking a folder), see FileObject.
+
+    An entry only stores path, site and the already known values of stat
+    (is_folder, exists, filesize and date). Everything else (filename,
+    extension, filetype, ...) is derived from path when being accessed.
+    Attributes used for filtering and sorting are the same as with
+    FileObject, use fileobject() for everything else (e.g. with the
+    items being rendered).
+    """
+
+    __slots__ = ("path", "site", "_is_folder", "_exists", "_filesize", "_date")
+
+    # Attributes which are taken from stat
+    stat_attrs = ("is_folder", "exists", "filesize", "date")
+
+    def __init__(self, path, site=None, stat=None):
+        if not site:
+            from filebrowser.sites import site as default_site
+
+            site = default_site
+        if platform.system() == "Windows":
+            path = path.replace("\\", "/")
+        stat = stat or {}
+        set_attr = object.__setattr__
+        set_attr(self, "path", path)
+        set_attr(self, "site", site)
+        set_attr(self, "_is_folder", stat.get("is_folder", _unknown))
+        set_attr(self, "_exists", stat.get("exists", _unknown))
+        set_attr(self, "_filesize", stat.get("filesize", _unknown))
+        set_attr(self, "_date", stat.get("date", _unknown))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable" % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is immutable" % self.__class__.__name__)
+
+    def __str__(self):
+        return force_str(self.path)
+
+    def __repr__(self):
+        return "<%s: %s>" % (self.__class__.__name__, self or "None")
+
+    def __len__(self):
+        return len(self.path)
+
+    def _cached(self, name, func):
+        "Value of slot name (calling func once, if unknown)"
+        value = getattr(self, name)
+        if value is _unknown:
+            value = func()
+            object.__setattr__(self, name, value)
+        return value
+
+    def _stat_known(self, attr):
+        "True, if the value of attr is known without calling site.storage"
+        return getattr(self, "_" + attr, None) is not _unknown
+
+    def _stat_update(self, stat):
+        "Sets the unknown values with stat"
+        for attr in self.stat_attrs:
+            if attr in stat and not self._stat_known(attr):
+                object.__setattr__(self, "_" + attr, stat[attr])
+
+    def fileobject(self):
+        "The FileObject of the entry (with the already known values)"
+        stat = {}
+        for attr in self.stat_attrs:
+            value = getattr(self, "_" + attr)
+            if value is not _unknown:
+                stat[attr] = value
+        return FileObject(self.path, site=self.site, stat=stat)
+
+    @property
+    def name(self):
+        return self.path
+
+    @property
+    def head(self):
+        return os.path.dirname(self.path)
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    @property
+    def filename_lower(self):
+        return self.filename.lower()
+
+    @property
+    def filename_root(self):
+        return os.path.splitext(self.filename)[0]
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.path)[1]
+
+    @property
+    def mimetype(self):
+        return mimetypes.guess_type(self.filename)
+
+    @property
+    def path_relative_directory(self):
+        return path_strip(self.path, self.site.directory)
+
+    @property
+    def dirname(self):
+        return os.path.dirname(self.path_relative_directory)
+
+    @property
+    def is_folder(self):
+        return self._cached("_is_folder", lambda: self.site.storage.isdir(self.path))
+
+    @property
+    def exists(self):
+        return self._cached("_exists", lambda: self.site.storage.exists(self.path))
+
+    @property
+    def filesize(self):
+        return self._cached(
+            "_filesize",
+            lambda: self.site.storage.size(self.path) if self.exists else None,
+        )
+
+    @property
+    def date(self):
+        return self._cached("_date", self._get_date)
+
+    def _get_date(self):
+        if self.exists:
+            return time.mktime(
+                get_modified_time(self.site.storage, self.path).timetuple()
+            )
+        return None
+
+    def _get_extension_lookup(self):
+        lookup = getattr(self.site, "extension_lookup", None)
+        if lookup is None:
+            lookup = get_extension_lookup()
+        return lookup
+
+    @property
+    def filetype(self):
+        if self.is_folder:
+            return "Folder"
+        return self._get_extension_lookup().filetype(self.extension)
+
+    @property
+    def format(self):
+        return self._get_extension_lookup().format(self.extension)
+
+
+def promote_entry(item):
+    "Returns the FileObject of a FileEntry (other items are returned as is)"
+    if isinstance(item, FileEntry):
+        return item.fileobject()
+    return item
+
+
 class FileObject:
     """
     The FileObject represents a file (or directory) on the server.
@@ -224,9 +740,13 @@ class FileObject:
         fileobject = FileObject(path)
 
     where path is a relative path to a storage location
+
+    stat is an optional dict with already known values for the lazy
+    attributes (e.g. is_folder, exists, filesize, date, dimensions). It is
+    used with listings in order to avoid additional calls to site.storage.
     """
 
-    def __init__(self, path, site=None):
+    def __init__(self, path, site=None, stat=None):
         if not site:
             from filebrowser.sites import site as default_site
 
@@ -241,6 +761,8 @@ class FileObject:
         self.filename_lower = self.filename.lower()
         self.filename_root, self.extension = os.path.splitext(self.filename)
         self.mimetype = mimetypes.guess_type(self.filename)
+        if stat:
+            self.__dict__.update(stat)
 
     def __str__(self):
         return force_str(self.path)
@@ -256,26 +778,33 @@ class FileObject:
         return len(self.path)
 
     # HELPER METHODS
+    # _stat_known
+    # _stat_update
     # _get_file_type
 
+    def _stat_known(self, attr):
+        "True, if the value of attr is known without calling site.storage"
+        return attr in self.__dict__
+
+    def _stat_update(self, stat):
+        "Sets the unknown values with stat (see __init__)"
+        for attr, value in stat.items():
+            self.__dict__.setdefault(attr, value)
+
+    def _get_extension_lookup(self):
+        "Lookup tables for filetypes and formats (per site)"
+        lookup = getattr(self.site, "extension_lookup", None)
+        if lookup is None:
+            lookup = get_extension_lookup()
+        return lookup
+
     def _get_file_type(self):
         "Get file type as defined in EXTENSIONS."
-        file_type = ""
-        for k, v in EXTENSIONS.items():
-            for extension in v:
-                if self.extension.lower() == extension.lower():
-                    file_type = k
-        return file_type
+        return self._get_extension_lookup().filetype(self.extension)
 
     def _get_format_type(self):
         "Get format type as defined in SELECT_FORMATS."
-        format_type = []
-        for k, v in SELECT_FORMATS.items():
-            for item in v:
-                for extension in EXTENSIONS.get(item, None):
-                    if self.extension.lower() == extension.lower():
-                        format_type.append(k)
-        return format_type
+        return self._get_extension_lookup().format(self.extension)
 
     # GENERAL ATTRIBUTES/PROPERTIES
     # filetype
@@ -360,11 +889,24 @@ class FileObject:
         "Image dimensions as a tuple"
         if self.filetype != "Image":
             return None
+        cache = get_dimensions_cache()
+        if cache is not None and self.date:
+            dimensions = cache.get(get_dimensions_cache_key(self.path, self.date))
+            if dimensions:
+                return tuple(dimensions)
         try:
-            im = Image.open(self.site.storage.open(self.path))
-            return im.size
-        except:
-            pass
+            with self.site.storage.open(self.path) as f:
+                dimensions = get_image_dimensions(f)
+        except Exception:
+            return None
+        self._dimensions_cache_set(dimensions)
+        return dimensions
+
+    def _dimensions_cache_set(self, dimensions):
+        "Stores the dimensions with DIMENSIONS_CACHE (if available)"
+        cache = get_dimensions_cache()
+        if cache is not None and dimensions and self.date:
+            cache.set(get_dimensions_cache_key(self.path, self.date), dimensions, None)
 
     @property
     def width(self):
@@ -466,6 +1008,8 @@ class FileObject:
     # version_name(suffix)
     # version_path(suffix)
     # version_generate(suffix)
+    # versions_generate(suffixes)
+    # version_manifest_clear()
 
     def _get_options(self, version_suffix, extra_options=None):
         options = dict(VERSIONS.get(version_suffix, {}))
@@ -520,42 +1064,194 @@ class FileObject:
             self.version_name(version_suffix, extra_options),
         )
 
-    def version_generate(self, version_suffix, extra_options=None):
-        "Generate a version"  # FIXME: version_generate for version?
-        path = self.path
+    def version_generate(self, version_suffix, extra_options=None, force=False):
+        "Generate a version (force: even if the version is up to date)"  # FIXME: version_generate for version?
         options = self._get_options(version_suffix, extra_options)
 
         version_path = self.version_path(version_suffix, extra_options)
-        if not self.site.storage.isfile(version_path):
-            version_path = self._generate_version(version_path, version_suffix, options)
-        elif get_modified_time(self.site.storage, path) > get_modified_time(
-            self.site.storage, version_path
-        ):
+        if force or self._version_outdated(version_path):
             version_path = self._generate_version(version_path, version_suffix, options)
+            if version_path:
+                self._version_manifest_update([version_path])
         return FileObject(version_path, site=self.site)
 
+    def versions_generate(self, version_suffixes, force=False):
+        """
+        Generate multiple versions, the image is only opened (and decoded) once.
+        Returns a dict with the FileObject of every version_suffix.
+        """
+        versions = {}
+        pending = {}
+        checked = []
+        modified_time = None
+        manifest = self._version_manifest()
+        for version_suffix in version_suffixes:
+            version_path = self.version_path(version_suffix)
+            if not force and self._version_listed(manifest, version_path):
+                versions[version_suffix] = FileObject(version_path, site=self.site)
+                continue
+            if not force and self.site.storage.isfile(version_path):
+                if modified_time is None:
+                    modified_time = get_modified_time(self.site.storage, self.path)
+                if modified_time <= get_modified_time(self.site.storage, version_path):
+                    versions[version_suffix] = FileObject(version_path, site=self.site)
+                    checked.append(version_path)
+                    continue
+            pending[version_suffix] = version_path
+        if pending:
+            for version_suffix, version_path in self._generate_versions(pending).items():
+                versions[version_suffix] = FileObject(version_path, site=self.site)
+                if version_path:
+                    checked.append(version_path)
+            modified_time = None
+        if checked:
+            self._version_manifest_update(checked, modified_time)
+        return versions
+
+    def _version_outdated(self, version_path):
+        "True, if the version does not exist or is older than the original"
+        if self._version_listed(self._version_manifest(), version_path):
+            return False
+        if not self.site.storage.isfile(version_path):
+            return True
+        modified_time = get_modified_time(self.site.storage, self.path)
+        if modified_time > get_modified_time(self.site.storage, version_path):
+            return True
+        self._version_manifest_update([version_path], modified_time)
+        return False
+
+    # VERSION MANIFEST
+    # The manifest (stored with VERSIONS_CACHE) lists the versions of an
+    # image which are known to be up to date, together with the modification
+    # date of the original image: {version_path: date}.
+
+    def _version_manifest(self):
+        "The version manifest (or None without VERSIONS_CACHE)"
+        cache = get_versions_cache()
+        if cache is None:
+            return None
+        return cache.get(get_versions_cache_key(self.site, self.path), {})
+
+    def _version_listed(self, manifest, version_path):
+        """
+        True, if the version is listed with the manifest (and the date of
+        the original, if already known, did not change).
+        """
+        if not manifest or version_path not in manifest:
+            return False
+        date = self.__dict__.get("date")
+        return date is None or date == manifest[version_path]
+
+    def _version_manifest_update(self, version_paths, modified_time=None):
+        "Add up to date versions to the manifest"
+        cache = get_versions_cache()
+        if cache is None:
+            return
+        if modified_time is None:
+            modified_time = get_modified_time(self.site.storage, self.path)
+        date = time.mktime(modified_time.timetuple())
+        key = get_versions_cache_key(self.site, self.path)
+        manifest = cache.get(key, {})
+        manifest.update(dict.fromkeys(version_paths, date))
+        cache.set(key, manifest, VERSIONS_CACHE_TIMEOUT)
+
+    def version_manifest_clear(self):
+        "Remove the version manifest (e.g. if the original image changed)"
+        cache = get_versions_cache()
+        if cache is not None:
+            cache.delete(get_versions_cache_key(self.site, self.path))
+
+
     def _generate_version(self, version_path, version_suffix, options):
         """
         Generate Version for an Image.
         value has to be a path relative to the storage location.
         """
-
-        tmpfile = File(tempfile.NamedTemporaryFile())
-
         try:
             f = self.site.storage.open(self.path)
         except IOError:
             return ""
-        im = Image.open(f)
+        with f:
+            im = Image.open(f)
+            version = process_image(im, options)
+            if not version:
+                version = im
+            if "methods" in options:
+                for m in options["methods"]:
+                    if callable(m):
+                        version = m(version)
+            return self._save_version(version, version_path, version_suffix)
+
+    def _generate_versions(self, version_paths):
+        """
+        Generate multiple versions ({version_suffix: version_path}) for an Image.
+
+        With the default processors, a JPEG is decoded at a reduced size
+        (PIL draft) if all versions are smaller than the original. Smaller
+        versions are derived from larger (uncropped) versions which are at
+        least twice the size.
+        Returns a dict {version_suffix: version_path}.
+        """
+        try:
+            f = self.site.storage.open(self.path)
+        except IOError:
+            return dict((version_suffix, "") for version_suffix in version_paths)
+        with f:
+            im = Image.open(f)
+            # The image has been opened anyway (e.g. after an upload)
+            self.__dict__["dimensions"] = im.size
+            self._dimensions_cache_set(im.size)
+            options = dict(
+                (version_suffix, self._get_options(version_suffix))
+                for version_suffix in version_paths
+            )
+            derive = uses_default_processors() and not any(
+                "methods" in o for o in options.values()
+            )
+            ratios = dict(
+                (version_suffix, scale_and_crop_ratio(im.size, **o))
+                for version_suffix, o in options.items()
+            )
+            max_ratio = max(ratios.values())
+            if derive and max_ratio < 1.0:
+                im.draft(
+                    im.mode,
+                    (
+                        int(math.ceil(im.size[0] * max_ratio)),
+                        int(math.ceil(im.size[1] * max_ratio)),
+                    ),
+                )
+
+            # (ratio, image) of generated versions which are not cropped
+            sources = []
+            result = {}
+            for version_suffix in sorted(version_paths, key=ratios.get, reverse=True):
+                ratio = ratios[version_suffix]
+                if derive:
+                    source = im
+                    for source_ratio, image in sources:
+                        if source_ratio >= 2 * ratio:
+                            source = image
+                    version = process_image(source, options[version_suffix]) or source
+                    if "crop" not in options[version_suffix].get("opts", ""):
+                        sources.append((ratio, version))
+                else:
+                    # Processors and methods may alter the image
+                    image = im.copy()
+                    version = process_image(image, options[version_suffix]) or image
+                    for m in options[version_suffix].get("methods", []):
+                        if callable(m):
+                            version = m(version)
+                result[version_suffix] = self._save_version(
+                    version, version_paths[version_suffix], version_suffix
+                )
+            return result
+
+    def _save_version(self, version, version_path, version_suffix):
+        "Save the image version with version_path"
+        tmpfile = File(tempfile.NamedTemporaryFile())
         version_dir, version_basename = os.path.split(version_path)
         root, ext = os.path.splitext(version_basename)
-        version = process_image(im, options)
-        if not version:
-            version = im
-        if "methods" in options:
-            for m in options["methods"]:
-                if callable(m):
-                    version = m(version)
 
         # IF need Convert RGB
         if ext in [".jpg", ".jpeg"] and version.mode not in ("L", "RGB"):
@@ -597,19 +1293,209 @@ class FileObject:
             self.site.storage.rmtree(self.path)
         else:
             self.site.storage.delete(self.path)
+            self.version_manifest_clear()
 
     def delete_versions(self):
-        "Delete versions"
-        for version in self.versions():
-            try:
-                self.site.storage.delete(version)
-            except:
-                pass
+        "Delete versions (with a folder, the folder of its versions)"
+        self.version_manifest_clear()
+        if self.is_folder:
+            versions_folder = os.path.join(
+                self.versions_basedir, self.path_relative_directory
+            )
+            # Without VERSIONS_BASEDIR, the versions are within the folder
+            if self.path_relative_directory and (
+                versions_folder.rstrip("/") != self.path.rstrip("/")
+            ):
+                try:
+                    if self.site.storage.isdir(versions_folder):
+                        self.site.storage.rmtree(versions_folder)
+                except OSError:
+                    logger.exception("Error deleting versions of %s", self.path)
+            return
+        self._delete_versions(self.versions())
 
     def delete_admin_versions(self):
         "Delete admin versions"
-        for version in self.admin_versions():
-            try:
-                self.site.storage.delete(version)
-            except:
-                pass
+        self.version_manifest_clear()
+        self._delete_versions(self.admin_versions())
+
+    def _delete_versions(self, version_paths):
+        "Delete versions (versions which could not be deleted are logged)"
+        failed = self.site.storage.delete_many(version_paths)
+        if failed:
+            logger.error(
+                "Error deleting versions of %s: %s", self.path, ", ".join(failed)
+            )
+
+
+def lookup_versions(fileobjects, version_suffix):
+    """
+    Looks up a version for many images at once.
+
+    Instead of checking every single version with site.storage, the version
+    folders are listed once (with the dates of the versions) and the version
+    manifests are read with a single cache query (see VERSIONS_CACHE).
+    Returns a dict {path: version FileObject} with the versions which are up
+    to date and a list of FileObjects with missing (or outdated) versions.
+    Files which are not images are not part of the result.
+    """
+    images = [
+        fileobject
+        for fileobject in fileobjects
+        if fileobject.filetype == "Image" and not fileobject.is_version
+    ]
+    versions = {}
+    missing = []
+
+    cache = get_versions_cache()
+    manifests = {}
+    if cache is not None and images:
+        keys = dict(
+            (get_versions_cache_key(fileobject.site, fileobject.path), fileobject.path)
+            for fileobject in images
+        )
+        for key, manifest in cache.get_many(list(keys)).items():
+            manifests[keys[key]] = manifest
+
+    # Images with versions which are not listed with the manifest,
+    # grouped by version folder
+    pending = {}
+    for fileobject in images:
+        version_path = fileobject.version_path(version_suffix)
+        if fileobject._version_listed(manifests.get(fileobject.path), version_path):
+            versions[fileobject.path] = FileObject(version_path, site=fileobject.site)
+        else:
+            pending.setdefault(
+                (fileobject.site, os.path.dirname(version_path)), []
+            ).append((fileobject, version_path))
+
+    updates = {}
+    for (site, version_dir), items in pending.items():
+        if not hasattr(site.storage, "listdir_with_stats"):
+            # A storage without StorageMixin, every version is checked
+            for fileobject, version_path in items:
+                if fileobject._version_outdated(version_path):
+                    missing.append(fileobject)
+                else:
+                    versions[fileobject.path] = FileObject(version_path, site=site)
+            continue
+        try:
+            stats = dict(site.storage.listdir_with_stats(version_dir))
+        except OSError:
+            stats = {}
+        for fileobject, version_path in items:
+            stat = stats.get(os.path.basename(version_path))
+            if not stat or not stat.get("exists", True) or stat.get("is_folder"):
+                missing.append(fileobject)
+                continue
+            if "date" not in stat:
+                # The storage does not provide dates with listings
+                if fileobject._version_outdated(version_path):
+                    missing.append(fileobject)
+                else:
+                    versions[fileobject.path] = FileObject(version_path, site=site)
+                continue
+            if fileobject.date is None or fileobject.date > stat["date"]:
+                missing.append(fileobject)
+                continue
+            versions[fileobject.path] = FileObject(version_path, site=site, stat=stat)
+            if cache is not None:
+                manifest = dict(manifests.get(fileobject.path) or {})
+                manifest[version_path] = fileobject.date
+                updates[get_versions_cache_key(site, fileobject.path)] = manifest
+    if updates:
+        cache.set_many(updates, VERSIONS_CACHE_TIMEOUT)
+    return versions, missing
+
+
+# Files changed with the FileBrowser invalidate their version manifest
+
+
+@receiver(signals.filebrowser_post_upload, dispatch_uid="filebrowser_versions_upload")
+def version_manifest_upload(sender, file, **kwargs):
+    file.version_manifest_clear()
+
+
+@receiver(signals.filebrowser_post_delete, dispatch_uid="filebrowser_versions_delete")
+def version_manifest_delete(sender, path, site, **kwargs):
+    FileObject(path, site=site).version_manifest_clear()
+
+
+@receiver(signals.filebrowser_post_rename, dispatch_uid="filebrowser_versions_rename")
+def version_manifest_rename(sender, path, new_name, site, **kwargs):
+    FileObject(path, site=site).version_manifest_clear()
+    FileObject(
+        os.path.join(os.path.dirname(path), new_name), site=site
+    ).version_manifest_clear()
+
+
+def version_manifest_clear_path(site, path, is_folder=False):
+    """
+    Removes the version manifest of path. A version is listed with the
+    manifest of its original, so the manifest of the original is removed as
+    well. With a folder within VERSIONS_BASEDIR, the manifests of all images
+    within the original folder are removed.
+    """
+    fileobject = FileObject(path, site=site)
+    if not is_folder:
+        fileobject.version_manifest_clear()
+        if fileobject.is_version and fileobject.original_filename:
+            fileobject.original.version_manifest_clear()
+        return
+    versions_basedir = VERSIONS_BASEDIR.rstrip("/")
+    if not versions_basedir or not (path + "/").startswith(versions_basedir + "/"):
+        return
+    relative_path = path[len(versions_basedir) :].strip("/")
+    folder = FileListing(os.path.join(site.directory, relative_path), site=site)
+    for entry in folder.iter_entries():
+        if not entry.is_folder:
+            FileObject(entry.path, site=site).version_manifest_clear()
+
+
+@receiver(signals.filebrowser_post_change, dispatch_uid="filebrowser_versions_change")
+def version_manifest_change(sender, path, event, is_folder, site, **kwargs):
+    version_manifest_clear_path(site, path, is_folder)
+
+
+# Folders changed with the FileBrowser invalidate their cached listing
+
+
+@receiver(signals.filebrowser_post_upload, dispatch_uid="filebrowser_listing_upload")
+def listing_upload(sender, file, site, **kwargs):
+    listing_changed(site, os.path.dirname(file.path))
+
+
+@receiver(
+    signals.filebrowser_post_createdir, dispatch_uid="filebrowser_listing_createdir"
+)
+def listing_createdir(sender, path, site, **kwargs):
+    listing_changed(site, os.path.dirname(path.rstrip("/")))
+    listing_changed(site, path)
+
+
+@receiver(signals.filebrowser_post_delete, dispatch_uid="filebrowser_listing_delete")
+def listing_delete(sender, path, site, **kwargs):
+    listing_changed(site, os.path.dirname(path.rstrip("/")))
+    listing_changed(site, path)
+
+
+@receiver(signals.filebrowser_post_rename, dispatch_uid="filebrowser_listing_rename")
+def listing_rename(sender, path, new_name, site, **kwargs):
+    listing_changed(site, os.path.dirname(path.rstrip("/")))
+    listing_changed(site, path)
+    listing_changed(site, os.path.join(os.path.dirname(path.rstrip("/")), new_name))
+
+
+@receiver(
+    signals.filebrowser_actions_post_apply, dispatch_uid="filebrowser_listing_actions"
+)
+def listing_actions(sender, site, **kwargs):
+    for fileobject in kwargs.get("fileobject") or []:
+        listing_changed(site, fileobject.head)
+
+
+@receiver(signals.filebrowser_post_change, dispatch_uid="filebrowser_listing_change")
+def listing_change(sender, path, event, is_folder, site, **kwargs):
+    listing_changed(site, os.path.dirname(path))
+    if is_folder:
+        listing_changed(site, path)
@@ -0,0 +1,108 @@
+import os
+import time
+import zipfile
+
+from filebrowser.base import FileListing, FileObject
+from filebrowser.settings import VERSIONS_BASEDIR
+
+# Files of these filetypes are already compressed (e.g. JPEG, MP4, MP3) and
+# are stored without compression
+ZIP_STORED_FILETYPES = ("Image", "Video", "Audio")
+# Number of bytes read from the storage at once
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+class ZipBuffer:
+    """
+    Unseekable file-like object collecting the data written by ZipFile
+    (ZipFile writes data descriptors after the files instead of seeking).
+    """
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        "Returns (and removes) the data written so far"
+        data = b"".join(self.data)
+        self.data = []
+        return data
+
+
+def zip_items(site, path, names=None, filter_filename=None):
+    """
+    Yields (FileEntry, arcname) of the files to download: all files below
+    the folder path or the files named with names within path (with all files
+    below folders). Arcnames are relative to path.
+
+    Files and folders with a filename rejected by filter_filename (see
+    get_filename_filter of filebrowser.sites) and VERSIONS_BASEDIR are left
+    out, so only files shown with the browse view are downloaded.
+    """
+    versions_basedir = VERSIONS_BASEDIR.rstrip("/")
+
+    def filter_item(item):
+        if versions_basedir and item.path.rstrip("/") == versions_basedir:
+            return False
+        return filter_filename is None or filter_filename(item.filename)
+
+    for name in names if names is not None else [None]:
+        item = FileObject(os.path.join(path, name) if name else path, site=site)
+        if not item.exists or (name and not filter_item(item)):
+            continue
+        if not item.is_folder:
+            yield item, name
+            continue
+        entries = FileListing(item.path, site=site).iter_entries(
+            filter_folder=filter_item
+        )
+        for entry in entries:
+            if not entry.is_folder and filter_item(entry):
+                yield entry, os.path.relpath(entry.path, path)
+
+
+def zip_info(item, arcname):
+    "ZipInfo of a file (stored or deflated, depending on its filetype)"
+    date = item.date or time.time()
+    info = zipfile.ZipInfo(
+        arcname.replace(os.sep, "/"),
+        date_time=max(time.localtime(date)[:6], (1980, 1, 1, 0, 0, 0)),
+    )
+    if item.filetype in ZIP_STORED_FILETYPES:
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    # Decides whether ZIP64 extensions are used for the file
+    info.file_size = item.filesize or 0
+    return info
+
+
+def iter_zip(site, items):
+    """
+    Yields a ZIP archive of items ((FileEntry, arcname), see zip_items) in
+    pieces, while the archive is being built. Files are read in chunks of
+    ZIP_CHUNK_SIZE, so the memory used does not depend on the size of the
+    archive.
+    """
+    buffer = ZipBuffer()
+    with zipfile.ZipFile(buffer, "w", allowZip64=True) as archive:
+        for item, arcname in items:
+            try:
+                f = site.storage.open(item.path)
+            except OSError:
+                # e.g. deleted in the meantime
+                continue
+            with f, archive.open(zip_info(item, arcname), "w") as dest:
+                for chunk in f.chunks(ZIP_CHUNK_SIZE):
+                    dest.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            yield buffer.pop()
+    yield buffer.pop()
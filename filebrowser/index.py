@@ -0,0 +1,474 @@
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from filebrowser import signals
+from filebrowser.base import FileListing, FileObject
+from filebrowser.settings import METADATA_INDEX, METADATA_INDEX_LOCATION
+from filebrowser.utils import SQLiteDatabase
+
+
+def get_metadata_index(site):
+    """
+    Returns the metadata index for a site as defined with METADATA_INDEX
+    (or None, if no index is being used).
+    """
+    if not METADATA_INDEX:
+        return None
+    return import_string(METADATA_INDEX)(site)
+
+
+def normalize_path(path):
+    "Path as stored with the index (no trailing slash, forward slashes)"
+    return path.replace("\\", "/").rstrip("/")
+
+
+class MetadataIndex:
+    """
+    A persistent index with metadata of the files and folders of a site.
+
+    The index stores path, is_folder, filesize, date, filetype and dimensions.
+    Listings read from the index instead of calling site.storage for every
+    single file. A folder is considered to be indexed if the folder itself
+    is part of the index (e.g. after rebuild() or createdir).
+    """
+
+    def __init__(self, site):
+        self.site = site
+
+    def is_indexed(self, path):
+        """
+        True, if the folder path is part of the index.
+        """
+        raise NotImplementedError()
+
+    def get(self, path):
+        """
+        Returns the FileObject for path (or None, if path is not indexed).
+        """
+        raise NotImplementedError()
+
+    def listdir(self, path):
+        """
+        Returns FileObjects for all items within the folder path
+        (or None, if the folder is not indexed).
+        """
+        raise NotImplementedError()
+
+    def walk(self, path):
+        """
+        Returns FileObjects for all items below the folder path
+        (or None, if the folder is not indexed).
+        """
+        raise NotImplementedError()
+
+    def query(
+        self,
+        path,
+        traverse=False,
+        filter_func=None,
+        filetypes=None,
+        date_func=None,
+        search_func=None,
+        sorting_by=None,
+        sorting_order=None,
+        folders_first=False,
+    ):
+        """
+        Returns a lazy, sliceable result (with count()) for the items within
+        the folder path (or below path with traverse), e.g. for a Paginator.
+        Only the requested slice is turned into FileObjects.
+
+        filter_func is called with the filename and excludes items from the
+        result altogether. filetypes, date_func (called with the date) and
+        search_func (called with the filename) only apply to files, folders
+        are always part of the result.
+
+        With folders_first, folders are sorted before files (regardless of
+        sorting_order).
+
+        Returns None if the folder is not indexed or if the sorting can not
+        be done with the index.
+        """
+        raise NotImplementedError()
+
+    def store(self, fileobjects):
+        """
+        Adds (or replaces) the given FileObjects with the index.
+        """
+        raise NotImplementedError()
+
+    def remove(self, path):
+        """
+        Removes path (and everything below path) from the index.
+        """
+        raise NotImplementedError()
+
+    def clear(self):
+        """
+        Removes all items of the site from the index.
+        """
+        raise NotImplementedError()
+
+    def update(self, path):
+        """
+        Reads the metadata of path from site.storage and updates the index.
+        """
+        fileobject = FileObject(path, site=self.site)
+        if not fileobject.exists:
+            self.remove(path)
+        elif fileobject.is_folder:
+            self.rebuild(path)
+        else:
+            self.store([fileobject])
+
+    def rebuild(self, path=None):
+        """
+        Removes path from the index and indexes everything below path again
+        (defaults to site.directory). Returns the number of indexed items.
+        """
+        if path is None:
+            path = self.site.directory
+        self.remove(path)
+        filelisting = FileListing(normalize_path(path), site=self.site)
+        if not filelisting.is_folder:
+            return 0
+        count = 0
+        fileobjects = [FileObject(normalize_path(path), site=self.site)]
+        # iter_walk is protected against symbolic link cycles
+        for fileobject in filelisting.iter_walk():
+            fileobjects.append(fileobject)
+            if len(fileobjects) >= 1000:
+                self.store(fileobjects)
+                count += len(fileobjects)
+                fileobjects = []
+        self.store(fileobjects)
+        return count + len(fileobjects)
+
+
+class SQLiteQuery:
+    """
+    Lazy result of SQLiteMetadataIndex.query().
+    """
+
+    def __init__(self, index, where, params, order, functions):
+        self.index = index
+        self.where = where
+        self.params = params
+        self.order = order
+        self.functions = functions
+        self._count = None
+
+    def _execute(self, sql, params):
+        connection = self.index.connection
+        for name, func in self.functions.items():
+            connection.create_function(name, 1, func)
+        return connection.execute(sql, params)
+
+    def count(self):
+        if self._count is None:
+            sql = "SELECT COUNT(*) FROM filebrowser_index WHERE %s" % self.where
+            self._count = self._execute(sql, self.params).fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            if key < 0:
+                key += self.count()
+            items = self[key : key + 1]
+            if not items:
+                raise IndexError(key)
+            return items[0]
+        start, stop, step = key.indices(self.count())
+        if stop <= start:
+            return []
+        sql = "SELECT %s FROM filebrowser_index WHERE %s ORDER BY %s LIMIT ? OFFSET ?" % (
+            ", ".join(self.index.columns),
+            self.where,
+            self.order,
+        )
+        cursor = self._execute(sql, self.params + [stop - start, start])
+        return [self.index._fileobject(row) for row in cursor][::step]
+
+
+class SQLiteMetadataIndex(MetadataIndex):
+    """
+    Metadata index stored with a local SQLite database
+    (see METADATA_INDEX_LOCATION).
+    """
+
+    columns = (
+        "path",
+        "parent",
+        "filename",
+        "is_folder",
+        "filesize",
+        "date",
+        "filetype",
+        "width",
+        "height",
+    )
+
+    def __init__(self, site, location=None):
+        super().__init__(site)
+        self.location = location or METADATA_INDEX_LOCATION
+        if not self.location:
+            raise ImproperlyConfigured(
+                "FILEBROWSER_METADATA_INDEX_LOCATION is required with SQLiteMetadataIndex."
+            )
+        self.database = SQLiteDatabase(
+            self.location,
+            [
+                "CREATE TABLE IF NOT EXISTS filebrowser_index ("
+                "site TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "parent TEXT NOT NULL, "
+                "filename TEXT NOT NULL, "
+                "is_folder INTEGER NOT NULL, "
+                "filesize INTEGER, "
+                "date REAL, "
+                "filetype TEXT NOT NULL, "
+                "width INTEGER, "
+                "height INTEGER, "
+                "PRIMARY KEY (site, path))",
+                "CREATE INDEX IF NOT EXISTS filebrowser_index_parent "
+                "ON filebrowser_index (site, parent)",
+            ],
+        )
+
+    @property
+    def namespace(self):
+        "Items are stored per site (sites may share a database)"
+        return self.site.name or ""
+
+    @property
+    def connection(self):
+        return self.database.connection
+
+    def _fileobject(self, row):
+        "FileObject with lazy attributes pre-filled from a database row"
+        item = dict(zip(self.columns, row))
+        dimensions = None
+        if item["width"] is not None and item["height"] is not None:
+            dimensions = (item["width"], item["height"])
+        return FileObject(
+            item["path"],
+            site=self.site,
+            stat={
+                "exists": True,
+                "is_folder": bool(item["is_folder"]),
+                "filesize": item["filesize"],
+                "date": item["date"],
+                "filetype": item["filetype"],
+                "dimensions": dimensions,
+            },
+        )
+
+    def _select(self, where, params, order="path"):
+        sql = "SELECT %s FROM filebrowser_index WHERE site = ? AND %s ORDER BY %s" % (
+            ", ".join(self.columns),
+            where,
+            order,
+        )
+        cursor = self.connection.execute(sql, [self.namespace] + list(params))
+        return [self._fileobject(row) for row in cursor]
+
+    def is_indexed(self, path):
+        "True, if the folder path is part of the index"
+        row = self.connection.execute(
+            "SELECT is_folder FROM filebrowser_index WHERE site = ? AND path = ?",
+            (self.namespace, normalize_path(path)),
+        ).fetchone()
+        return bool(row and row[0])
+
+    def get(self, path):
+        items = self._select("path = ?", [normalize_path(path)])
+        return items[0] if items else None
+
+    def listdir(self, path):
+        if not self.is_indexed(path):
+            return None
+        return self._select("parent = ?", [normalize_path(path)], order="filename")
+
+    def walk(self, path):
+        if not self.is_indexed(path):
+            return None
+        prefix = normalize_path(path) + "/"
+        return self._select("substr(path, 1, ?) = ?", [len(prefix), prefix])
+
+    # FileObject attributes which can be used for sorting with the index
+    sorting_columns = {
+        "date": "date",
+        "filesize": "filesize",
+        "filename": "filename",
+        "filename_lower": "lower(filename)",
+        "filetype": "filetype",
+        "folder": "parent",
+        "dirname": "parent",
+        "path": "path",
+    }
+
+    def query(
+        self,
+        path,
+        traverse=False,
+        filter_func=None,
+        filetypes=None,
+        date_func=None,
+        search_func=None,
+        sorting_by=None,
+        sorting_order=None,
+        folders_first=False,
+    ):
+        if not self.is_indexed(path):
+            return None
+
+        if not sorting_by:
+            sorting_by = ("filename",)
+        elif isinstance(sorting_by, str):
+            sorting_by = (sorting_by,)
+        if any(attr not in self.sorting_columns for attr in sorting_by):
+            return None
+        direction = " DESC" if sorting_order == "desc" else ""
+        # NULL values (e.g. the filesize of folders) are sorted last (first
+        # in reverse order), as with FileListing.sort_files()
+        order = ", ".join(
+            "%s IS NULL%s, %s%s"
+            % (self.sorting_columns[attr], direction, self.sorting_columns[attr], direction)
+            for attr in tuple(sorting_by) + ("filename",)
+        )
+        if folders_first:
+            order = "is_folder DESC, " + order
+
+        path = normalize_path(path)
+        if traverse:
+            prefix = path + "/"
+            where = ["site = ?", "substr(path, 1, ?) = ?"]
+            params = [self.namespace, len(prefix), prefix]
+        else:
+            where = ["site = ?", "parent = ?"]
+            params = [self.namespace, path]
+        functions = {}
+        if filter_func:
+            functions["fb_filter"] = lambda value: bool(filter_func(value))
+            where.append("fb_filter(filename)")
+
+        conditions = []
+        if filetypes is not None:
+            filetypes = list(filetypes)
+            if filetypes:
+                conditions.append(
+                    "filetype IN (%s)" % ", ".join("?" for filetype in filetypes)
+                )
+                params.extend(filetypes)
+            else:
+                conditions.append("0")
+        if date_func:
+            functions["fb_date"] = lambda value: bool(date_func(value))
+            conditions.append("fb_date(date)")
+        if search_func:
+            functions["fb_search"] = lambda value: bool(search_func(value))
+            conditions.append("fb_search(filename)")
+        if conditions:
+            # Folders are always part of the result
+            where.append("(is_folder = 1 OR (%s))" % " AND ".join(conditions))
+
+        return SQLiteQuery(self, " AND ".join(where), params, order, functions)
+
+    def store(self, fileobjects):
+        rows = []
+        for fileobject in fileobjects:
+            path = normalize_path(fileobject.path)
+            dimensions = fileobject.dimensions or (None, None)
+            rows.append(
+                (
+                    self.namespace,
+                    path,
+                    os.path.dirname(path),
+                    os.path.basename(path),
+                    int(fileobject.is_folder),
+                    fileobject.filesize,
+                    fileobject.date,
+                    fileobject.filetype,
+                    dimensions[0],
+                    dimensions[1],
+                )
+            )
+        with self.connection as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO filebrowser_index (site, %s) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)" % ", ".join(self.columns),
+                rows,
+            )
+
+    def remove(self, path):
+        path = normalize_path(path)
+        prefix = path + "/"
+        with self.connection as connection:
+            connection.execute(
+                "DELETE FROM filebrowser_index WHERE site = ? "
+                "AND (path = ? OR substr(path, 1, ?) = ?)",
+                (self.namespace, path, len(prefix), prefix),
+            )
+
+    def clear(self):
+        with self.connection as connection:
+            connection.execute(
+                "DELETE FROM filebrowser_index WHERE site = ?", (self.namespace,)
+            )
+
+
+# Keep the index up to date with changes made with the FileBrowser
+
+
+@receiver(signals.filebrowser_post_upload, dispatch_uid="filebrowser_index_upload")
+def index_upload(sender, file, site, **kwargs):
+    if getattr(site, "index", None) is not None:
+        site.index.update(file.path)
+
+
+@receiver(
+    signals.filebrowser_post_createdir, dispatch_uid="filebrowser_index_createdir"
+)
+def index_createdir(sender, path, site, **kwargs):
+    if getattr(site, "index", None) is not None:
+        site.index.update(path)
+
+
+@receiver(signals.filebrowser_post_delete, dispatch_uid="filebrowser_index_delete")
+def index_delete(sender, path, site, **kwargs):
+    if getattr(site, "index", None) is not None:
+        site.index.remove(path)
+
+
+@receiver(signals.filebrowser_post_rename, dispatch_uid="filebrowser_index_rename")
+def index_rename(sender, path, new_name, site, **kwargs):
+    if getattr(site, "index", None) is not None:
+        site.index.remove(path)
+        site.index.update(os.path.join(os.path.dirname(path), new_name))
+
+
+@receiver(
+    signals.filebrowser_actions_post_apply, dispatch_uid="filebrowser_index_actions"
+)
+def index_actions(sender, site, **kwargs):
+    if getattr(site, "index", None) is not None:
+        for fileobject in kwargs.get("fileobject") or []:
+            site.index.update(fileobject.path)
+
+
+@receiver(signals.filebrowser_post_change, dispatch_uid="filebrowser_index_change")
+def index_change(sender, path, event, site, **kwargs):
+    if getattr(site, "index", None) is not None:
+        if event == "deleted":
+            site.index.remove(path)
+        else:
+            site.index.update(path)
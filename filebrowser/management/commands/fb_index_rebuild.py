@@ -0,0 +1,39 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from filebrowser.sites import site
+
+
+class Command(BaseCommand):
+    help = "(Re)Build the metadata index and the search index (see FILEBROWSER_METADATA_INDEX and FILEBROWSER_SEARCH_INDEX)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "media_path",
+            nargs="?",
+            default="",
+            help="Folder to (re)index, relative to DIRECTORY.",
+        )
+
+    def handle(self, *args, **options):
+        if site.index is None and site.search_index is None:
+            raise CommandError(
+                "No index defined. Please set FILEBROWSER_METADATA_INDEX "
+                "and/or FILEBROWSER_SEARCH_INDEX."
+            )
+
+        path = os.path.join(site.directory, options["media_path"])
+        if not site.storage.isdir(path):
+            raise CommandError(
+                '<media_path> must be a directory in DIRECTORY.\n"%s" is no directory.'
+                % path
+            )
+
+        if site.index is not None:
+            count = site.index.rebuild(path)
+            self.stdout.write("%d item(s) indexed in %s\n" % (count, path))
+        if site.search_index is not None:
+            count = site.search_index.rebuild(path)
+            self.stdout.write(
+                "%d item(s) indexed for searching in %s\n" % (count, path)
+            )
@@ -1,9 +1,12 @@
+import datetime
 import os
 import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from filebrowser.base import FileListing
+from filebrowser.base import FileListing, FileObject
 from filebrowser.settings import DIRECTORY, EXCLUDE, EXTENSION_LIST, VERSIONS
 
 filter_re = []
@@ -14,20 +17,58 @@ for k, v in VERSIONS.items():
     filter_re.append(re.compile(exp))
 
 
+def init_worker():
+    "Set up Django within a worker process"
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def generate_versions(path, versions, force=False):
+    """
+    Generate versions for the image path (runs within a worker process).
+    Returns the number of generated versions.
+    """
+    fileobject = FileObject(path)
+    fileobject.versions_generate(versions, force=force)
+    return len(versions)
+
+
 class Command(BaseCommand):
     help = "(Re)Generate image versions."
 
+    # Progress is reported after this number of images
+    progress_every = 100
+
     def add_arguments(self, parser):
-        parser.add_argument("media_path", nargs=1)
+        parser.add_argument("media_path", nargs="?", default=DIRECTORY)
+        parser.add_argument(
+            "--versions",
+            help="Comma separated list of versions to generate (default: ask).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes (default: 1).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Generate versions even if they are up to date.",
+        )
+        parser.add_argument(
+            "--noinput",
+            "--no-input",
+            action="store_false",
+            dest="interactive",
+            help="Do not prompt for a version, generate all versions instead.",
+        )
 
     def handle(self, *args, **options):
-        media_path = ""
-
-        if len(args):
-            media_path = args[0]
-            path = media_path
-        else:
-            path = DIRECTORY
+        path = options["media_path"]
 
         if not os.path.isdir(os.path.join(settings.MEDIA_ROOT, path)):
             raise CommandError(
@@ -35,7 +76,66 @@ class Command(BaseCommand):
                 % path
             )
 
-        # get version name
+        if options["versions"]:
+            versions = [v.strip() for v in options["versions"].split(",") if v.strip()]
+            for version in versions:
+                if version not in VERSIONS:
+                    raise CommandError('Version "%s" doesn\'t exist.' % version)
+        elif options["interactive"]:
+            versions = self.select_versions()
+        else:
+            versions = list(VERSIONS)
+
+        workers = max(options["workers"], 1)
+        force = options["force"]
+
+        # The images are counted in advance (walking the directory without
+        # creating FileObjects) in order to report the remaining time
+        self.total = self.count_images(path)
+        start = time.time()
+        images = 0
+        failed = 0
+        if workers == 1:
+            for fileobject in self.walk_images(path):
+                try:
+                    generate_versions(fileobject.path, versions, force)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write("Error with %s: %s\n" % (fileobject.path, e))
+                images += 1
+                self.report(images, versions, start)
+        else:
+            # The images are submitted while walking the directory, with a
+            # limited number of pending tasks
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker
+            ) as executor:
+                pending = {}
+                for fileobject in self.walk_images(path):
+                    if len(pending) >= workers * 4:
+                        images, failed = self.collect(pending, images, failed, versions, start)
+                    future = executor.submit(
+                        generate_versions, fileobject.path, versions, force
+                    )
+                    pending[future] = fileobject.path
+                while pending:
+                    images, failed = self.collect(pending, images, failed, versions, start)
+
+        elapsed = time.time() - start
+        self.stdout.write(
+            "\n%d image(s), %d version(s) in %.1fs (%.1f images/s, %.1f versions/s), %d error(s)\n"
+            % (
+                images,
+                (images - failed) * len(versions),
+                elapsed,
+                images / elapsed if elapsed else 0,
+                (images - failed) * len(versions) / elapsed if elapsed else 0,
+                failed,
+            )
+        )
+
+    def select_versions(self):
+        "Ask for the version to generate"
         while 1:
             self.stdout.write("\nSelect a version you want to generate:\n")
             for version in VERSIONS:
@@ -44,61 +144,66 @@ class Command(BaseCommand):
             version_name = input("(leave blank to generate all versions): ")
 
             if version_name == "":
-                selected_version = None
-                break
-            else:
-                try:
-                    tmp = VERSIONS[version_name]
-                    selected_version = version_name
-                    break
-                except:
-                    self.stderr.write(
-                        'Error: Version "%s" doesn\'t exist.\n' % version_name
-                    )
-                    version_name = None
-                    continue
-
-        # filelisting
-        filelisting = FileListing(
-            path, filter_func=self.filter_images
-        )  # FIXME filterfunc: no hidden files, exclude list, no versions, just images!
-        for fileobject in filelisting.files_walk_filtered():
-            if fileobject.filetype == "Image":
-                if selected_version:
-                    self.stdout.write(
-                        'generating version "%s" for: %s\n'
-                        % (selected_version, fileobject.path)
-                    )
-                    versionobject = fileobject.version_generate(
-                        selected_version
-                    )  # FIXME force?
-                else:
-                    self.stdout.write(
-                        "generating all versions for: %s\n" % fileobject.path
-                    )
-                    for version in VERSIONS:
-                        versionobject = fileobject.version_generate(
-                            version
-                        )  # FIXME force?
-
-        # # walkt throu the filebrowser directory
-        # # for all/new files (except file versions itself and excludes)
-        # for dirpath,dirnames,filenames in os.walk(path, followlinks=True):
-        #     rel_dir = os.path.relpath(dirpath, os.path.realpath(settings.MEDIA_ROOT))
-        #     for filename in filenames:
-        #         filtered = False
-        #         # no "hidden" files (stating with ".")
-        #         if filename.startswith('.'):
-        #             continue
-        #         # check the exclude list
-        #         for re_prefix in filter_re:
-        #             if re_prefix.search(filename):
-        #                 filtered = True
-        #         if filtered:
-        #             continue
-        #         (tmp, extension) = os.path.splitext(filename)
-        #         if extension in EXTENSIONS["Image"]:
-        #             self.createVersions(os.path.join(rel_dir, filename), selected_version)
+                return list(VERSIONS)
+            if version_name in VERSIONS:
+                return [version_name]
+            self.stderr.write('Error: Version "%s" doesn\'t exist.\n' % version_name)
+
+    def collect(self, pending, images, failed, versions, start):
+        "Wait for (at least) one pending task"
+        done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            path = pending.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                self.stderr.write("Error with %s: %s\n" % (path, e))
+            images += 1
+            self.report(images, versions, start)
+        return images, failed
+
+    def report(self, images, versions, start):
+        "Write the progress"
+        if images % self.progress_every:
+            return
+        elapsed = time.time() - start
+        rate = images / elapsed if elapsed else 0
+        remaining = max(self.total - images, 0) / rate if rate else 0
+        self.stdout.write(
+            "%d/%d image(s) processed (%.1f images/s, ETA %s)\n"
+            % (
+                images,
+                self.total,
+                rate,
+                datetime.timedelta(seconds=round(remaining)),
+            )
+        )
+
+    def count_images(self, path):
+        "Number of images below path (see walk_images)"
+        from filebrowser.sites import site
+
+        return sum(
+            1
+            for entry in FileListing(path, site=site).iter_entries(
+                filter_folder=self.filter_images
+            )
+            if entry.filetype == "Image" and self.filter_images(entry)
+        )
+
+    def walk_images(self, path):
+        "Yields the FileObjects of all images below path"
+        for fileobject in self.walk(path):
+            if fileobject.filetype == "Image" and self.filter_images(fileobject):
+                self.stdout.write("generating versions for: %s\n" % fileobject.path)
+                yield fileobject
+
+    def walk(self, path):
+        "Yields FileObjects below path (while walking the directory)"
+        from filebrowser.sites import site
+
+        return FileListing(path, site=site).iter_walk(filter_folder=self.filter_images)
 
     def filter_images(self, item):
         filtered = item.filename.startswith(".")
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from filebrowser.queues import get_version_queue
+
+
+class Command(BaseCommand):
+    help = "Generate the versions queued with FILEBROWSER_VERSION_QUEUE."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process all pending jobs and exit (instead of waiting for new jobs).",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=100,
+            help="Number of jobs claimed at once (default: 100).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait if the queue is empty (default: 1).",
+        )
+
+    def handle(self, *args, **options):
+        queue = get_version_queue()
+        if queue is None or not hasattr(queue, "process"):
+            raise CommandError(
+                "No version queue with jobs to process. Please set FILEBROWSER_VERSION_QUEUE "
+                "(e.g. filebrowser.queues.SQLiteVersionQueue)."
+            )
+
+        batch = max(options["batch"], 1)
+        total = 0
+        try:
+            while True:
+                count = queue.process(batch)
+                if count:
+                    total += count
+                    self.stdout.write("%d job(s) processed\n" % count)
+                elif options["once"]:
+                    break
+                else:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("%d job(s) processed in total\n" % total)
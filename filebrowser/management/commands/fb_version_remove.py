@@ -4,7 +4,9 @@ import sys
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from filebrowser.base import version_manifest_clear_path
 from filebrowser.settings import EXCLUDE, EXTENSIONS
+from filebrowser.sites import site
 
 
 class Command(BaseCommand):
@@ -95,6 +97,10 @@ class Command(BaseCommand):
         if do_remove == "y":
             for current_file in files:
                 os.remove(current_file)
+                # The removed version is no longer up to date (see VERSIONS_CACHE)
+                version_manifest_clear_path(
+                    site, os.path.relpath(current_file, settings.MEDIA_ROOT)
+                )
             self.stdout.write("%d file(s) removed.\n\n" % len(files))
         else:
             self.stdout.write("No files removed.\n\n")
@@ -113,7 +119,14 @@ class Command(BaseCommand):
 
         # walkt throu the filebrowser directory
         # for all/new files (except file versions itself and excludes)
+        # every folder is walked once (symbolic links may create cycles)
+        visited = set()
         for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+            st = os.stat(dirpath)
+            if (st.st_dev, st.st_ino) in visited:
+                dirnames[:] = []
+                continue
+            visited.add((st.st_dev, st.st_ino))
             for filename in filenames:
                 filtered = False
                 # no "hidden" files (stating with ".")
@@ -0,0 +1,78 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from filebrowser.settings import VERSIONS_BASEDIR
+from filebrowser.sites import site
+from filebrowser.watchers import PollingWatcher, VersionsWatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Watch DIRECTORY (and VERSIONS_BASEDIR) for changes made outside of the "
+        "FileBrowser and update the metadata index, the search index and the "
+        "versions cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "media_path",
+            nargs="?",
+            default="",
+            help="Folder to watch, relative to DIRECTORY.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds between two polls (default: 2).",
+        )
+        parser.add_argument(
+            "--full-every",
+            type=int,
+            default=30,
+            help="List all folders with every nth poll in order to detect files "
+            "changed in place (default: 30, 0 disables full polls).",
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.join(site.directory, options["media_path"])
+        try:
+            site.storage.path(path)
+        except NotImplementedError:
+            raise CommandError("fb_watch requires a storage with local paths.")
+        if not site.storage.isdir(path):
+            raise CommandError(
+                '<media_path> must be a directory in DIRECTORY.\n"%s" is no directory.'
+                % path
+            )
+
+        watchers = [(path, PollingWatcher(site, path))]
+        # Versions are watched separately, unless they are within path
+        versions_path = VERSIONS_BASEDIR.rstrip("/")
+        watched_path = path.rstrip("/")
+        if (
+            versions_path
+            and watched_path
+            and not (versions_path + "/").startswith(watched_path + "/")
+            and site.storage.isdir(versions_path)
+        ):
+            watchers.append((VERSIONS_BASEDIR, VersionsWatcher(site, versions_path)))
+        for watched, watcher in watchers:
+            watcher.start()
+            self.stdout.write(
+                "Watching %s (%d folder(s))\n" % (watched, len(watcher.folders))
+            )
+        polls = 0
+        try:
+            while True:
+                time.sleep(options["interval"])
+                polls += 1
+                full = bool(options["full_every"]) and polls % options["full_every"] == 0
+                for watched, watcher in watchers:
+                    changes = watcher.poll(full=full)
+                    watcher.notify(changes)
+                    for event, item_path, is_folder in changes:
+                        self.stdout.write("%s %s\n" % (event, item_path))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,273 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from filebrowser import signals
+from filebrowser.base import FileObject
+from filebrowser.settings import (
+    PLACEHOLDER,
+    UPLOAD_VERSIONS,
+    VERSION_QUEUE,
+    VERSION_QUEUE_LOCATION,
+    VERSION_QUEUE_PLACEHOLDER,
+    VERSION_QUEUE_WORKERS,
+)
+from filebrowser.utils import SQLiteDatabase
+
+logger = logging.getLogger("filebrowser")
+
+_version_queue = None
+_version_queue_lock = threading.Lock()
+_upload_queue = None
+
+
+def get_version_queue():
+    """
+    Returns the version queue as defined with VERSION_QUEUE
+    (or None, if versions are generated synchronously).
+    """
+    global _version_queue
+    if not VERSION_QUEUE:
+        return None
+    with _version_queue_lock:
+        if _version_queue is None:
+            _version_queue = import_string(VERSION_QUEUE)()
+    return _version_queue
+
+
+def get_upload_queue():
+    """
+    Returns the queue for generating UPLOAD_VERSIONS: the version queue
+    (see VERSION_QUEUE) or a ThreadPoolVersionQueue.
+    """
+    global _upload_queue
+    queue = get_version_queue()
+    if queue is not None:
+        return queue
+    with _version_queue_lock:
+        if _upload_queue is None:
+            _upload_queue = ThreadPoolVersionQueue()
+    return _upload_queue
+
+
+def get_site(app_name, name):
+    "The (instantiated) FileBrowser site with app_name and name"
+    from filebrowser.sites import _sites_cache, site
+
+    return _sites_cache.get(app_name, {}).get(name, site)
+
+
+class VersionQueue:
+    """
+    Generates missing versions outside of the request/response cycle.
+
+    version() is used by the version templatetag: an up to date version is
+    returned right away, otherwise the version is queued and a replacement
+    (the version of PLACEHOLDER or the original image) is returned.
+    """
+
+    def version(self, fileobject, version_suffix):
+        """
+        Returns the FileObject of the version (if it is up to date) or a
+        replacement while the version is being generated.
+        """
+        version_path = fileobject.version_path(version_suffix)
+        if not fileobject._version_outdated(version_path):
+            return FileObject(version_path, site=fileobject.site)
+        self.enqueue(fileobject, version_suffix)
+        return self.replacement(fileobject, version_suffix)
+
+    def replacement(self, fileobject, version_suffix):
+        "FileObject used while the version is pending"
+        if VERSION_QUEUE_PLACEHOLDER and PLACEHOLDER and fileobject.path != PLACEHOLDER:
+            placeholder = FileObject(PLACEHOLDER, site=fileobject.site)
+            if placeholder.exists:
+                return placeholder.version_generate(version_suffix)
+        return fileobject
+
+    def enqueue(self, fileobject, version_suffix):
+        """
+        Adds a job for generating the version (jobs for the same version
+        which are already pending are ignored).
+        """
+        raise NotImplementedError()
+
+    def enqueue_versions(self, fileobject, version_suffixes):
+        "Adds jobs for generating multiple versions of an image"
+        for version_suffix in version_suffixes:
+            self.enqueue(fileobject, version_suffix)
+
+
+class ThreadPoolVersionQueue(VersionQueue):
+    """
+    Generates versions with a pool of threads within the current process
+    (see VERSION_QUEUE_WORKERS). Pending jobs are lost with a restart.
+    """
+
+    def __init__(self, workers=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or VERSION_QUEUE_WORKERS,
+            thread_name_prefix="filebrowser-versions",
+        )
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def enqueue(self, fileobject, version_suffix):
+        job = (fileobject.site.app_name, fileobject.site.name, fileobject.path, version_suffix)
+        with self.lock:
+            if job in self.pending:
+                return
+            self.pending.add(job)
+        return self.executor.submit(self.run, fileobject, version_suffix, job)
+
+    def enqueue_versions(self, fileobject, version_suffixes):
+        # A single job, the image is only decoded once (see versions_generate)
+        jobs = {}
+        with self.lock:
+            for version_suffix in version_suffixes:
+                job = (fileobject.site.app_name, fileobject.site.name, fileobject.path, version_suffix)
+                if job not in self.pending:
+                    self.pending.add(job)
+                    jobs[version_suffix] = job
+        if jobs:
+            return self.executor.submit(self.run_versions, fileobject, jobs)
+
+    def run_versions(self, fileobject, jobs):
+        try:
+            fileobject.versions_generate(list(jobs))
+        except Exception:
+            logger.exception(
+                "Error generating versions %s for %s", ", ".join(jobs), fileobject.path
+            )
+        finally:
+            with self.lock:
+                self.pending.difference_update(jobs.values())
+
+    def run(self, fileobject, version_suffix, job):
+        try:
+            fileobject.version_generate(version_suffix)
+        except Exception:
+            logger.exception(
+                "Error generating version %s for %s", version_suffix, fileobject.path
+            )
+        finally:
+            with self.lock:
+                self.pending.discard(job)
+
+
+class SQLiteVersionQueue(VersionQueue):
+    """
+    Stores jobs with a local SQLite database (see VERSION_QUEUE_LOCATION).
+    The jobs are processed with the management command fb_version_queue.
+    """
+
+    def __init__(self, location=None):
+        self.location = location or VERSION_QUEUE_LOCATION
+        if not self.location:
+            raise ImproperlyConfigured(
+                "FILEBROWSER_VERSION_QUEUE_LOCATION is required with SQLiteVersionQueue."
+            )
+        # Autocommit, transactions are started explicitly (see claim)
+        self.database = SQLiteDatabase(
+            self.location,
+            [
+                "CREATE TABLE IF NOT EXISTS filebrowser_version_queue ("
+                "app_name TEXT NOT NULL, "
+                "site TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "version_suffix TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "PRIMARY KEY (app_name, site, path, version_suffix))",
+            ],
+            isolation_level=None,
+        )
+
+    @property
+    def connection(self):
+        return self.database.connection
+
+    def enqueue(self, fileobject, version_suffix):
+        self.connection.execute(
+            "INSERT OR IGNORE INTO filebrowser_version_queue "
+            "(app_name, site, path, version_suffix, created) VALUES (?, ?, ?, ?, ?)",
+            (
+                fileobject.site.app_name,
+                fileobject.site.name or "",
+                fileobject.path,
+                version_suffix,
+                time.time(),
+            ),
+        )
+
+    def count(self):
+        "Number of pending jobs"
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM filebrowser_version_queue"
+        ).fetchone()[0]
+
+    def claim(self, limit):
+        """
+        Removes (up to limit) jobs from the queue and returns them,
+        grouped by image: {(app_name, site, path): [version_suffix, ...]}.
+        """
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT rowid, app_name, site, path, version_suffix "
+                "FROM filebrowser_version_queue ORDER BY created LIMIT ?",
+                (limit,),
+            ).fetchall()
+            connection.executemany(
+                "DELETE FROM filebrowser_version_queue WHERE rowid = ?",
+                [(row[0],) for row in rows],
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        jobs = {}
+        for rowid, app_name, site, path, version_suffix in rows:
+            jobs.setdefault((app_name, site, path), []).append(version_suffix)
+        return jobs
+
+    def process(self, limit=100):
+        """
+        Generates the versions of (up to limit) pending jobs.
+        Returns the number of processed jobs.
+
+        Jobs are removed from the queue before the versions are generated.
+        A failed job is not retried, the version is queued again with the
+        next request.
+        """
+        count = 0
+        for (app_name, site_name, path), version_suffixes in self.claim(limit).items():
+            fileobject = FileObject(path, site=get_site(app_name, site_name or None))
+            try:
+                fileobject.versions_generate(version_suffixes)
+            except Exception:
+                logger.exception(
+                    "Error generating versions %s for %s",
+                    ", ".join(version_suffixes),
+                    path,
+                )
+            count += len(version_suffixes)
+        return count
+
+
+@receiver(signals.filebrowser_post_upload, dispatch_uid="filebrowser_upload_versions")
+def upload_versions(sender, file, site, **kwargs):
+    """
+    Generates UPLOAD_VERSIONS of an uploaded image in the background (the
+    dimensions of the image are cached at the same time), so the listing
+    after an upload is rendered without generating versions.
+    """
+    if not UPLOAD_VERSIONS or not file.path.startswith(site.directory):
+        return
+    if file.filetype == "Image" and not file.is_version:
+        get_upload_queue().enqueue_versions(file, UPLOAD_VERSIONS)
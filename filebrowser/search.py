@@ -0,0 +1,366 @@
+import os
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from filebrowser import signals
+from filebrowser.base import FileListing, FileObject
+from filebrowser.index import normalize_path
+from filebrowser.settings import SEARCH_INDEX, SEARCH_INDEX_LOCATION
+from filebrowser.utils import SQLiteDatabase
+
+
+def get_search_index(site):
+    """
+    Returns the search index for a site as defined with SEARCH_INDEX
+    (or None, if no search index is being used).
+    """
+    if not SEARCH_INDEX:
+        return None
+    return import_string(SEARCH_INDEX)(site)
+
+
+# Length of the code of escaped characters, e.g. \x41 or \u00e9
+ESCAPE_LENGTHS = {"x": 2, "u": 4, "U": 8}
+
+
+def trigrams(value):
+    "Set of all substrings of value with three characters"
+    return set(value[i : i + 3] for i in range(len(value) - 2))
+
+
+def required_literals(pattern):
+    """
+    Literal substrings which are part of every match of the regular
+    expression pattern. Returns an empty list if the pattern is too complex
+    (e.g. with alternatives or groups).
+    """
+    if "|" in pattern or "(" in pattern:
+        return []
+    literals = []
+    current = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            escaped = pattern[i + 1 : i + 2]
+            literals.append(current)
+            current = ""
+            i += 2
+            if escaped and not escaped.isalnum():
+                # an escaped character, e.g. \.
+                current = escaped
+            elif escaped in ESCAPE_LENGTHS:
+                # skip the code of a character, e.g. \x41
+                i += ESCAPE_LENGTHS[escaped]
+            elif escaped == "N":
+                # a named character, e.g. \N{DIGIT ONE}
+                end = pattern.find("}", i)
+                if end == -1:
+                    return []
+                i = end + 1
+            elif escaped == "0":
+                # an octal character, e.g. \012
+                i += len(re.match("[0-7]{0,2}", pattern[i:]).group())
+            elif escaped.isdigit():
+                # octal characters or backreferences
+                return []
+            continue
+        if char == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                return []
+            literals.append(current)
+            current = ""
+            i = end + 1
+            continue
+        if char in "?*{":
+            # the previous character is optional
+            literals.append(current[:-1])
+            current = ""
+            if char == "{":
+                end = pattern.find("}", i)
+                i = end + 1 if end != -1 else len(pattern)
+                continue
+        elif char in ".^$+":
+            literals.append(current)
+            current = ""
+        else:
+            current += char
+        i += 1
+    literals.append(current)
+    return [literal for literal in literals if literal]
+
+
+class SearchIndex:
+    """
+    An index of the filenames of a site, used in order to search all folders
+    (with SEARCH_TRAVERSE) without walking the directory.
+    """
+
+    def __init__(self, site):
+        self.site = site
+
+    def search(self, path, pattern, filter_func=None):
+        """
+        Returns the paths of all items below the folder path matching the
+        (lowercase) regular expression pattern as a sorted list of
+        (path, is_folder). All folders are part of the result.
+
+        filter_func is called with the filename and excludes items from the
+        result altogether. Returns None if the folder is not indexed.
+        """
+        raise NotImplementedError()
+
+    def count(self, path, filter_func=None):
+        """
+        Number of items below the folder path (or None, if the folder is not
+        indexed).
+        """
+        raise NotImplementedError()
+
+    def store(self, items):
+        """
+        Adds (or replaces) items (a list of (path, is_folder)) with the index.
+        """
+        raise NotImplementedError()
+
+    def remove(self, path):
+        """
+        Removes path (and everything below path) from the index.
+        """
+        raise NotImplementedError()
+
+    def clear(self):
+        """
+        Removes all items of the site from the index.
+        """
+        raise NotImplementedError()
+
+    def update(self, path):
+        """
+        Reads path from site.storage and updates the index.
+        """
+        fileobject = FileObject(path, site=self.site)
+        if not fileobject.exists:
+            self.remove(path)
+        elif fileobject.is_folder:
+            self.rebuild(path)
+        else:
+            self.store([(fileobject.path, False)])
+
+    def rebuild(self, path=None):
+        """
+        Removes path from the index and indexes everything below path again
+        (defaults to site.directory). Returns the number of indexed items.
+        """
+        if path is None:
+            path = self.site.directory
+        self.remove(path)
+        filelisting = FileListing(normalize_path(path), site=self.site)
+        if not filelisting.is_folder:
+            return 0
+        count = 0
+        items = [(normalize_path(path), True)]
+        for fileobject in filelisting.iter_walk():
+            items.append((fileobject.path, fileobject.is_folder))
+            if len(items) >= 1000:
+                self.store(items)
+                count += len(items)
+                items = []
+        self.store(items)
+        return count + len(items)
+
+
+class SQLiteSearchIndex(SearchIndex):
+    """
+    Search index with trigrams of the filenames, stored with a local SQLite
+    database (see SEARCH_INDEX_LOCATION).
+
+    Patterns with a literal part of at least three characters only check
+    the filenames containing all trigrams of the literal, other patterns
+    check all filenames below path.
+    """
+
+    def __init__(self, site, location=None):
+        super().__init__(site)
+        self.location = location or SEARCH_INDEX_LOCATION
+        if not self.location:
+            raise ImproperlyConfigured(
+                "FILEBROWSER_SEARCH_INDEX_LOCATION is required with SQLiteSearchIndex."
+            )
+        self.database = SQLiteDatabase(
+            self.location,
+            [
+                "CREATE TABLE IF NOT EXISTS filebrowser_search ("
+                "site TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "filename TEXT NOT NULL, "
+                "is_folder INTEGER NOT NULL, "
+                "PRIMARY KEY (site, path))",
+                "CREATE TABLE IF NOT EXISTS filebrowser_search_trigram ("
+                "site TEXT NOT NULL, "
+                "trigram TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "PRIMARY KEY (site, trigram, path)) WITHOUT ROWID",
+            ],
+        )
+
+    @property
+    def namespace(self):
+        "Items are stored per site (sites may share a database)"
+        return self.site.name or ""
+
+    @property
+    def connection(self):
+        return self.database.connection
+
+    def is_indexed(self, path):
+        "True, if the folder path is part of the index"
+        row = self.connection.execute(
+            "SELECT is_folder FROM filebrowser_search WHERE site = ? AND path = ?",
+            (self.namespace, normalize_path(path)),
+        ).fetchone()
+        return bool(row and row[0])
+
+    def _where(self, path, filter_func):
+        "Condition for all items below path (with filter_func)"
+        prefix = normalize_path(path) + "/"
+        where = "site = ? AND substr(path, 1, ?) = ?"
+        params = [self.namespace, len(prefix), prefix]
+        if filter_func:
+            self.connection.create_function(
+                "fb_filter", 1, lambda value: bool(filter_func(value))
+            )
+            where += " AND fb_filter(filename)"
+        return where, params
+
+    def search(self, path, pattern, filter_func=None):
+        if not self.is_indexed(path):
+            return None
+        re_q = re.compile(pattern, re.M)
+        where, params = self._where(path, filter_func)
+        required = set()
+        for literal in required_literals(pattern):
+            required.update(trigrams(literal))
+        if required:
+            # Only files with all trigrams (and all folders)
+            where += (
+                " AND (is_folder = 1 OR path IN ("
+                "SELECT path FROM filebrowser_search_trigram "
+                "WHERE site = ? AND trigram IN (%s) "
+                "GROUP BY path HAVING COUNT(*) = ?))"
+                % ", ".join("?" for trigram in required)
+            )
+            params += [self.namespace] + sorted(required) + [len(required)]
+        cursor = self.connection.execute(
+            "SELECT path, filename, is_folder FROM filebrowser_search "
+            "WHERE %s ORDER BY path" % where,
+            params,
+        )
+        return [
+            (path, bool(is_folder))
+            for path, filename, is_folder in cursor
+            if is_folder or re_q.search(filename.lower())
+        ]
+
+    def count(self, path, filter_func=None):
+        if not self.is_indexed(path):
+            return None
+        where, params = self._where(path, filter_func)
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM filebrowser_search WHERE %s" % where, params
+        ).fetchone()[0]
+
+    def store(self, items):
+        rows = []
+        trigram_rows = []
+        for path, is_folder in items:
+            path = normalize_path(path)
+            filename = os.path.basename(path)
+            rows.append((self.namespace, path, filename, int(is_folder)))
+            if not is_folder:
+                for trigram in trigrams(filename.lower()):
+                    trigram_rows.append((self.namespace, trigram, path))
+        with self.connection as connection:
+            connection.executemany(
+                "DELETE FROM filebrowser_search_trigram WHERE site = ? AND path = ?",
+                [(row[0], row[1]) for row in rows],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO filebrowser_search (site, path, filename, is_folder) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO filebrowser_search_trigram (site, trigram, path) "
+                "VALUES (?, ?, ?)",
+                trigram_rows,
+            )
+
+    def remove(self, path):
+        path = normalize_path(path)
+        prefix = path + "/"
+        params = (self.namespace, path, len(prefix), prefix)
+        with self.connection as connection:
+            connection.execute(
+                "DELETE FROM filebrowser_search_trigram WHERE site = ? "
+                "AND (path = ? OR substr(path, 1, ?) = ?)",
+                params,
+            )
+            connection.execute(
+                "DELETE FROM filebrowser_search WHERE site = ? "
+                "AND (path = ? OR substr(path, 1, ?) = ?)",
+                params,
+            )
+
+    def clear(self):
+        with self.connection as connection:
+            connection.execute(
+                "DELETE FROM filebrowser_search_trigram WHERE site = ?",
+                (self.namespace,),
+            )
+            connection.execute(
+                "DELETE FROM filebrowser_search WHERE site = ?", (self.namespace,)
+            )
+
+
+# Keep the search index up to date with changes made with the FileBrowser
+
+
+@receiver(signals.filebrowser_post_upload, dispatch_uid="filebrowser_search_upload")
+def search_upload(sender, file, site, **kwargs):
+    if getattr(site, "search_index", None) is not None:
+        site.search_index.update(file.path)
+
+
+@receiver(
+    signals.filebrowser_post_createdir, dispatch_uid="filebrowser_search_createdir"
+)
+def search_createdir(sender, path, site, **kwargs):
+    if getattr(site, "search_index", None) is not None:
+        site.search_index.update(path)
+
+
+@receiver(signals.filebrowser_post_delete, dispatch_uid="filebrowser_search_delete")
+def search_delete(sender, path, site, **kwargs):
+    if getattr(site, "search_index", None) is not None:
+        site.search_index.remove(path)
+
+
+@receiver(signals.filebrowser_post_rename, dispatch_uid="filebrowser_search_rename")
+def search_rename(sender, path, new_name, site, **kwargs):
+    if getattr(site, "search_index", None) is not None:
+        site.search_index.remove(path)
+        site.search_index.update(os.path.join(os.path.dirname(path), new_name))
+
+
+@receiver(signals.filebrowser_post_change, dispatch_uid="filebrowser_search_change")
+def search_change(sender, path, event, site, **kwargs):
+    if getattr(site, "search_index", None) is not None:
+        if event == "deleted":
+            site.search_index.remove(path)
+        else:
+            site.search_index.update(path)
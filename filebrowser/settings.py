@@ -107,6 +107,8 @@ VERSION_PROCESSORS = getattr(
 VERSION_NAMER = getattr(
     settings, "FILEBROWSER_VERSION_NAMER", "filebrowser.namers.VersionNamer"
 )
+# Number of threads used to generate missing versions with the versions templatetag
+VERSION_GENERATE_WORKERS = getattr(settings, "FILEBROWSER_VERSION_GENERATE_WORKERS", 4)
 
 # PLACEHOLDER
 
@@ -117,13 +119,55 @@ SHOW_PLACEHOLDER = getattr(settings, "FILEBROWSER_SHOW_PLACEHOLDER", False)
 # Always show placeholder (even if the original image exists)
 FORCE_PLACEHOLDER = getattr(settings, "FILEBROWSER_FORCE_PLACEHOLDER", False)
 
+# VERSION QUEUE
+
+# Class used to generate missing versions asynchronously with the version
+# templatetag (e.g. filebrowser.queues.ThreadPoolVersionQueue or
+# filebrowser.queues.SQLiteVersionQueue). Set to None in order to generate
+# versions while rendering the template.
+VERSION_QUEUE = getattr(settings, "FILEBROWSER_VERSION_QUEUE", None)
+# Location of the database file used with filebrowser.queues.SQLiteVersionQueue.
+VERSION_QUEUE_LOCATION = getattr(settings, "FILEBROWSER_VERSION_QUEUE_LOCATION", "")
+# Number of threads used with filebrowser.queues.ThreadPoolVersionQueue.
+VERSION_QUEUE_WORKERS = getattr(settings, "FILEBROWSER_VERSION_QUEUE_WORKERS", 2)
+# Versions generated in the background after an image has been uploaded
+# (e.g. ["admin_thumbnail", "thumbnail"]), with VERSION_QUEUE or a
+# ThreadPoolVersionQueue.
+UPLOAD_VERSIONS = getattr(settings, "FILEBROWSER_UPLOAD_VERSIONS", [])
+# Show the version of PLACEHOLDER while a version is being generated
+# (if False or without PLACEHOLDER, the original image is shown instead).
+VERSION_QUEUE_PLACEHOLDER = getattr(settings, "FILEBROWSER_VERSION_QUEUE_PLACEHOLDER", True)
+
 # EXTRA SETTINGS
 
+# Number of threads used for storage requests which can not be batched
+# (e.g. deleting the versions of an image or copying the files of a folder).
+STORAGE_WORKERS = getattr(settings, "FILEBROWSER_STORAGE_WORKERS", 8)
+# Number of threads used for applying an action to multiple selected files
+# and the number of files passed to the action at once (see the view fb_bulk_action).
+ACTION_WORKERS = getattr(settings, "FILEBROWSER_ACTION_WORKERS", 4)
+ACTION_BATCH_SIZE = getattr(settings, "FILEBROWSER_ACTION_BATCH_SIZE", 10)
+
 # If set to True, the FileBrowser will not try to import a mis-installed PIL.
 STRICT_PIL = getattr(settings, "FILEBROWSER_STRICT_PIL", False)
 # PIL's Error "Suspension not allowed here" work around:
 # s. http://mail.python.org/pipermail/image-sig/1999-August/000816.html
 IMAGE_MAXBLOCK = getattr(settings, "FILEBROWSER_IMAGE_MAXBLOCK", 1024 * 1024)
+# Max. number of bytes read from an image in order to get its dimensions
+# (the full image is only read if the dimensions are not found within this prefix).
+DIMENSIONS_MAX_READ = getattr(settings, "FILEBROWSER_DIMENSIONS_MAX_READ", 64 * 1024)
+# Cache for image dimensions (name of a cache defined with CACHES).
+# Set to None in order to read the dimensions from the image file every time.
+DIMENSIONS_CACHE = getattr(settings, "FILEBROWSER_DIMENSIONS_CACHE", None)
+# Cache for versions known to be up to date (name of a cache defined with CACHES).
+# With a cache, the version templatetag does not check the storage for existing
+# versions. Set to None in order to check the storage every time.
+VERSIONS_CACHE = getattr(settings, "FILEBROWSER_VERSIONS_CACHE", None)
+# Cache for folder listings (name of a cache defined with CACHES). A listing is
+# cached until the folder is changed with the FileBrowser (or its modification
+# time changes with local storages) and the browse view answers conditional
+# requests. Set to None in order to list the storage every time.
+LISTING_CACHE = getattr(settings, "FILEBROWSER_LISTING_CACHE", None)
 # Exclude files matching any of the following regular expressions
 # Default is to exclude 'thumbnail' style naming of image-thumbnails.
 EXTENSION_LIST = []
@@ -150,6 +194,8 @@ LIST_PER_PAGE = getattr(settings, "FILEBROWSER_LIST_PER_PAGE", 50)
 DEFAULT_SORTING_BY = getattr(settings, "FILEBROWSER_DEFAULT_SORTING_BY", "date")
 # Sorting Order: asc, desc
 DEFAULT_SORTING_ORDER = getattr(settings, "FILEBROWSER_DEFAULT_SORTING_ORDER", "desc")
+# List folders before files (regardless of sorting)
+FOLDERS_FIRST = getattr(settings, "FILEBROWSER_FOLDERS_FIRST", False)
 # regex to clean dir names before creation
 FOLDER_REGEX = getattr(settings, "FILEBROWSER_FOLDER_REGEX", r"^[\w._\ /-]+$")
 # Traverse directories when searching
@@ -164,6 +210,37 @@ OVERWRITE_EXISTING = getattr(settings, "FILEBROWSER_OVERWRITE_EXISTING", True)
 # Directory to Save temporary uploaded files (FileBrowseUploadField)
 # Relative to site.storage.location.
 UPLOAD_TEMPDIR = getattr(settings, "FILEBROWSER_UPLOAD_TEMPDIR", "_temp")
+# Files larger than this size (in bytes) are uploaded in chunks of this size,
+# an upload is resumed after a failed chunk (the chunks are collected within
+# UPLOAD_TEMPDIR). Set to 0 in order to upload files with a single request.
+UPLOAD_CHUNK_SIZE = getattr(settings, "FILEBROWSER_UPLOAD_CHUNK_SIZE", 2 * 1024 * 1024)
+# Number of files uploaded at the same time by the uploader.
+UPLOAD_MAX_CONNECTIONS = getattr(settings, "FILEBROWSER_UPLOAD_MAX_CONNECTIONS", 3)
+# Max. number of uploads processed at the same time per site. Further uploads
+# are answered with "429 Too Many Requests" and retried by the uploader.
+# Set to None in order to process any number of uploads.
+UPLOAD_LIMIT = getattr(settings, "FILEBROWSER_UPLOAD_LIMIT", None)
+# Cache used to count the uploads in progress with UPLOAD_LIMIT (name of a
+# cache defined with CACHES, shared by all processes with a shared backend).
+UPLOAD_LIMIT_CACHE = getattr(settings, "FILEBROWSER_UPLOAD_LIMIT_CACHE", "default")
+
+# METADATA INDEX
+
+# Class used to keep a persistent index with metadata of files and folders
+# (size, date, filetype, dimensions). Listings are read from this index instead
+# of site.storage. Set to None in order to disable the index.
+METADATA_INDEX = getattr(settings, "FILEBROWSER_METADATA_INDEX", None)
+# Location of the database file used with filebrowser.index.SQLiteMetadataIndex.
+METADATA_INDEX_LOCATION = getattr(settings, "FILEBROWSER_METADATA_INDEX_LOCATION", "")
+
+# SEARCH INDEX
+
+# Class used to keep an index of filenames, used for searching with
+# SEARCH_TRAVERSE (instead of walking all folders with every search).
+# Set to None in order to disable the search index.
+SEARCH_INDEX = getattr(settings, "FILEBROWSER_SEARCH_INDEX", None)
+# Location of the database file used with filebrowser.search.SQLiteSearchIndex.
+SEARCH_INDEX_LOCATION = getattr(settings, "FILEBROWSER_SEARCH_INDEX_LOCATION", "")
 
 # EXTRA TRANSLATION STRINGS
 
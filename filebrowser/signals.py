@@ -36,3 +36,10 @@ filebrowser_post_rename = Signal()
 # result: The response you defined with your custom action
 filebrowser_actions_pre_apply = Signal()
 filebrowser_actions_post_apply = Signal()
+
+# change signals (sent with fb_watch for changes made outside of the FileBrowser)
+# path: Path to the file/folder (relative to site.storage)
+# event: Either "created", "modified" or "deleted"
+# is_folder: True, if path is a folder
+# site: Current FileBrowserSite instance
+filebrowser_post_change = Signal()
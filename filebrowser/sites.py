@@ -1,5 +1,11 @@
+import copy
+import datetime
+import hashlib
+import logging
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import wraps
 from time import gmtime, localtime, strftime, time
 
 from django import forms
@@ -7,10 +13,24 @@ from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.files.storage import DefaultStorage, FileSystemStorage, default_storage
 from django.core.paginator import EmptyPage, InvalidPage, Paginator
-from django.http import HttpResponseBadRequest, HttpResponseRedirect
+from django.db import close_old_connections
+from django.http import (
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.shortcuts import HttpResponse, render
 from django.template import RequestContext as Context
+from django.middleware.csrf import get_token
 from django.urls import get_resolver, get_urlconf, reverse
+from django.utils.cache import (
+    add_never_cache_headers,
+    get_conditional_response,
+    patch_cache_control,
+)
+from django.utils.http import content_disposition_header, quote_etag
+from django.utils.translation import get_language
 from django.utils.translation import gettext as _
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
@@ -25,9 +45,21 @@ from filebrowser.actions import (
     rotate_90_counterclockwise,
     rotate_180,
 )
-from filebrowser.base import FileListing, FileObject
+from filebrowser.base import (
+    FileEntry,
+    FileListing,
+    FileObject,
+    SortedFiles,
+    promote_entry,
+)
 from filebrowser.decorators import file_exists, path_exists
+from filebrowser.downloads import iter_zip, zip_items
+from filebrowser.index import get_metadata_index
+from filebrowser.queues import get_version_queue
+from filebrowser.search import get_search_index
 from filebrowser.settings import (
+    ACTION_BATCH_SIZE,
+    ACTION_WORKERS,
     ADMIN_THUMBNAIL,
     ADMIN_VERSIONS,
     CONVERT_FILENAME,
@@ -38,25 +70,35 @@ from filebrowser.settings import (
     EXCLUDE,
     EXTENSION_LIST,
     EXTENSIONS,
+    FOLDERS_FIRST,
     LIST_PER_PAGE,
     MAX_UPLOAD_SIZE,
     NORMALIZE_FILENAME,
     OVERWRITE_EXISTING,
     SEARCH_TRAVERSE,
     SELECT_FORMATS,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_MAX_CONNECTIONS,
     UPLOAD_TEMPDIR,
     VERSIONS,
     VERSIONS_BASEDIR,
 )
 from filebrowser.storage import FileSystemStorageMixin
 from filebrowser.templatetags.fb_tags import query_helper
-from filebrowser.utils import convert_filename
+from filebrowser.uploads import (
+    UPLOAD_RETRY_AFTER,
+    ChunkedUpload,
+    UploadLimit,
+    use_local_upload_handlers,
+)
+from filebrowser.utils import ExtensionLookup, convert_filename
 
 try:
     import json
 except ImportError:
     from django.utils import simplejson as json
 
+logger = logging.getLogger("filebrowser")
 
 # Add some required methods to FileSystemStorage
 if FileSystemStorageMixin not in FileSystemStorage.__bases__:
@@ -162,6 +204,8 @@ def get_settings_var(directory=DIRECTORY):
     settings_var["ADMIN_THUMBNAIL"] = ADMIN_THUMBNAIL
     # FileBrowser Options
     settings_var["MAX_UPLOAD_SIZE"] = MAX_UPLOAD_SIZE
+    settings_var["UPLOAD_CHUNK_SIZE"] = UPLOAD_CHUNK_SIZE
+    settings_var["UPLOAD_MAX_CONNECTIONS"] = UPLOAD_MAX_CONNECTIONS
     # Normalize Filenames
     settings_var["NORMALIZE_FILENAME"] = NORMALIZE_FILENAME
     # Convert Filenames
@@ -185,11 +229,102 @@ def handle_file_upload(path, file, site):
     return uploadedfile
 
 
+def get_filename_filter():
+    """
+    Returns the filter for filenames shown with the browse view (no hidden
+    files, no files matching EXCLUDE and, without VERSIONS_BASEDIR, no
+    versions).
+    """
+    filter_re = []
+    for exp in EXCLUDE:
+        filter_re.append(re.compile(exp))
+
+    # do not filter if VERSIONS_BASEDIR is being used
+    if not VERSIONS_BASEDIR:
+        for k, v in VERSIONS.items():
+            exp = (r"_%s(%s)$") % (k, "|".join(EXTENSION_LIST))
+            filter_re.append(re.compile(exp, re.IGNORECASE))
+
+    def filter_filename(filename):
+        "Defining a browse filter (for filenames)"
+        filtered = filename.startswith(".")
+        for re_prefix in filter_re:
+            if re_prefix.search(filename):
+                filtered = True
+        if filtered:
+            return False
+        return True
+
+    return filter_filename
+
+
+def is_selectable(name):
+    "Whether name (of a selection) is a file or folder directly within dir"
+    return (
+        bool(name) and not name.startswith(".") and "/" not in name and "\\" not in name
+    )
+
+
+class ActionMessages(list):
+    """
+    Collects the messages an action adds (with django.contrib.messages) on a
+    pool thread, see FileBrowserSite._apply_action.
+    """
+
+    def add(self, level, message, extra_tags=""):
+        self.append((level, message, extra_tags))
+
+
+def iter_action_progress(results, total):
+    """
+    Yields a JSON line per file of the results of FileBrowserSite._apply_action
+    (with the number of files done so far and the total). The messages of the
+    action are passed with the first file of a batch.
+    """
+    done = 0
+    for batch, error, action_messages in results:
+        for i, fileobject in enumerate(batch):
+            done += 1
+            yield json.dumps(
+                {
+                    "filename": fileobject.filename,
+                    "success": error is None,
+                    "messages": [
+                        str(message) for level, message, extra_tags in action_messages
+                    ]
+                    if i == 0
+                    else [],
+                    "done": done,
+                    "total": total,
+                }
+            ) + "\n"
+
+
 def filebrowser_view(view):
     "Only let staff browse the files"
     return staff_member_required(never_cache(view))
 
 
+def filebrowser_conditional_view(view):
+    """
+    Only let staff browse the files. Responses with an ETag are revalidated
+    with every request (see LISTING_CACHE), other responses are never cached.
+    """
+
+    @wraps(view)
+    def _wrapped_view(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.has_header("ETag"):
+            patch_cache_control(
+                response, private=True, no_cache=True, must_revalidate=True, max_age=0
+            )
+        else:
+            add_never_cache_headers(response)
+        return response
+
+    return staff_member_required(_wrapped_view)
+
+
 class FileBrowserSite:
     """
     A filebrowser.site defines admin views for browsing your servers media files.
@@ -210,6 +345,14 @@ class FileBrowserSite:
 
         # Per-site settings:
         self.directory = DIRECTORY
+        self.extensions = EXTENSIONS
+        self.select_formats = SELECT_FORMATS
+
+        # Metadata index (see METADATA_INDEX)
+        self.index = get_metadata_index(self)
+
+        # Search index (see SEARCH_INDEX)
+        self.search_index = get_search_index(self)
 
     def _directory_get(self):
         "Set directory"
@@ -221,6 +364,37 @@ class FileBrowserSite:
 
     directory = property(_directory_get, _directory_set)
 
+    def _extensions_get(self):
+        "Get extensions"
+        return self._extensions
+
+    def _extensions_set(self, val):
+        "Set extensions (see EXTENSIONS)"
+        self._extensions = val
+        self._extension_lookup = None
+
+    extensions = property(_extensions_get, _extensions_set)
+
+    def _select_formats_get(self):
+        "Get select formats"
+        return self._select_formats
+
+    def _select_formats_set(self, val):
+        "Set select formats (see SELECT_FORMATS)"
+        self._select_formats = val
+        self._extension_lookup = None
+
+    select_formats = property(_select_formats_get, _select_formats_set)
+
+    @property
+    def extension_lookup(self):
+        "Lookup tables for filetypes and formats with extensions and select_formats"
+        if self._extension_lookup is None:
+            self._extension_lookup = ExtensionLookup(
+                self.extensions, self.select_formats
+            )
+        return self._extension_lookup
+
     def get_urls(self):
         "URLs for a filebrowser.site"
         from django.urls import re_path
@@ -229,7 +403,7 @@ class FileBrowserSite:
         urlpatterns = [
             re_path(
                 r"^browse/$",
-                path_exists(self, filebrowser_view(self.browse)),
+                path_exists(self, filebrowser_conditional_view(self.browse)),
                 name="fb_browse",
             ),
             re_path(
@@ -264,6 +438,16 @@ class FileBrowserSite:
                 file_exists(self, path_exists(self, filebrowser_view(self.version))),
                 name="fb_version",
             ),
+            re_path(
+                r"^download/$",
+                path_exists(self, filebrowser_view(self.download)),
+                name="fb_download",
+            ),
+            re_path(
+                r"^bulk_action/$",
+                path_exists(self, filebrowser_view(self.bulk_action)),
+                name="fb_bulk_action",
+            ),
             re_path(
                 r"^upload_file/$",
                 staff_member_required(csrf_exempt(self._upload_file)),
@@ -326,25 +510,11 @@ class FileBrowserSite:
 
     def browse(self, request):
         "Browse Files/Directories."
-        filter_re = []
-        for exp in EXCLUDE:
-            filter_re.append(re.compile(exp))
-
-        # do not filter if VERSIONS_BASEDIR is being used
-        if not VERSIONS_BASEDIR:
-            for k, v in VERSIONS.items():
-                exp = (r"_%s(%s)$") % (k, "|".join(EXTENSION_LIST))
-                filter_re.append(re.compile(exp, re.IGNORECASE))
+        filter_filename = get_filename_filter()
 
         def filter_browse(item):
             "Defining a browse filter"
-            filtered = item.filename.startswith(".")
-            for re_prefix in filter_re:
-                if re_prefix.search(item.filename):
-                    filtered = True
-            if filtered:
-                return False
-            return True
+            return filter_filename(item.filename)
 
         query = request.GET.copy()
         path = os.path.join(self.directory, query.get("dir", ""))
@@ -355,13 +525,18 @@ class FileBrowserSite:
             sorting_by=query.get("o", DEFAULT_SORTING_BY),
             sorting_order=query.get("ot", DEFAULT_SORTING_ORDER),
             site=self,
+            folders_first=FOLDERS_FIRST,
         )
 
-        files = []
-        if SEARCH_TRAVERSE and query.get("q"):
-            listing = filelisting.files_walk_filtered()
-        else:
-            listing = filelisting.files_listing_filtered()
+        # Conditional requests for unchanged listings are answered with 304
+        etag = None
+        if not (SEARCH_TRAVERSE and query.get("q")):
+            etag = self._browse_etag(request, filelisting)
+        if etag is not None:
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                response["ETag"] = etag
+                return response
 
         # If we do a search, precompile the search pattern now
         do_search = query.get("q")
@@ -372,30 +547,52 @@ class FileBrowserSite:
         filter_date = query.get("filter_date")
         filter_format = query.get("type")
 
-        for fileobject in listing:
-            # date/type filter, format filter
-            append = False
-            if (
-                (not filter_type or fileobject.filetype == filter_type)
-                and (
-                    not filter_date or get_filterdate(filter_date, fileobject.date or 0)
-                )
-                and (not filter_format or filter_format in fileobject.format)
-            ):
-                append = True
-            # search
-            if do_search and not re_q.search(fileobject.filename.lower()):
-                append = False
-            # always show folders with popups
-            # otherwise, one is not able to select/filter files within subfolders
-            if fileobject.filetype == "Folder":
-                append = True
-            # append
-            if append:
-                files.append(fileobject)
-
-        filelisting.results_total = len(listing)
-        filelisting.results_current = len(files)
+        # With an index, filtering/sorting is done with the index and only
+        # the FileObjects of the current page are created
+        files = None
+        traverse = bool(SEARCH_TRAVERSE and do_search)
+        if self.index is not None:
+            filetypes = None
+            if filter_type:
+                filetypes = [filter_type]
+            if filter_format:
+                formats = self.select_formats.get(filter_format, [])
+                filetypes = [f for f in filetypes or formats if f in formats]
+            date_func = None
+            if filter_date:
+                date_func = lambda date: get_filterdate(filter_date, date or 0)
+            search_func = None
+            if do_search:
+                search_func = lambda filename: re_q.search(filename.lower())
+            files = self.index.query(
+                path,
+                traverse=traverse,
+                filter_func=filter_filename,
+                filetypes=filetypes,
+                date_func=date_func,
+                search_func=search_func,
+                sorting_by=filelisting.sorting_by,
+                sorting_order=filelisting.sorting_order,
+                folders_first=filelisting.folders_first,
+            )
+        if files is not None:
+            filelisting.results_total = self.index.query(
+                path, traverse=traverse, filter_func=filter_filename
+            ).count()
+            filelisting.results_current = files.count()
+        elif traverse and self.search_index is not None:
+            files = self._search_files(
+                filelisting,
+                query.get("q").lower(),
+                filter_filename,
+                filter_type,
+                filter_date,
+                filter_format,
+            )
+        if files is None:
+            files = self._browse_files(
+                filelisting, do_search and re_q, filter_type, filter_date, filter_format
+            )
 
         p = Paginator(files, LIST_PER_PAGE)
         page_nr = request.GET.get("p", "1")
@@ -403,9 +600,12 @@ class FileBrowserSite:
             page = p.page(page_nr)
         except (EmptyPage, InvalidPage):
             page = p.page(p.num_pages)
+        # Walking and searching returns FileEntry records, only the items
+        # of the current page are turned into FileObjects
+        page.object_list = [promote_entry(item) for item in page.object_list]
 
         request.current_app = self.name
-        return render(
+        response = render(
             request,
             "filebrowser/index.html",
             {
@@ -418,8 +618,115 @@ class FileBrowserSite:
                 "breadcrumbs": get_breadcrumbs(query, query.get("dir", "")),
                 "breadcrumbs_title": "",
                 "filebrowser_site": self,
+                # Files can be selected for actions (all files within dir)
+                "bulk_selection": not query.get("pop") and not traverse,
             },
         )
+        if etag is not None:
+            response["ETag"] = etag
+        return response
+
+    def _browse_etag(self, request, filelisting):
+        """
+        ETag for the browse view with the current state of the folder (see
+        FileListing.listing_version), the query string and the user. Returns
+        None without LISTING_CACHE, with pending messages and with a version
+        queue (the page may show placeholders).
+        """
+        version = filelisting.listing_version()
+        if (
+            version is None
+            or len(messages.get_messages(request))
+            or get_version_queue() is not None
+        ):
+            return None
+        # The page contains a CSRF token (a new secret is set if missing)
+        get_token(request)
+        value = ":".join(
+            str(item)
+            for item in (
+                self.name,
+                version,
+                request.get_full_path(),
+                request.user.pk,
+                get_language(),
+                request.META.get("CSRF_COOKIE", ""),
+                datetime.date.today(),  # filter_date
+            )
+        )
+        return quote_etag(hashlib.md5(value.encode("utf-8")).hexdigest())
+
+    def _search_files(
+        self, filelisting, pattern, filter_filename, filter_type, filter_date, filter_format
+    ):
+        """
+        Filtered FileEntry records for a search with SEARCH_TRAVERSE (with the
+        search index). Returns None if the folder is not indexed.
+        """
+        items = self.search_index.search(
+            filelisting.path, pattern, filter_func=filter_filename
+        )
+        if items is None:
+            return None
+        files = []
+        for item_path, is_folder in items:
+            fileobject = FileEntry(
+                item_path, site=self, stat={"exists": True, "is_folder": is_folder}
+            )
+            # date/type filter, format filter (always show folders)
+            if is_folder or (
+                (not filter_type or fileobject.filetype == filter_type)
+                and (
+                    not filter_date or get_filterdate(filter_date, fileobject.date or 0)
+                )
+                and (not filter_format or filter_format in fileobject.format)
+            ):
+                files.append(fileobject)
+        files = SortedFiles(filelisting, files)
+
+        filelisting.results_total = self.search_index.count(
+            filelisting.path, filter_func=filter_filename
+        )
+        filelisting.results_current = len(files)
+        return files
+
+    def _browse_files(self, filelisting, re_q, filter_type, filter_date, filter_format):
+        """
+        Filtered FileObjects for browse (without an index), FileEntry records
+        when walking with SEARCH_TRAVERSE. Only the slice requested by the
+        Paginator is sorted (see SortedFiles).
+        """
+        files = []
+        if SEARCH_TRAVERSE and re_q:
+            listing = filelisting.files_walk_filtered(entries=True, sort=False)
+        else:
+            listing = filelisting.files_listing_filtered(sort=False)
+
+        for fileobject in listing:
+            # date/type filter, format filter
+            append = False
+            if (
+                (not filter_type or fileobject.filetype == filter_type)
+                and (
+                    not filter_date or get_filterdate(filter_date, fileobject.date or 0)
+                )
+                and (not filter_format or filter_format in fileobject.format)
+            ):
+                append = True
+            # search
+            if re_q and not re_q.search(fileobject.filename.lower()):
+                append = False
+            # always show folders with popups
+            # otherwise, one is not able to select/filter files within subfolders
+            if fileobject.filetype == "Folder":
+                append = True
+            # append
+            if append:
+                files.append(fileobject)
+
+        filelisting.results_total = len(listing)
+        filelisting.results_current = len(files)
+        return SortedFiles(filelisting, files)
 
     def createdir(self, request):
         "Create Directory"
@@ -518,10 +825,9 @@ class FileBrowserSite:
                 sorting_order=query.get("ot", DEFAULT_SORTING_ORDER),
                 site=self,
             )
-            filelisting = filelisting.files_walk_total()
-            if len(filelisting) > 100:
-                additional_files = len(filelisting) - 100
-                filelisting = filelisting[:100]
+            filelisting, total = filelisting.files_walk_limited(100)
+            if total > 100:
+                additional_files = total - 100
             else:
                 additional_files = None
         else:
@@ -684,6 +990,147 @@ class FileBrowserSite:
             },
         )
 
+    def download(self, request):
+        """
+        Download a folder (dir, or filename within dir) or a selection of
+        files and folders within dir (selected, multiple) as a ZIP archive.
+        The archive is streamed while it is being built.
+        """
+        query = request.GET
+        path = os.path.join(self.directory, query.get("dir", ""))
+        names = query.getlist("selected") or None
+        if query.get("filename"):
+            names = [query.get("filename")]
+        if not all(map(is_selectable, names or [])):
+            return HttpResponseBadRequest("Invalid request! Invalid filename.")
+
+        if names is not None and len(names) == 1:
+            archive_name = names[0]
+        else:
+            archive_name = os.path.basename(path.rstrip("/")) or self.name
+        response = StreamingHttpResponse(
+            iter_zip(self, zip_items(self, path, names, get_filename_filter())),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = content_disposition_header(
+            True, "%s.zip" % os.path.splitext(archive_name)[0]
+        )
+        return response
+
+    def bulk_action(self, request):
+        """
+        Apply an action (action) to multiple files within dir (selected,
+        multiple). Selected files the action does not apply to are skipped.
+        With "Accept: application/x-ndjson" the progress is streamed (a JSON
+        line per file, see iter_action_progress), otherwise redirects to the
+        listing.
+        """
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        query = request.GET
+        path = os.path.join(self.directory, query.get("dir", ""))
+        action_name = request.POST.get("action", "")
+        names = request.POST.getlist("selected")
+        if action_name not in self._actions:
+            return HttpResponseBadRequest("Invalid request! Invalid action.")
+        if not all(map(is_selectable, names)):
+            return HttpResponseBadRequest("Invalid request! Invalid filename.")
+
+        action = self._actions[action_name]
+        fileobjects = []
+        for name in names:
+            fileobject = FileObject(os.path.join(path, name), site=self)
+            if fileobject.exists and action.applies_to(fileobject):
+                fileobjects.append(fileobject)
+        results = self._apply_action(request, action_name, fileobjects)
+
+        if "application/x-ndjson" in request.headers.get("Accept", ""):
+            return StreamingHttpResponse(
+                iter_action_progress(results, len(fileobjects)),
+                content_type="application/x-ndjson",
+            )
+        failed = []
+        for batch, error, action_messages in results:
+            if error is not None:
+                failed.extend(fileobject.filename for fileobject in batch)
+            for level, message, extra_tags in action_messages:
+                messages.add_message(request, level, message, extra_tags=extra_tags)
+        if not fileobjects:
+            messages.add_message(
+                request,
+                messages.WARNING,
+                _("The action does not apply to any of the selected files."),
+            )
+        if failed:
+            messages.add_message(
+                request,
+                messages.ERROR,
+                _("Action failed for %s") % ", ".join(sorted(failed)),
+            )
+        redirect_url = reverse(
+            "filebrowser:fb_browse", current_app=self.name
+        ) + query_helper(query, "", "")
+        return HttpResponseRedirect(redirect_url)
+
+    def _apply_action(self, request, action_name, fileobjects):
+        """
+        Applies an action to fileobjects in batches of ACTION_BATCH_SIZE files
+        with a pool of ACTION_WORKERS threads. The action signals are sent
+        once per batch. Yields (batch, error, messages) on the request thread
+        whenever a batch is done (error is None if the action succeeded,
+        messages added by the action are collected with ActionMessages).
+        Responses returned by the action are ignored.
+        """
+        action = self.get_action(action_name)
+        batch_size = max(ACTION_BATCH_SIZE, 1)
+        batches = [
+            fileobjects[i : i + batch_size]
+            for i in range(0, len(fileobjects), batch_size)
+        ]
+        if not batches:
+            return
+
+        def apply(batch):
+            action_request = copy.copy(request)
+            action_messages = ActionMessages()
+            if hasattr(request, "_messages"):
+                action_request._messages = action_messages
+            try:
+                signals.filebrowser_actions_pre_apply.send(
+                    sender=request, action_name=action_name, fileobject=batch, site=self
+                )
+                try:
+                    result = action(request=action_request, fileobjects=batch)
+                except Exception as e:
+                    logger.exception(
+                        "Error applying action %s to %s",
+                        action_name,
+                        ", ".join(fileobject.path for fileobject in batch),
+                    )
+                    return e, action_messages
+                signals.filebrowser_actions_post_apply.send(
+                    sender=request,
+                    action_name=action_name,
+                    fileobject=batch,
+                    result=result,
+                    site=self,
+                )
+                return None, action_messages
+            finally:
+                close_old_connections()
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(min(ACTION_WORKERS, len(batches)), 1),
+            thread_name_prefix="filebrowser-actions",
+        )
+        try:
+            futures = {executor.submit(apply, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                yield (futures[future],) + future.result()
+        finally:
+            # Stops with a closed response (pending batches are not applied)
+            executor.shutdown(cancel_futures=True)
+
     def version(self, request):
         """
         Version detail.
@@ -713,76 +1160,153 @@ class FileBrowserSite:
 
         If temporary is true, we upload to UPLOAD_TEMPDIR, otherwise
         we upload to site.directory
+
+        Large files are uploaded in chunks with the headers X-Upload-Id,
+        X-Upload-Offset and X-Upload-Total (see ChunkedUpload). A GET request
+        with X-Upload-Id returns the offset for resuming an upload.
         """
+        upload_id = request.META.get("HTTP_X_UPLOAD_ID")
+        chunked_upload = None
+        if upload_id is not None:
+            try:
+                chunked_upload = ChunkedUpload(self, upload_id, user=request.user)
+            except ValueError:
+                return HttpResponseBadRequest("Invalid request! Invalid upload id.")
+            if request.method == "GET":
+                return HttpResponse(
+                    json.dumps({"offset": chunked_upload.offset}),
+                    content_type="application/json",
+                )
+
         if request.method == "POST":
-            folder = request.GET.get("folder", "")
-            temporary = request.GET.get("temporary", "")
-            temp_filename = None
+            # Limits the number of uploads processed at the same time, the
+            # uploader retries after Retry-After seconds
+            upload_limit = UploadLimit(self)
+            if not upload_limit.acquire():
+                ret_json = {"success": False, "retry": True}
+                response = HttpResponse(
+                    json.dumps(ret_json), content_type="application/json", status=429
+                )
+                response["Retry-After"] = str(UPLOAD_RETRY_AFTER)
+                return response
+            try:
+                return self._receive_upload(request, chunked_upload)
+            finally:
+                upload_limit.release()
+
+    def _receive_upload(self, request, chunked_upload):
+        "Receives an uploaded file (or a chunk, see _upload_file)"
+        folder = request.GET.get("folder", "")
+        temporary = request.GET.get("temporary", "")
+
+        # Uploads streamed to disk are written to the filesystem of the
+        # storage (and renamed instead of copied)
+        use_local_upload_handlers(request, self)
 
-            if len(request.FILES) == 0:
-                return HttpResponseBadRequest("Invalid request! No files included.")
-            if len(request.FILES) > 1:
+        if len(request.FILES) == 0:
+            return HttpResponseBadRequest("Invalid request! No files included.")
+        if len(request.FILES) > 1:
+            return HttpResponseBadRequest("Invalid request! Multiple files included.")
+
+        filedata = list(request.FILES.values())[0]
+
+        if chunked_upload is not None:
+            try:
+                offset = int(request.META.get("HTTP_X_UPLOAD_OFFSET", ""))
+                total = int(request.META.get("HTTP_X_UPLOAD_TOTAL", ""))
+            except ValueError:
                 return HttpResponseBadRequest(
-                    "Invalid request! Multiple files included."
+                    "Invalid request! Invalid offset or total."
                 )
+            if offset == 0:
+                chunked_upload.cleanup()
+            received = chunked_upload.offset
+            if offset != received:
+                # The client resumes with the offset of the part file
+                ret_json = {"success": False, "offset": received}
+                return HttpResponse(
+                    json.dumps(ret_json),
+                    content_type="application/json",
+                    status=409,
+                )
+            if offset + filedata.size > total:
+                return HttpResponseBadRequest("Invalid request! Chunk too large.")
+            received = chunked_upload.append(filedata)
+            if received < total:
+                ret_json = {"success": True, "complete": False, "offset": received}
+                return HttpResponse(
+                    json.dumps(ret_json), content_type="application/json"
+                )
+            filedata = chunked_upload.file(filedata.name)
 
-            filedata = list(request.FILES.values())[0]
+        try:
+            return self._save_uploaded_file(request, folder, temporary, filedata)
+        finally:
+            if chunked_upload is not None:
+                filedata.close()
+                chunked_upload.delete()
+
+    def _save_uploaded_file(self, request, folder, temporary, filedata):
+        "Saves an uploaded file (see _upload_file)"
+        temp_filename = None
+
+        fb_uploadurl_re = re.compile(
+            r"^.*(%s)" % reverse("filebrowser:fb_upload", current_app=self.name)
+        )
+        folder = fb_uploadurl_re.sub("", folder)
 
-            fb_uploadurl_re = re.compile(
-                r"^.*(%s)" % reverse("filebrowser:fb_upload", current_app=self.name)
-            )
-            folder = fb_uploadurl_re.sub("", folder)
+        # temporary upload folder should be outside self.directory
+        if folder == UPLOAD_TEMPDIR and temporary == "true":
+            path = folder
+        else:
+            path = os.path.join(self.directory, folder)
+        # we convert the filename before uploading in order
+        # to check for existing files/folders
+        file_name = convert_filename(filedata.name)
+        filedata.name = file_name
+        file_path = os.path.join(path, file_name)
+        file_already_exists = self.storage.exists(file_path)
+
+        # construct temporary filename by adding the upload folder, because
+        # otherwise we don't have any clue if the file has temporary been
+        # uploaded or not
+        if folder == UPLOAD_TEMPDIR and temporary == "true":
+            temp_filename = os.path.join(folder, file_name)
+
+        # Check for name collision with a directory
+        if file_already_exists and self.storage.isdir(file_path):
+            ret_json = {"success": False, "filename": file_name}
+            return HttpResponse(json.dumps(ret_json))
+
+        signals.filebrowser_pre_upload.send(
+            sender=request, path=folder, file=filedata, site=self
+        )
 
-            # temporary upload folder should be outside self.directory
-            if folder == UPLOAD_TEMPDIR and temporary == "true":
-                path = folder
-            else:
-                path = os.path.join(self.directory, folder)
-            # we convert the filename before uploading in order
-            # to check for existing files/folders
-            file_name = convert_filename(filedata.name)
-            filedata.name = file_name
-            file_path = os.path.join(path, file_name)
-            file_already_exists = self.storage.exists(file_path)
-
-            # construct temporary filename by adding the upload folder, because
-            # otherwise we don't have any clue if the file has temporary been
-            # uploaded or not
-            if folder == UPLOAD_TEMPDIR and temporary == "true":
-                temp_filename = os.path.join(folder, file_name)
-
-            # Check for name collision with a directory
-            if file_already_exists and self.storage.isdir(file_path):
-                ret_json = {"success": False, "filename": file_name}
-                return HttpResponse(json.dumps(ret_json))
-
-            signals.filebrowser_pre_upload.send(
-                sender=request, path=folder, file=filedata, site=self
-            )
+        if file_already_exists and OVERWRITE_EXISTING:
+            # Replaces the existing file (instead of saving with an alternate
+            # name and moving the saved file)
+            self.storage.replace(file_path, filedata)
+            f = FileObject(file_path, site=self)
+        else:
             uploadedfile = handle_file_upload(path, filedata, site=self)
+            filedata.name = os.path.relpath(uploadedfile, path)
+            f = FileObject(uploadedfile, site=self)
 
-            if file_already_exists and OVERWRITE_EXISTING:
-                self.storage.move(uploadedfile, file_path, allow_overwrite=True)
-                f = FileObject(file_path, site=self)
-            else:
-                filedata.name = os.path.relpath(uploadedfile, path)
-                f = FileObject(uploadedfile, site=self)
-
-            # set permissions
-            if DEFAULT_PERMISSIONS is not None:
-                os.chmod(f.path_full, DEFAULT_PERMISSIONS)
+        # set permissions
+        if DEFAULT_PERMISSIONS is not None:
+            os.chmod(f.path_full, DEFAULT_PERMISSIONS)
 
-            signals.filebrowser_post_upload.send(
-                sender=request, path=folder, file=f, site=self
-            )
+        signals.filebrowser_post_upload.send(
+            sender=request, path=folder, file=f, site=self
+        )
 
-            # let Ajax Upload know whether we saved it or not
-            ret_json = {
-                "success": True,
-                "filename": f.filename,
-                "temp_filename": temp_filename,
-            }
-            return HttpResponse(json.dumps(ret_json), content_type="application/json")
+        # let Ajax Upload know whether we saved it or not
+        ret_json = {
+            "success": True,
+            "filename": f.filename,
+            "temp_filename": temp_filename,
+        }
+        return HttpResponse(json.dumps(ret_json), content_type="application/json")
 
 
 storage = DefaultStorage()
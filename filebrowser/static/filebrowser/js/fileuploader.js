@@ -257,6 +257,10 @@ qq.FileUploaderBasic = function(o){
         button: null,
         multiple: true,
         maxConnections: 3,
+        // files larger than chunkSize (in bytes) are uploaded in chunks,
+        // a failed chunk is resumed up to chunkRetries times (0 disables chunks)
+        chunkSize: 0,
+        chunkRetries: 3,
         // validation        
         allowedExtensions: [],               
         sizeLimit: 0,   
@@ -324,6 +328,8 @@ qq.FileUploaderBasic.prototype = {
             debug: this._options.debug,
             action: this._options.action,         
             maxConnections: this._options.maxConnections,   
+            chunkSize: this._options.chunkSize,
+            chunkRetries: this._options.chunkRetries,
             onProgress: function(id, fileName, loaded, total){                
                 self._onProgress(id, fileName, loaded, total);
                 self._options.onProgress(id, fileName, loaded, total);                    
@@ -858,6 +864,9 @@ qq.UploadHandlerAbstract = function(o){
         action: '/upload.php',
         // maximum number of concurrent uploads        
         maxConnections: 999,
+        // chunked uploads (only with UploadHandlerXhr)
+        chunkSize: 0,
+        chunkRetries: 3,
         onProgress: function(id, fileName, loaded, total){},
         onComplete: function(id, fileName, response){},
         onCancel: function(id, fileName){}
@@ -1176,6 +1185,11 @@ qq.extend(qq.UploadHandlerXhr.prototype, {
             size = this.getSize(id);
                 
         this._loaded[id] = 0;
+
+        if (this._options.chunkSize && size > this._options.chunkSize && file.slice){
+            this._uploadChunked(id, params);
+            return;
+        }
                                 
         var xhr = this._xhrs[id] = new XMLHttpRequest();
         var self = this;
@@ -1189,6 +1203,13 @@ qq.extend(qq.UploadHandlerXhr.prototype, {
 
         xhr.onreadystatechange = function(){            
             if (xhr.readyState == 4){
+                // the server is busy, the upload is sent again later
+                if (xhr.status == 429 && self._files[id]){
+                    self._retryLater(xhr, function(){
+                        if (self._files[id]) self._upload(id, params);
+                    });
+                    return;
+                }
                 self._onComplete(id, xhr);                    
             }
         };
@@ -1206,6 +1227,125 @@ qq.extend(qq.UploadHandlerXhr.prototype, {
         xhr.setRequestHeader("X-Requested-With", "XMLHttpRequest");
         xhr.send(formData);
     },
+    /**
+     * Calls callback after the delay given with the header Retry-After
+     * (with some jitter, so waiting uploads are not sent at once)
+     */
+    _retryLater: function(xhr, callback){
+        var seconds = parseInt(xhr.getResponseHeader('Retry-After'), 10);
+        if (isNaN(seconds)) seconds = 1;
+        this.log("server busy, retry in " + seconds + "s");
+        setTimeout(callback, seconds * 1000 + Math.random() * 1000);
+    },
+    /**
+     * Id of a chunked upload, the same file (with the same params) gets the
+     * same id in order to resume the upload after a failure (or a reload)
+     */
+    _getUploadId: function(id, params){
+        var file = this._files[id],
+            key = [qq.obj2url(params, ''), this.getName(id), this.getSize(id), file.lastModified || ''].join('|'),
+            hash = 5381;
+        for (var i=0; i<key.length; i++){
+            hash = ((hash << 5) + hash + key.charCodeAt(i)) | 0;
+        }
+        return (hash >>> 0).toString(16) + '-' + this.getSize(id).toString(16);
+    },
+    /**
+     * Uploads the file in chunks (with the headers X-Upload-Id,
+     * X-Upload-Offset and X-Upload-Total). The server tells the offset for
+     * resuming the upload, failed requests are retried with a delay.
+     */
+    _uploadChunked: function(id, params){
+        var self = this,
+            file = this._files[id],
+            name = this.getName(id),
+            size = this.getSize(id),
+            uploadId = this._getUploadId(id, params || {}),
+            queryString = qq.obj2url(params || {}, this._options.action),
+            retries = 0;
+
+        function parse(xhr){
+            try {
+                return eval("(" + xhr.responseText + ")");
+            } catch(err){
+                return {};
+            }
+        }
+
+        function retry(xhr){
+            if (retries >= self._options.chunkRetries){
+                self._onComplete(id, xhr);
+                return;
+            }
+            retries++;
+            self.log("chunk failed, retry " + retries);
+            setTimeout(resume, 1000 * retries);
+        }
+
+        function open(method){
+            var xhr = self._xhrs[id] = new XMLHttpRequest();
+            xhr.open(method, queryString, true);
+            xhr.setRequestHeader("X-Requested-With", "XMLHttpRequest");
+            xhr.setRequestHeader("X-Upload-Id", uploadId);
+            return xhr;
+        }
+
+        function send(offset){
+            // the upload was cancelled
+            if (!self._files[id]) return;
+
+            var end = Math.min(offset + self._options.chunkSize, size),
+                xhr = open("POST");
+
+            xhr.upload.onprogress = function(e){
+                if (e.lengthComputable){
+                    self._loaded[id] = offset + e.loaded;
+                    self._options.onProgress(id, name, offset + e.loaded, size);
+                }
+            };
+            xhr.onreadystatechange = function(){
+                if (xhr.readyState != 4 || !self._files[id]) return;
+                var response = parse(xhr);
+                if (xhr.status == 200 && response.complete === false){
+                    retries = 0;
+                    send(response.offset);
+                } else if (xhr.status == 409 && response.offset !== undefined){
+                    send(response.offset);
+                } else if (xhr.status == 429){
+                    self._retryLater(xhr, function(){ send(offset); });
+                } else if (xhr.status == 200 || (xhr.status >= 400 && xhr.status < 500)){
+                    self._onComplete(id, xhr);
+                } else {
+                    retry(xhr);
+                }
+            };
+
+            var formData = new FormData();
+            formData.append('file', file.slice(offset, end), name);
+            formData.append('qqfile', name);
+            xhr.setRequestHeader("X-Upload-Offset", offset);
+            xhr.setRequestHeader("X-Upload-Total", size);
+            xhr.send(formData);
+        }
+
+        function resume(){
+            if (!self._files[id]) return;
+
+            var xhr = open("GET");
+            xhr.onreadystatechange = function(){
+                if (xhr.readyState != 4 || !self._files[id]) return;
+                var response = parse(xhr);
+                if (xhr.status == 200 && response.offset !== undefined){
+                    send(response.offset);
+                } else {
+                    retry(xhr);
+                }
+            };
+            xhr.send(null);
+        }
+
+        resume();
+    },
     _onComplete: function(id, xhr){
         // the request was aborted/cancelled
         if (!this._files[id]) return;
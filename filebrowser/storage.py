@@ -1,9 +1,20 @@
+import datetime
 import os
 import shutil
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from django.conf import settings
 from django.core.files.move import file_move_safe
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from filebrowser.base import FileObject
-from filebrowser.settings import DEFAULT_PERMISSIONS
+from filebrowser.settings import DEFAULT_PERMISSIONS, STORAGE_WORKERS
+
+# Maximum number of keys deleted with a single multi-object delete request
+S3_DELETE_BATCH_SIZE = 1000
 
 
 class StorageMixin:
@@ -23,6 +34,48 @@ class StorageMixin:
         """
         raise NotImplementedError()
 
+    def listdir_with_stats(self, name):
+        """
+        Lists the contents of the specified path. Returns a list of tuples
+        (name, stat) with folders first, where stat is a dict with the
+        already known attributes of the FileObject (e.g. is_folder, exists,
+        filesize, date).
+
+        The default implementation only knows whether an item is a folder.
+        Override this method if your storage can retrieve more metadata
+        with a single listing call.
+        """
+        dirs, files = self.listdir(name)
+        return [(d, {"exists": True, "is_folder": True}) for d in dirs] + [
+            (f, {"exists": True, "is_folder": False}) for f in files
+        ]
+
+    def delete_many(self, names):
+        """
+        Deletes many files at once (missing files are ignored). Returns the
+        list of names which could not be deleted.
+
+        The default implementation calls delete() concurrently (with
+        STORAGE_WORKERS threads). Override this method if your storage is
+        able to delete many files with a single request.
+        """
+        names = list(names)
+
+        def delete(name):
+            try:
+                self.delete(name)
+            except Exception:
+                return name
+
+        if len(names) < 2:
+            failed = [delete(name) for name in names]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=max(min(STORAGE_WORKERS, len(names)), 1)
+            ) as executor:
+                failed = list(executor.map(delete, names))
+        return [name for name in failed if name is not None]
+
     def move(self, old_file_name, new_file_name, allow_overwrite=False):
         """
         Moves safely a file from one location to another.
@@ -31,6 +84,19 @@ class StorageMixin:
         """
         raise NotImplementedError()
 
+    def replace(self, name, content):
+        """
+        Saves content as name, replacing an existing file. Returns the name
+        of the saved file.
+
+        The default implementation saves content with an alternate name and
+        moves the saved file with move().
+        """
+        saved_name = self.save(name, content)
+        if saved_name != name:
+            self.move(saved_name, name, allow_overwrite=True)
+        return name
+
     def makedirs(self, name):
         """
         Creates all missing directories specified by name. Analogue to os.mkdirs().
@@ -58,11 +124,77 @@ class FileSystemStorageMixin(StorageMixin):
     def isfile(self, name):
         return os.path.isfile(self.path(name))
 
+    def listdir_with_stats(self, name):
+        # One stat call per entry with os.scandir
+        dirs, files = [], []
+        with os.scandir(self.path(name)) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:  # e.g. a broken symbolic link
+                    files.append(
+                        (
+                            entry.name,
+                            {
+                                "exists": False,
+                                "is_folder": False,
+                                "filesize": None,
+                                "date": None,
+                            },
+                        )
+                    )
+                    continue
+                is_folder = stat.S_ISDIR(st.st_mode)
+                modified_time = self._datetime_from_timestamp(st.st_mtime)
+                item = (
+                    entry.name,
+                    {
+                        "exists": True,
+                        "is_folder": is_folder,
+                        "filesize": st.st_size,
+                        "date": time.mktime(modified_time.timetuple()),
+                    },
+                )
+                if is_folder:
+                    dirs.append(item)
+                else:
+                    files.append(item)
+        return dirs + files
+
     def move(self, old_file_name, new_file_name, allow_overwrite=False):
         file_move_safe(
             self.path(old_file_name), self.path(new_file_name), allow_overwrite=True
         )
 
+    def replace(self, name, content):
+        # A temporary file (e.g. an upload streamed to disk) is renamed with
+        # os.replace() if it is on the same filesystem. Otherwise, content is
+        # written once to a temporary file next to name, which then replaces
+        # name (an existing file is never left half written).
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            os.replace(content.temporary_file_path(), full_path)
+        except (AttributeError, OSError):
+            fd, temp_path = tempfile.mkstemp(
+                prefix=".%s." % os.path.basename(full_path), dir=directory
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in content.chunks():
+                        f.write(chunk)
+                os.replace(temp_path, full_path)
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
     def makedirs(self, name):
         os.makedirs(self.path(name))
 
@@ -79,54 +211,164 @@ class S3BotoStorageMixin(StorageMixin):
     def isfile(self, name):
         return self.exists(name)
 
+    def _key_name(self, name):
+        "The key name of the file name"
+        return self._encode_name(self._normalize_name(self._clean_name(name)))
+
+    def _folder_prefix(self, name):
+        "The key prefix of the folder name (with a trailing slash)"
+        prefix = self._key_name(name)
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        return prefix
+
     def isdir(self, name):
-        # That's some inefficient implementation...
-        # If there are some files having 'name' as their prefix, then
-        # the name is considered to be a directory
+        # If there are some keys having 'name/' as their prefix, then
+        # the name is considered to be a directory (a single listing call
+        # with at most one result)
         if not name:  # Empty name is a directory
             return True
 
-        if self.isfile(name):
-            return False
-
-        name = self._normalize_name(self._clean_name(name))
-        dirlist = self.bucket.list(self._encode_name(name))
+        dirlist = self.bucket.list(self._folder_prefix(name), "/")
 
         # Check whether the iterator is empty
         for item in dirlist:
             return True
         return False
 
-    def move(self, old_file_name, new_file_name, allow_overwrite=False):
+    def _datetime_from_last_modified(self, value):
+        "Modified time of a listed key, same as with get_modified_time()"
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+        if settings.USE_TZ:
+            return value
+        return timezone.make_naive(value)
+
+    def listdir_with_stats(self, name):
+        # A single listing of the folder with a delimiter (the listing is
+        # paginated by the bucket), size, modified time and etag are taken
+        # from the listed keys (instead of a request per key)
+        prefix = self._folder_prefix(name)
+        dirs, files = [], []
+        for item in self.bucket.list(prefix, "/"):
+            item_name = item.name[len(prefix) :]
+            if item_name.endswith("/"):
+                # A common prefix (or a key for an empty folder)
+                if item_name.strip("/"):
+                    # Folders have no size or modified time with S3
+                    dirs.append(
+                        (
+                            item_name.rstrip("/"),
+                            {
+                                "exists": True,
+                                "is_folder": True,
+                                "filesize": None,
+                                "date": None,
+                            },
+                        )
+                    )
+                continue
+            if not item_name:
+                continue
+            modified_time = self._datetime_from_last_modified(item.last_modified)
+            files.append(
+                (
+                    item_name,
+                    {
+                        "exists": True,
+                        "is_folder": False,
+                        "filesize": item.size,
+                        "date": time.mktime(modified_time.timetuple()),
+                        "etag": item.etag,
+                    },
+                )
+            )
+        return dirs + files
+
+    def _delete_keys(self, key_names):
+        """
+        Deletes keys with multi-object delete requests (at most
+        S3_DELETE_BATCH_SIZE keys per request). Returns the names of the keys
+        which could not be deleted.
+        """
+        key_names = list(key_names)
+        failed = []
+        for i in range(0, len(key_names), S3_DELETE_BATCH_SIZE):
+            result = self.bucket.delete_keys(
+                key_names[i : i + S3_DELETE_BATCH_SIZE], quiet=True
+            )
+            failed.extend(error.key for error in result.errors)
+        return failed
+
+    def delete_many(self, names):
+        key_names = dict((self._key_name(name), name) for name in names)
+        return [key_names[key_name] for key_name in self._delete_keys(key_names)]
 
-        if self.exists(new_file_name):
-            if allow_overwrite:
-                self.delete(new_file_name)
+    def move(self, old_file_name, new_file_name, allow_overwrite=False):
+        # Folders are moved with a server-side copy of every key with the
+        # prefix of the folder (there are no folders with S3)
+        is_folder = self.isdir(old_file_name)
+
+        if self.exists(new_file_name) or (is_folder and self.isdir(new_file_name)):
+            if not allow_overwrite:
+                raise FileExistsError(
+                    "The destination file '%s' exists and allow_overwrite is False"
+                    % new_file_name
+                )
+            if is_folder:
+                self.rmtree(new_file_name)
             else:
-                raise "The destination file '%s' exists and allow_overwrite is False" % new_file_name
-
-        old_key_name = self._encode_name(
-            self._normalize_name(self._clean_name(old_file_name))
-        )
-        new_key_name = self._encode_name(
-            self._normalize_name(self._clean_name(new_file_name))
-        )
-
-        k = self.bucket.copy_key(new_key_name, self.bucket.name, old_key_name)
-
-        if not k:
-            raise "Couldn't copy '%s' to '%s'" % (old_file_name, new_file_name)
+                self.delete(new_file_name)
 
-        self.delete(old_file_name)
+        if not is_folder:
+            k = self.bucket.copy_key(
+                self._key_name(new_file_name),
+                self.bucket.name,
+                self._key_name(old_file_name),
+            )
+            if not k:
+                raise OSError(
+                    "Couldn't copy '%s' to '%s'" % (old_file_name, new_file_name)
+                )
+            self.delete(old_file_name)
+            return
+
+        old_prefix = self._folder_prefix(old_file_name)
+        new_prefix = self._folder_prefix(new_file_name)
+        old_key_names = [item.name for item in self.bucket.list(old_prefix)]
+
+        def copy(old_key_name):
+            new_key_name = new_prefix + old_key_name[len(old_prefix) :]
+            return self.bucket.copy_key(new_key_name, self.bucket.name, old_key_name)
+
+        with ThreadPoolExecutor(
+            max_workers=max(min(STORAGE_WORKERS, len(old_key_names)), 1)
+        ) as executor:
+            copied = list(executor.map(copy, old_key_names))
+        if not all(copied):
+            raise OSError(
+                "Couldn't copy '%s' to '%s'" % (old_file_name, new_file_name)
+            )
+        # The original keys are only deleted after all keys have been copied
+        failed = self._delete_keys(old_key_names)
+        if failed:
+            raise OSError(
+                "Couldn't delete %d key(s) of '%s' (copied to '%s')"
+                % (len(failed), old_file_name, new_file_name)
+            )
 
     def makedirs(self, name):
         pass
 
     def rmtree(self, name):
-        name = self._normalize_name(self._clean_name(name))
-        dirlist = self.bucket.list(self._encode_name(name))
-        for item in dirlist:
-            item.delete()
+        # The prefix ends with a slash (rmtree("folder") must not delete
+        # "folder2"), keys are deleted in batches
+        prefix = self._folder_prefix(name)
+        failed = self._delete_keys(item.name for item in self.bucket.list(prefix))
+        if failed:
+            raise OSError("Couldn't delete %d key(s) of '%s'" % (len(failed), name))
 
     def setpermission(self, name):
         # Permissions for S3 uploads with django-storages
@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
 from django.core.files import File
 from django.template import (
@@ -13,8 +15,10 @@ from filebrowser.settings import (
     PLACEHOLDER,
     SHOW_PLACEHOLDER,
     FORCE_PLACEHOLDER,
+    VERSION_GENERATE_WORKERS,
 )
-from filebrowser.base import FileObject
+from filebrowser.base import FileObject, lookup_versions
+from filebrowser.queues import get_version_queue
 from filebrowser.sites import get_default_site
 
 
@@ -47,8 +51,13 @@ class VersionNode(Node):
         if FORCE_PLACEHOLDER or (SHOW_PLACEHOLDER and not site.storage.isfile(source)):
             source = PLACEHOLDER
         fileobject = FileObject(source, site=site)
+        queue = get_version_queue()
         try:
-            version = fileobject.version_generate(version_suffix)
+            if queue is not None and source != PLACEHOLDER:
+                # Missing versions are generated asynchronously
+                version = queue.version(fileobject, version_suffix)
+            else:
+                version = fileobject.version_generate(version_suffix)
             if self.var_name:
                 context[self.var_name] = version
             else:
@@ -93,6 +102,105 @@ def version(parser, token):
         )
 
 
+class VersionsNode(Node):
+    def __init__(self, src, suffix, var_name):
+        self.src = src
+        self.suffix = suffix
+        self.var_name = var_name
+
+    def render(self, context):
+        try:
+            version_suffix = self.suffix.resolve(context)
+            fileobjects = list(self.src.resolve(context) or [])
+        except VariableDoesNotExist:
+            context[self.var_name] = []
+            return ""
+        if version_suffix not in VERSIONS:
+            context[self.var_name] = [(fileobject, "") for fileobject in fileobjects]
+            return ""
+        site = context.get("filebrowser_site", get_default_site())
+
+        placeholder, images = [], []
+        for fileobject in fileobjects:
+            # only images have versions (folders and other files get "")
+            if fileobject.filetype != "Image":
+                continue
+            if FORCE_PLACEHOLDER or (
+                SHOW_PLACEHOLDER and not site.storage.isfile(fileobject.path)
+            ):
+                placeholder.append(fileobject)
+            else:
+                images.append(fileobject)
+        versions = {}
+        try:
+            versions, missing = lookup_versions(images, version_suffix)
+            if placeholder:
+                version = FileObject(PLACEHOLDER, site=site).version_generate(
+                    version_suffix
+                )
+                for fileobject in placeholder:
+                    versions[fileobject.path] = version
+            if missing:
+                versions.update(self.generate(missing, version_suffix))
+        except Exception:
+            if getattr(settings, "TEMPLATE_DEBUG", True):
+                raise
+        context[self.var_name] = [
+            (fileobject, versions.get(fileobject.path, ""))
+            for fileobject in fileobjects
+        ]
+        return ""
+
+    def generate(self, fileobjects, version_suffix):
+        "Generate missing versions (queued with VERSION_QUEUE or concurrently)"
+        queue = get_version_queue()
+        if queue is not None:
+            versions = {}
+            for fileobject in fileobjects:
+                queue.enqueue(fileobject, version_suffix)
+                versions[fileobject.path] = queue.replacement(fileobject, version_suffix)
+            return versions
+        if len(fileobjects) == 1:
+            fileobject = fileobjects[0]
+            return {fileobject.path: fileobject.version_generate(version_suffix, force=True)}
+        with ThreadPoolExecutor(
+            max_workers=max(VERSION_GENERATE_WORKERS, 1)
+        ) as executor:
+            results = executor.map(
+                lambda fileobject: fileobject.version_generate(version_suffix, force=True),
+                fileobjects,
+            )
+            return dict(
+                (fileobject.path, version)
+                for fileobject, version in zip(fileobjects, results)
+            )
+
+
+def versions(parser, token):
+    """
+    Retrieving (or generating) a version for many images at once.
+    {% versions fileobjects version_suffix as var_name %}
+
+    Use {% versions page.object_list 'thumbnail' as thumbnails %} in order to
+    retrieve a list of (fileobject, version) with the thumbnail version of
+    every image. The version is an empty string for files which are not
+    images.
+
+    Existing versions are looked up with a single listing of every version
+    folder, missing versions are generated concurrently.
+    Iterate the list with {% for fileobject, version in thumbnails %}.
+    """
+
+    bits = token.split_contents()
+    if len(bits) != 5:
+        raise TemplateSyntaxError("'versions' tag takes 4 arguments")
+    if bits[3] != "as":
+        raise TemplateSyntaxError("third argument to 'versions' tag must be 'as'")
+    return VersionsNode(
+        parser.compile_filter(bits[1]), parser.compile_filter(bits[2]), bits[4]
+    )
+
+
 class VersionSettingNode(Node):
     def __init__(self, version_suffix):
         if version_suffix[0] == version_suffix[-1] and version_suffix[0] in ('"', "'"):
@@ -134,4 +242,5 @@ def version_setting(parser, token):
 
 
 register.tag(version)
+register.tag(versions)
 register.tag(version_setting)
@@ -0,0 +1,222 @@
+import os
+import re
+import tempfile
+import time
+
+from django.core.cache import caches
+from django.core.files import File
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+from filebrowser.settings import UPLOAD_LIMIT, UPLOAD_LIMIT_CACHE, UPLOAD_TEMPDIR
+
+# Parts of uploads which have not been resumed within this time (in seconds)
+# are removed
+CHUNKED_UPLOAD_EXPIRE = 24 * 60 * 60
+# Seconds until an upload rejected with UPLOAD_LIMIT is retried
+UPLOAD_RETRY_AFTER = 2
+# Slots of uploads which never finished (e.g. a killed process) are freed
+# after this time (in seconds)
+UPLOAD_SLOT_TIMEOUT = 10 * 60
+
+upload_id_re = re.compile(r"^[\w-]{1,64}$")
+
+
+def get_upload_location(site):
+    """
+    Local folder for files being uploaded (within UPLOAD_TEMPDIR, on the
+    filesystem of the storage) or None if the storage has no local paths.
+    """
+    try:
+        return site.storage.path(os.path.join(UPLOAD_TEMPDIR, "incoming"))
+    except NotImplementedError:
+        return None
+
+
+class LocalTemporaryUploadedFile(TemporaryUploadedFile):
+    "A TemporaryUploadedFile within the folder location"
+
+    def __init__(
+        self, name, content_type, size, charset, content_type_extra=None, location=None
+    ):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + ext, dir=location)
+        UploadedFile.__init__(
+            self, file, name, content_type, size, charset, content_type_extra
+        )
+
+
+class LocalTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams uploaded files to a temporary file within location (instead of
+    FILE_UPLOAD_TEMP_DIR). With location on the filesystem of the storage,
+    the temporary file is renamed into its final location instead of being
+    copied.
+    """
+
+    def __init__(self, request=None, location=None):
+        super().__init__(request)
+        self.location = location
+
+    def new_file(self, *args, **kwargs):
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self.file = LocalTemporaryUploadedFile(
+            self.file_name,
+            self.content_type,
+            0,
+            self.charset,
+            self.content_type_extra,
+            location=self.location,
+        )
+
+
+def use_local_upload_handlers(request, site):
+    """
+    Replaces Django's TemporaryFileUploadHandler of request with a
+    LocalTemporaryFileUploadHandler for the storage of site (needs to be
+    called before accessing request.POST or request.FILES).
+    """
+    location = get_upload_location(site)
+    if location is None:
+        return
+    os.makedirs(location, exist_ok=True)
+    request.upload_handlers = [
+        LocalTemporaryFileUploadHandler(request, location)
+        if type(handler) is TemporaryFileUploadHandler
+        else handler
+        for handler in request.upload_handlers
+    ]
+
+
+class ChunkedUploadedFile(File):
+    """
+    The completely uploaded part file. With FileSystemStorage, save() moves
+    the part file (instead of copying it), as with Django's
+    TemporaryUploadedFile.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class ChunkedUpload:
+    """
+    A file uploaded with multiple requests (see _upload_file of
+    FileBrowserSite). Every chunk is appended to a part file within
+    UPLOAD_TEMPDIR (within the temporary directory, if the storage of the
+    site has no local paths). The size of the part file is the offset for
+    resuming the upload after a failure.
+    """
+
+    def __init__(self, site, upload_id, user=None):
+        if not upload_id_re.match(upload_id or ""):
+            raise ValueError("Invalid upload id: %r" % upload_id)
+        self.site = site
+        self.location = self.get_location(site)
+        # Uploads of different users never share a part file
+        self.path = os.path.join(
+            self.location,
+            "%s_%s.part" % (getattr(user, "pk", None) or 0, upload_id),
+        )
+
+    @staticmethod
+    def get_location(site):
+        "Folder of the part files"
+        return get_upload_location(site) or os.path.join(
+            tempfile.gettempdir(), "filebrowser_chunks"
+        )
+
+    @property
+    def offset(self):
+        "Number of bytes received so far"
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, chunk):
+        """
+        Appends an uploaded chunk (read in pieces, the chunk is never held in
+        memory as a whole) and returns the new offset.
+        """
+        if not os.path.isdir(self.location):
+            os.makedirs(self.location, exist_ok=True)
+        with open(self.path, "ab") as f:
+            for data in chunk.chunks():
+                f.write(data)
+        return self.offset
+
+    def file(self, name):
+        "The uploaded file (once all chunks have been received)"
+        return ChunkedUploadedFile(open(self.path, "rb"), name=name)
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def cleanup(self, max_age=CHUNKED_UPLOAD_EXPIRE):
+        "Removes the part files of abandoned uploads"
+        now = time.time()
+        try:
+            entries = os.scandir(self.location)
+        except OSError:
+            return
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith(".part") and (
+                        now - entry.stat().st_mtime > max_age
+                    ):
+                        os.remove(entry.path)
+                except OSError:
+                    continue
+
+
+class UploadLimit:
+    """
+    Limits the number of uploads processed at the same time for a site (see
+    UPLOAD_LIMIT). An upload occupies one of UPLOAD_LIMIT slots, which are
+    taken with cache.add() (atomic with the cache backends of Django) within
+    UPLOAD_LIMIT_CACHE.
+    """
+
+    def __init__(self, site, limit=None):
+        self.site = site
+        self.limit = limit or UPLOAD_LIMIT
+        self.slot = None
+
+    def get_slot_key(self, slot):
+        return "filebrowser:upload:%s:%s:%d" % (
+            self.site.app_name,
+            self.site.name,
+            slot,
+        )
+
+    def acquire(self):
+        "Takes a free slot, returns False if all slots are taken"
+        if not self.limit:
+            return True
+        cache = caches[UPLOAD_LIMIT_CACHE]
+        for slot in range(self.limit):
+            key = self.get_slot_key(slot)
+            if cache.add(key, 1, UPLOAD_SLOT_TIMEOUT):
+                self.slot = key
+                return True
+        return False
+
+    def release(self):
+        if self.slot is not None:
+            caches[UPLOAD_LIMIT_CACHE].delete(self.slot)
+            self.slot = None
+
+    def count(self):
+        "Number of uploads in progress"
+        if not self.limit:
+            return 0
+        keys = [self.get_slot_key(slot) for slot in range(self.limit)]
+        return len(caches[UPLOAD_LIMIT_CACHE].get_many(keys))
@@ -1,23 +1,37 @@
+import hashlib
 import math
 import os
 import re
+import sqlite3
+import threading
 import unicodedata
+import uuid
 
+from django.core.cache import caches
 from django.utils.module_loading import import_string
 from filebrowser.settings import (
     CONVERT_FILENAME,
+    DIMENSIONS_CACHE,
+    DIMENSIONS_MAX_READ,
+    EXTENSIONS,
+    LISTING_CACHE,
     NORMALIZE_FILENAME,
+    SELECT_FORMATS,
     STRICT_PIL,
     VERSION_PROCESSORS,
+    VERSIONS_CACHE,
 )
 
 if STRICT_PIL:
     from PIL import Image
+    from PIL import ImageFile
 else:
     try:
         from PIL import Image
+        from PIL import ImageFile
     except ImportError:
         import Image
+        import ImageFile
 
 
 def convert_filename(value):
@@ -123,7 +137,219 @@ def scale_and_crop(im, width=None, height=None, opts="", **kwargs):
 scale_and_crop.valid_options = ("crop", "upscale")
 
 
+def scale_and_crop_ratio(size, width=None, height=None, opts="", **kwargs):
+    """
+    The ratio used by scale_and_crop for an image of the given size
+    (1.0 if the image is not being scaled).
+    """
+    x, y = [float(v) for v in size]
+    width = float(width or 0)
+    height = float(height or 0)
+
+    if (x, y) == (width, height):
+        return 1.0
+    if "upscale" not in opts:
+        if (x < width or not width) and (y < height or not height):
+            return 1.0
+    xr = width or float(x * height / y)
+    yr = height or float(y * width / x)
+    if "crop" in opts:
+        r = max(xr / x, yr / y)
+    else:
+        r = min(xr / x, yr / y)
+    if r < 1.0 or (r > 1.0 and "upscale" in opts):
+        return r
+    return 1.0
+
+
+class ExtensionLookup:
+    """
+    Lookup tables for the filetype (as defined with EXTENSIONS) and the
+    formats (as defined with SELECT_FORMATS) of a file extension.
+    """
+
+    def __init__(self, extensions, select_formats):
+        self.filetypes = {}
+        for filetype, extension_list in extensions.items():
+            for extension in extension_list:
+                self.filetypes[extension.lower()] = filetype
+        self.formats = {}
+        for format_type, filetypes in select_formats.items():
+            for filetype in filetypes:
+                for extension in extensions.get(filetype) or []:
+                    self.formats.setdefault(extension.lower(), []).append(format_type)
+
+    def filetype(self, extension):
+        "Filetype of extension (empty string, if the extension is not defined)"
+        return self.filetypes.get(extension.lower(), "")
+
+    def format(self, extension):
+        "List of formats of extension"
+        return list(self.formats.get(extension.lower(), ()))
+
+
+_extension_lookup = None
+
+
+def get_extension_lookup():
+    "ExtensionLookup for EXTENSIONS and SELECT_FORMATS"
+    global _extension_lookup
+    if _extension_lookup is None:
+        _extension_lookup = ExtensionLookup(EXTENSIONS, SELECT_FORMATS)
+    return _extension_lookup
+
+
+def uses_default_processors():
+    "True, if versions are only processed with scale_and_crop"
+    return list(VERSION_PROCESSORS) == ["filebrowser.utils.scale_and_crop"]
+
+
 def get_modified_time(storage, path):
     if hasattr(storage, "get_modified_time"):
         return storage.get_modified_time(path)
     return storage.modified_time(path)
+
+
+def get_image_dimensions(f, max_read=None):
+    """
+    Get the dimensions of an image by only reading its header.
+
+    At most max_read bytes (defaults to DIMENSIONS_MAX_READ) are read
+    from the file. If the header is larger, the image is opened with PIL.
+    """
+    if max_read is None:
+        max_read = DIMENSIONS_MAX_READ
+    parser = ImageFile.Parser()
+    chunk_size = 1024
+    read = 0
+    while read < max_read:
+        data = f.read(min(chunk_size, max_read - read))
+        if not data:
+            break
+        read += len(data)
+        try:
+            parser.feed(data)
+        except Exception:
+            # The parser does not know the format (or fails with a
+            # specific header), let PIL read the file instead
+            break
+        if parser.image:
+            return parser.image.size
+        chunk_size *= 2
+    f.seek(0)
+    with Image.open(f) as im:
+        return im.size
+
+
+def get_dimensions_cache():
+    "The cache for image dimensions (see DIMENSIONS_CACHE)"
+    if DIMENSIONS_CACHE is None:
+        return None
+    return caches[DIMENSIONS_CACHE]
+
+
+# Version manifests expire after this time (in seconds), so versions changed
+# outside of the FileBrowser (without fb_watch) are checked again eventually
+VERSIONS_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_versions_cache():
+    "The cache for the version manifest (see VERSIONS_CACHE)"
+    if VERSIONS_CACHE is None:
+        return None
+    return caches[VERSIONS_CACHE]
+
+
+def get_versions_cache_key(site, path):
+    "The cache key for the version manifest of path"
+    return "filebrowser:versions:%s" % hashlib.md5(
+        ("%s:%s" % (site.name or "", path)).encode("utf-8")
+    ).hexdigest()
+
+
+def get_listing_cache():
+    "The cache for folder listings (see LISTING_CACHE)"
+    if LISTING_CACHE is None:
+        return None
+    return caches[LISTING_CACHE]
+
+
+def get_listing_cache_key(site, path, suffix=""):
+    "The cache key for the listing of the folder path"
+    path = path.replace("\\", "/").rstrip("/")
+    return "filebrowser:listing:%s%s" % (
+        hashlib.md5(("%s:%s" % (site.name or "", path)).encode("utf-8")).hexdigest(),
+        suffix,
+    )
+
+
+def get_listing_generation(site, path):
+    """
+    Token for the current generation of the folder path (a new token is
+    created with listing_changed or if the token is missing with the cache)
+    """
+    cache = get_listing_cache()
+    if cache is None:
+        return None
+    key = get_listing_cache_key(site, path, ":generation")
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def listing_changed(site, path):
+    "Invalidates the cached listing of the folder path"
+    cache = get_listing_cache()
+    if cache is not None:
+        cache.set(
+            get_listing_cache_key(site, path, ":generation"),
+            uuid.uuid4().hex,
+            None,
+        )
+
+
+def get_dimensions_cache_key(path, date):
+    "The cache key for the dimensions of path with modification date"
+    return "filebrowser:dimensions:%s:%s" % (
+        hashlib.md5(path.encode("utf-8")).hexdigest(),
+        date,
+    )
+
+
+# Seconds a SQLite connection waits for a lock held by another connection
+SQLITE_TIMEOUT = 30
+
+
+class SQLiteDatabase:
+    """
+    Connections to a local SQLite database shared by threads and processes
+    (one connection per thread, in WAL mode). The statements of schema
+    (CREATE ... IF NOT EXISTS) are executed with every new connection. Used
+    with SQLiteMetadataIndex, SQLiteSearchIndex and SQLiteVersionQueue.
+    """
+
+    def __init__(self, location, schema, isolation_level=""):
+        self.location = location
+        self.schema = schema
+        self.isolation_level = isolation_level
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        "One connection per thread"
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.location,
+                timeout=SQLITE_TIMEOUT,
+                isolation_level=self.isolation_level,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                connection.execute(statement)
+            connection.commit()
+            self._local.connection = connection
+        return connection
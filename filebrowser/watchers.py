@@ -0,0 +1,145 @@
+import os
+
+from filebrowser import signals
+from filebrowser.base import version_manifest_clear_path
+from filebrowser.settings import VERSIONS_BASEDIR
+
+
+class PollingWatcher:
+    """
+    Detects changes of the files and folders below path (defaults to
+    site.directory) made outside of the FileBrowser (e.g. with rsync or
+    other applications) by polling the filesystem (the storage of the site
+    needs to support path()).
+
+    A snapshot of every folder is kept in memory. Only folders with a
+    changed modification time are listed again with poll(). Files changed in
+    place (without changing their folder) are detected with full polls.
+    """
+
+    def __init__(self, site, path=None):
+        self.site = site
+        self.path = (path or site.directory).rstrip("/")
+        # folder path: (st_mtime_ns, {name: (is_folder, size, st_mtime_ns)})
+        self.folders = {}
+
+    def _scan(self, path):
+        "(st_mtime_ns, {name: (is_folder, size, st_mtime_ns)}) of a folder"
+        full_path = self.site.storage.path(path)
+        mtime = os.stat(full_path).st_mtime_ns
+        entries = {}
+        with os.scandir(full_path) as items:
+            for entry in items:
+                try:
+                    st = entry.stat()
+                except OSError:  # e.g. a broken symbolic link
+                    continue
+                is_folder = entry.is_dir()
+                entries[entry.name] = (
+                    is_folder,
+                    None if is_folder else st.st_size,
+                    None if is_folder else st.st_mtime_ns,
+                )
+        return mtime, entries
+
+    def _scan_tree(self, path):
+        "Adds snapshots of path and all folders below path"
+        visited = set()
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            try:
+                st = os.stat(self.site.storage.path(path))
+                self.folders[path] = self._scan(path)
+            except OSError:
+                continue
+            # Symbolic links creating cycles are not followed
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            for name, (is_folder, size, mtime) in self.folders[path][1].items():
+                if is_folder:
+                    stack.append(os.path.join(path, name))
+
+    def _forget_tree(self, path):
+        "Removes the snapshots of path and all folders below path"
+        prefix = path + "/"
+        for folder in [f for f in self.folders if f == path or f.startswith(prefix)]:
+            del self.folders[folder]
+
+    def start(self):
+        "Takes the initial snapshot (without reporting any changes)"
+        self.folders = {}
+        self._scan_tree(self.path)
+
+    def poll(self, full=False):
+        """
+        Returns the changes since the last poll as a list of tuples
+        (event, path, is_folder) with event being either "created",
+        "modified" or "deleted".
+
+        A created (or deleted) folder is reported once (not the items within
+        the folder). With full, all folders are listed again.
+        """
+        changes = []
+        for path in sorted(self.folders):
+            if path not in self.folders:
+                # Removed with its parent folder
+                continue
+            mtime, entries = self.folders[path]
+            try:
+                full_path = self.site.storage.path(path)
+                if not full and os.stat(full_path).st_mtime_ns == mtime:
+                    continue
+                self.folders[path] = self._scan(path)
+            except OSError:
+                # Reported with the parent folder
+                self._forget_tree(path)
+                continue
+            new_entries = self.folders[path][1]
+            for name in sorted(set(entries) | set(new_entries)):
+                item_path = os.path.join(path, name)
+                old, new = entries.get(name), new_entries.get(name)
+                if old == new:
+                    continue
+                if old and (not new or old[0] != new[0]):
+                    changes.append(("deleted", item_path, old[0]))
+                    if old[0]:
+                        self._forget_tree(item_path)
+                    old = None
+                if not new:
+                    continue
+                if not old:
+                    changes.append(("created", item_path, new[0]))
+                    if new[0]:
+                        self._scan_tree(item_path)
+                elif not new[0]:
+                    changes.append(("modified", item_path, False))
+        return changes
+
+    def notify(self, changes):
+        "Sends filebrowser_post_change for every change (see poll)"
+        for event, path, is_folder in changes:
+            signals.filebrowser_post_change.send(
+                sender=self,
+                path=path,
+                event=event,
+                is_folder=is_folder,
+                site=self.site,
+            )
+
+
+class VersionsWatcher(PollingWatcher):
+    """
+    Detects versions changed or removed outside of the FileBrowser below
+    path (defaults to VERSIONS_BASEDIR). Versions are not part of the
+    indexes, so instead of sending filebrowser_post_change, the version
+    manifests of their originals are removed (see VERSIONS_CACHE).
+    """
+
+    def __init__(self, site, path=None):
+        super().__init__(site, path or VERSIONS_BASEDIR)
+
+    def notify(self, changes):
+        for event, path, is_folder in changes:
+            version_manifest_clear_path(self.site, path, is_folder)
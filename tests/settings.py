@@ -109,3 +109,4 @@ MEDIA_URL = '/media/'
 FILEBROWSER_DIRECTORY = '_test/uploads/'
 FILEBROWSER_VERSIONS_BASEDIR = '_test/_versions/'
 FILEBROWSER_PLACEHOLDER = '_test/uploads/placeholders/testimage.jpg'
+FILEBROWSER_UPLOAD_TEMPDIR = '_test/tempfolder'
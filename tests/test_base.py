@@ -4,9 +4,10 @@ import posixpath
 import shutil
 from unittest.mock import patch
 
-from filebrowser.base import FileListing, FileObject
-from filebrowser.settings import VERSIONS
+from filebrowser.base import FileEntry, FileListing, FileObject, SortedFiles
+from filebrowser.settings import EXTENSIONS, SELECT_FORMATS, VERSIONS
 from filebrowser.sites import site
+from filebrowser.utils import ExtensionLookup, get_image_dimensions
 
 from . import FilebrowserTestCase as TestCase
 
@@ -171,6 +172,25 @@ class FileObjectAttributeTests(TestCase):
         self.assertEqual(self.F_IMAGE.aspectratio, 1.3333333333333333)
         self.assertEqual(self.F_IMAGE.orientation, 'Landscape')
 
+    def test_dimensions_header_only(self):
+        """
+        FileObject dimensions are read from the header of an image
+        """
+        with open(self.F_IMAGE.path_full, 'rb') as f:
+            self.assertEqual(get_image_dimensions(f), (1000, 750))
+            self.assertTrue(f.tell() < 870037)
+
+    @patch('filebrowser.utils.DIMENSIONS_CACHE', 'default')
+    def test_dimensions_cache(self):
+        """
+        FileObject dimensions are cached with path and date
+        """
+        self.assertEqual(FileObject(self.F_IMAGE.path, site=site).dimensions, (1000, 750))
+        with patch.object(site.storage, 'open', side_effect=AssertionError):
+            self.assertEqual(FileObject(self.F_IMAGE.path, site=site).dimensions, (1000, 750))
+            fileobject = FileObject(self.F_IMAGE.path, site=site, stat={'date': 1.0})
+            self.assertEqual(fileobject.dimensions, None)
+
     def test_folder_attributes(self):
         """
         FileObject folder attributes
@@ -347,6 +367,78 @@ class FileObjectAttributeTests(TestCase):
         self.F_IMAGE.delete_versions()
         self.assertEqual(site.storage.exists(f_version_thumb.path), False)
 
+        # delete versions of a folder (the folder within VERSIONS_BASEDIR)
+        f_version = self.F_IMAGE.version_generate("large")
+        self.assertEqual(site.storage.isdir("_test/_versions/folder"), True)
+        self.F_FOLDER.delete_versions()
+        self.assertEqual(site.storage.exists(f_version.path), False)
+        self.assertEqual(site.storage.isdir("_test/_versions/folder"), False)
+        self.assertEqual(site.storage.isdir(self.F_FOLDER.path), True)
+
+        # versions which could not be deleted are logged
+        f_version = self.F_IMAGE.version_generate("large")
+        with patch.object(site.storage, 'delete_many', return_value=[f_version.path]), \
+                self.assertLogs('filebrowser', 'ERROR') as logs:
+            self.F_IMAGE.delete_versions()
+        self.assertIn(f_version.path, logs.output[0])
+
+
+class ExtensionLookupTests(TestCase):
+
+    def tearDown(self):
+        site.extensions = EXTENSIONS
+        site.select_formats = SELECT_FORMATS
+        super(ExtensionLookupTests, self).tearDown()
+
+    def test_lookup(self):
+        lookup = ExtensionLookup({'Image': ['.jpg', '.PNG'], 'Document': ['.pdf']}, {'image': ['Image'], 'file': ['Image', 'Document'], 'missing': ['Video']})
+        self.assertEqual(lookup.filetype('.JPG'), 'Image')
+        self.assertEqual(lookup.filetype('.png'), 'Image')
+        self.assertEqual(lookup.filetype('.mov'), '')
+        self.assertEqual(lookup.format('.jpg'), ['image', 'file'])
+        self.assertEqual(lookup.format('.pdf'), ['file'])
+        self.assertEqual(lookup.format(''), [])
+
+    def test_site_extensions(self):
+        self.assertEqual(FileObject('test.pdf', site=site).filetype, 'Document')
+        self.assertEqual(FileObject('test.pdf', site=site).format, ['file', 'document'])
+
+        site.extensions = {'Image': ['.jpg'], 'Vector': ['.pdf', '.svg']}
+        site.select_formats = {'vector': ['Vector']}
+        self.assertEqual(FileObject('test.pdf', site=site).filetype, 'Vector')
+        self.assertEqual(FileObject('test.svg', site=site).format, ['vector'])
+        self.assertEqual(FileObject('test.mov', site=site).filetype, '')
+
+
+class FileEntryTests(TestCase):
+
+    def setUp(self):
+        super(FileEntryTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+
+    def test_attributes(self):
+        path = os.path.join(self.DIRECTORY, 'folder', 'testimage.jpg')
+        entry = FileEntry(path, site=site)
+        fileobject = FileObject(path, site=site)
+        for attr in ('path', 'head', 'filename', 'filename_lower', 'filename_root', 'extension', 'mimetype', 'dirname',
+                     'path_relative_directory', 'exists', 'is_folder', 'filesize', 'date', 'filetype', 'format'):
+            self.assertEqual(getattr(entry, attr), getattr(fileobject, attr), attr)
+        self.assertEqual(FileEntry(os.path.join(self.DIRECTORY, 'folder'), site=site).filetype, 'Folder')
+        self.assertFalse(hasattr(entry, '__dict__'))
+
+        with self.assertRaises(AttributeError):
+            entry.path = 'other.jpg'
+
+    def test_fileobject(self):
+        path = os.path.join(self.DIRECTORY, 'folder', 'testimage.jpg')
+        stat = {'exists': True, 'is_folder': False, 'filesize': 1, 'date': 2.0}
+        with patch.object(site.storage, 'isdir', side_effect=AssertionError), patch.object(site.storage, 'size', side_effect=AssertionError):
+            entry = FileEntry(path, site=site, stat=stat)
+            self.assertEqual((entry.filetype, entry.filesize, entry.date), ('Image', 1, 2.0))
+            fileobject = entry.fileobject()
+            self.assertIsInstance(fileobject, FileObject)
+            self.assertEqual((fileobject.path, fileobject.filesize, fileobject.date), (path, 1, 2.0))
+
 
 class FileListingTests(TestCase):
     """
@@ -416,6 +508,98 @@ class FileListingTests(TestCase):
         self.assertEqual(self.F_LISTING_FOLDER.results_listing_total(), 2)
         self.assertEqual(self.F_LISTING_FOLDER.results_listing_filtered(), 2)
 
+    def test_listing_with_stats(self):
+        """
+        FileObject listing with stats (FileSystemStorageMixin.listdir_with_stats)
+        """
+        self.assertEqual(self.F_LISTING_IMAGE.listing_with_stats(), [])
+        self.assertEqual([item for item, stat in self.F_LISTING_FOLDER.listing_with_stats()], ['folder', 'testimage.jpg'])
+
+        files = self.F_LISTING_FOLDER.files_listing_total()
+        with patch.object(site.storage, 'size', side_effect=AssertionError), \
+                patch.object(site.storage, 'exists', side_effect=AssertionError), \
+                patch.object(site.storage, 'isdir', side_effect=AssertionError), \
+                patch.object(site.storage, 'get_modified_time', side_effect=AssertionError):
+            self.assertEqual([f.is_folder for f in files], [False, True])
+            self.assertEqual([f.exists for f in files], [True, True])
+            self.assertEqual(files[0].filesize, 870037)
+            self.assertEqual(files[0].filetype, 'Image')
+            self.assertEqual(files[1].filetype, 'Folder')
+        self.assertEqual(files[0].date, FileObject(files[0].path, site=site).date)
+
+    def test_sorting(self):
+        """
+        FileListing sort_by_attr, sort_files (folders_first, aliases, cached sortings)
+        """
+        filelisting = FileListing(self.F_LISTING_FOLDER.path, sorting_order='desc', site=site)
+        self.assertEqual([f.path for f in filelisting.files_listing_total()], ['_test/uploads/testimage.jpg', '_test/uploads/folder'])
+        # the cached listing is not reversed again
+        files = filelisting.files_listing_total()
+        self.assertEqual([f.path for f in files], ['_test/uploads/testimage.jpg', '_test/uploads/folder'])
+        files.reverse()
+        self.assertEqual([f.path for f in filelisting.files_listing_total()], ['_test/uploads/testimage.jpg', '_test/uploads/folder'])
+
+        filelisting.sorting_by = 'filename_lower'
+        filelisting.folders_first = True
+        self.assertEqual([f.path for f in filelisting.files_listing_total()], ['_test/uploads/folder', '_test/uploads/testimage.jpg'])
+        self.assertEqual([f.path for f in filelisting.files_walk_total()], [
+            '_test/uploads/folder/subfolder', '_test/uploads/folder', '_test/uploads/testimage.jpg', '_test/uploads/folder/subfolder/testimage.jpg'])
+        files, total = filelisting.files_walk_limited(3)
+        self.assertEqual([f.path for f in files], [f.path for f in filelisting.files_walk_total()][:3])
+        filelisting.sorting_order = 'asc'
+        files, total = filelisting.files_walk_limited(3)
+        self.assertEqual([f.path for f in files], [f.path for f in filelisting.files_walk_total()][:3])
+
+        # folder is an alias for dirname, None is sorted last
+        seq = [FileEntry(self.DIRECTORY + path, site=site, stat={'filesize': size}) for path, size in (('b/1.jpg', 1), ('a/2.jpg', None), ('a/3.jpg', 3))]
+        self.assertEqual([f.filename for f in filelisting.sort_by_attr(seq, 'folder')], ['2.jpg', '3.jpg', '1.jpg'])
+        self.assertEqual([f.filename for f in filelisting.sort_by_attr(seq, ('filesize',))], ['1.jpg', '3.jpg', '2.jpg'])
+        self.assertEqual([f.filename for f in seq], ['1.jpg', '2.jpg', '3.jpg'])
+
+    def test_sorting_limit(self):
+        """
+        FileListing sort_files with offset and limit (partial sort), SortedFiles
+        """
+        seq = [FileEntry(os.path.join(self.DIRECTORY, 'f%02d%s' % (i, '' if i % 5 else '.jpg')), site=site,
+                         stat={'exists': True, 'is_folder': not i % 5, 'filesize': i % 7, 'date': float(i % 3)})
+               for i in range(60)]
+        filelisting = FileListing(self.DIRECTORY, site=site)
+        for sorting_by in (None, 'date', ('filesize', 'date'), 'filename_lower'):
+            for sorting_order in ('asc', 'desc'):
+                for folders_first in (False, True):
+                    filelisting.sorting_by = sorting_by
+                    filelisting.sorting_order = sorting_order
+                    filelisting.folders_first = folders_first
+                    files = filelisting.sort_files(seq)
+                    for offset, limit in ((0, 1), (0, 10), (5, 5), (50, 20)):
+                        self.assertEqual(filelisting.sort_files(seq, offset=offset, limit=limit), files[offset:offset + limit])
+
+                    sorted_files = SortedFiles(filelisting, seq)
+                    self.assertEqual(sorted_files.count(), 60)
+                    self.assertEqual(sorted_files[10:20], files[10:20])
+                    self.assertEqual(sorted_files[-1], files[-1])
+                    self.assertEqual(list(sorted_files), files)
+
+        # only the requested files are sorted with a heap
+        with patch.object(filelisting, 'sort_by_attr', side_effect=AssertionError):
+            self.assertEqual(len(filelisting.sort_files(seq, limit=10)), 10)
+
+    def test_sorting_prefetch(self):
+        """
+        FileListing sort_by_attr, storage values are fetched with a single listing per folder
+        """
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.SUBFOLDER_PATH, 'other.jpg'))
+        os.makedirs(os.path.join(self.SUBFOLDER_PATH, 'inner'))
+        seq = [FileObject(os.path.join(self.DIRECTORY, 'folder', 'subfolder', filename), site=site)
+               for filename in ('testimage.jpg', 'other.jpg', 'inner')]
+        with patch.object(site.storage, 'size', side_effect=AssertionError), \
+                patch.object(site.storage, 'exists', side_effect=AssertionError), \
+                patch.object(site.storage, 'isdir', side_effect=AssertionError), \
+                patch.object(site.storage, 'listdir_with_stats', wraps=site.storage.listdir_with_stats) as listdir:
+            files = self.F_LISTING_FOLDER.sort_by_attr(seq, ('filetype', 'filesize', 'filename'), folders_first=True)
+            self.assertEqual(listdir.call_count, 1)
+        self.assertEqual([f.filename for f in files], ['inner', 'other.jpg', 'testimage.jpg'])
+
     def test_walk(self):
         """
         FileObject walk
@@ -434,6 +618,51 @@ class FileListingTests(TestCase):
         self.assertEqual(self.F_LISTING_FOLDER.results_walk_total(), 4)
         self.assertEqual(self.F_LISTING_FOLDER.results_walk_filtered(), 4)
 
+    def test_iter_walk(self):
+        """
+        FileObject iter_walk (max_depth, filter_folder, symbolic link cycles)
+        """
+        self.assertEqual(list(self.F_LISTING_IMAGE.iter_walk()), [])
+        self.assertEqual([f.path for f in self.F_LISTING_FOLDER.iter_walk(max_depth=1)], ['_test/uploads/folder', '_test/uploads/testimage.jpg'])
+        self.assertEqual([f.path for f in self.F_LISTING_FOLDER.iter_walk(max_depth=2)], ['_test/uploads/folder/subfolder', '_test/uploads/folder', '_test/uploads/testimage.jpg'])
+        self.assertEqual([f.path for f in self.F_LISTING_FOLDER.iter_walk(filter_folder=lambda f: f.filename != 'subfolder')], ['_test/uploads/folder/subfolder', '_test/uploads/folder', '_test/uploads/testimage.jpg'])
+
+        # stop early
+        walk = self.F_LISTING_FOLDER.iter_walk()
+        self.assertEqual(next(walk).path, '_test/uploads/folder/subfolder/testimage.jpg')
+        walk.close()
+
+        # a symbolic link to a parent folder is listed, but not walked into
+        os.symlink(self.FOLDER_PATH, os.path.join(self.SUBFOLDER_PATH, 'loop'))
+        self.assertEqual(list(self.F_LISTING_FOLDER.walk()), ['folder/subfolder/loop', 'folder/subfolder/testimage.jpg', 'folder/subfolder', 'folder', 'testimage.jpg'])
+
+    def test_iter_entries(self):
+        """
+        FileListing iter_entries, files_walk_filtered with entries
+        """
+        entries = list(self.F_LISTING_FOLDER.iter_entries())
+        self.assertEqual([f.path for f in entries], [f.path for f in self.F_LISTING_FOLDER.iter_walk()])
+        self.assertTrue(all(isinstance(f, FileEntry) for f in entries))
+
+        filelisting = FileListing(self.F_LISTING_FOLDER.path, filter_func=lambda f: f.filetype == 'Image', sorting_by='filename_lower', sorting_order='desc', site=site)
+        files = filelisting.files_walk_filtered(entries=True)
+        self.assertEqual([f.path for f in files], [f.path for f in filelisting.files_walk_filtered()])
+        self.assertEqual([type(f) for f in files], [FileEntry, FileEntry])
+
+    def test_files_walk_limited(self):
+        """
+        FileObject files_walk_limited
+        """
+        files, total = self.F_LISTING_FOLDER.files_walk_limited(2)
+        self.assertEqual([f.path for f in files], ['_test/uploads/testimage.jpg', '_test/uploads/folder'])
+        self.assertEqual(total, 4)
+
+        filelisting = FileListing(self.F_LISTING_FOLDER.path, sorting_by='path', sorting_order='desc', site=site)
+        files, total = filelisting.files_walk_limited(2)
+        self.assertEqual([f.path for f in files], ['_test/uploads/testimage.jpg', '_test/uploads/folder/subfolder/testimage.jpg'])
+        self.assertEqual(total, 4)
+        self.assertEqual(filelisting.results_walk_total(), 4)
+
 
 class FileObjecNamerTests(TestCase):
 
@@ -3,8 +3,13 @@ import shutil
 import sys
 from io import StringIO
 
+from unittest.mock import patch
+
 from django.conf import settings
+from django.core.cache import caches
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from filebrowser.management.commands import fb_version_remove
 from filebrowser.settings import DIRECTORY
 from . import FilebrowserTestCase as TestCase
 
@@ -30,3 +35,64 @@ class VersionGenerateCommandTests(TestCase):
         call_command('fb_version_generate', DIRECTORY)
 
         self.assertTrue(os.path.exists(self.version_file))
+
+    def test_fb_version_generate_noinput(self):
+        out = StringIO()
+        call_command('fb_version_generate', DIRECTORY, versions='large,small', interactive=False, stdout=out)
+        self.assertTrue(os.path.exists(self.version_file))
+        self.assertTrue(os.path.exists(self.version_file.replace('_large', '_small')))
+        self.assertFalse(os.path.exists(self.version_file.replace('_large', '_medium')))
+        self.assertIn('1 image(s), 2 version(s)', out.getvalue())
+
+        # up to date versions are only generated with force
+        mtime = os.path.getmtime(self.version_file)
+        os.utime(self.version_file, (mtime + 10, mtime + 10))
+        call_command('fb_version_generate', DIRECTORY, versions='large', interactive=False, stdout=out)
+        self.assertEqual(os.path.getmtime(self.version_file), mtime + 10)
+        call_command('fb_version_generate', DIRECTORY, versions='large', interactive=False, force=True, stdout=out)
+        self.assertNotEqual(os.path.getmtime(self.version_file), mtime + 10)
+
+    def test_fb_version_generate_workers(self):
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.SUBFOLDER_PATH, 'testimage2.jpg'))
+        out = StringIO()
+        call_command('fb_version_generate', DIRECTORY, versions='large', interactive=False, workers=2, stdout=out)
+        self.assertTrue(os.path.exists(self.version_file))
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, "_test/_versions/folder/subfolder/testimage2_large.jpg")))
+        self.assertIn('2 image(s), 2 version(s)', out.getvalue())
+
+    def test_fb_version_generate_progress(self):
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.SUBFOLDER_PATH, 'testimage2.jpg'))
+        out = StringIO()
+        with patch('filebrowser.management.commands.fb_version_generate.Command.progress_every', 1):
+            call_command('fb_version_generate', DIRECTORY, versions='large', interactive=False, stdout=out)
+        self.assertRegex(out.getvalue(), r'1/2 image\(s\) processed \([\d.]+ images/s, ETA \d+:\d\d:\d\d\)')
+        self.assertRegex(out.getvalue(), r'2/2 image\(s\) processed \([\d.]+ images/s, ETA 0:00:00\)')
+
+    def test_fb_version_generate_unknown_version(self):
+        with self.assertRaises(CommandError):
+            call_command('fb_version_generate', DIRECTORY, versions='unknown', interactive=False)
+
+
+@patch('filebrowser.utils.VERSIONS_CACHE', 'default')
+class VersionRemoveCommandTests(TestCase):
+
+    def setUp(self):
+        super(VersionRemoveCommandTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        caches['default'].clear()
+
+    def test_fb_version_remove(self):
+        version = self.F_IMAGE.version_generate('large')
+        self.assertTrue(self.F_IMAGE._version_manifest())
+
+        sys.stdin = StringIO("s\nlarge\ny\n")
+        try:
+            fb_version_remove.Command(stdout=StringIO()).handle('_test/_versions')
+        finally:
+            sys.stdin = sys.__stdin__
+        self.assertFalse(os.path.exists(version.path_full))
+        self.assertEqual(self.F_IMAGE._version_manifest(), {})
+
+        # the removed version is generated again
+        self.assertEqual(self.F_IMAGE.version_generate('large').path, version.path)
+        self.assertTrue(os.path.exists(version.path_full))
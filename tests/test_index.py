@@ -0,0 +1,201 @@
+import os
+import shutil
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from filebrowser.base import FileListing
+from filebrowser.index import SQLiteMetadataIndex
+from filebrowser.sites import site
+from . import FilebrowserTestCase as TestCase
+
+
+class SQLiteMetadataIndexTests(TestCase):
+    """
+    /_test/uploads/testimage.jpg
+    /_test/uploads/folder/
+    /_test/uploads/folder/subfolder/
+    /_test/uploads/folder/subfolder/testimage.jpg
+    """
+
+    def setUp(self):
+        super(SQLiteMetadataIndexTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.SUBFOLDER_PATH)
+        shutil.copy(self.STATIC_IMG_PATH, self.DIRECTORY_PATH)
+        site.index = SQLiteMetadataIndex(site, location=os.path.join(self.TEST_PATH, 'index.sqlite3'))
+
+    def tearDown(self):
+        site.index = None
+        super(SQLiteMetadataIndexTests, self).tearDown()
+
+    def test_rebuild(self):
+        self.assertEqual(site.index.listdir(self.DIRECTORY), None)
+        self.assertEqual(site.index.rebuild(), 5)
+
+        listing = site.index.listdir(self.DIRECTORY)
+        self.assertEqual([f.path for f in listing], ['_test/uploads/folder', '_test/uploads/testimage.jpg'])
+        self.assertEqual([f.path for f in site.index.walk(self.DIRECTORY)], [
+            '_test/uploads/folder',
+            '_test/uploads/folder/subfolder',
+            '_test/uploads/folder/subfolder/testimage.jpg',
+            '_test/uploads/testimage.jpg',
+        ])
+
+    def test_rebuild_symlink_loop(self):
+        # a symbolic link to a parent folder is indexed, but not walked into
+        os.symlink(self.FOLDER_PATH, os.path.join(self.SUBFOLDER_PATH, 'loop'))
+        self.assertEqual(site.index.rebuild(), 6)
+        self.assertEqual([f.path for f in site.index.walk(self.DIRECTORY)], [
+            '_test/uploads/folder',
+            '_test/uploads/folder/subfolder',
+            '_test/uploads/folder/subfolder/loop',
+            '_test/uploads/folder/subfolder/testimage.jpg',
+            '_test/uploads/testimage.jpg',
+        ])
+        site.index.update('_test/uploads/folder')
+        self.assertEqual(len(site.index.walk(self.DIRECTORY)), 5)
+
+    def test_attributes_without_storage(self):
+        site.index.rebuild()
+        with patch.object(site.storage, 'size', side_effect=AssertionError), \
+                patch.object(site.storage, 'exists', side_effect=AssertionError), \
+                patch.object(site.storage, 'isdir', side_effect=AssertionError), \
+                patch.object(site.storage, 'open', side_effect=AssertionError):
+            folder, image = site.index.listdir(self.DIRECTORY)
+            self.assertEqual(folder.is_folder, True)
+            self.assertEqual(folder.filetype, 'Folder')
+            self.assertEqual(image.is_folder, False)
+            self.assertEqual(image.exists, True)
+            self.assertEqual(image.filetype, 'Image')
+            self.assertEqual(image.filesize, 870037)
+            self.assertEqual(image.dimensions, (1000, 750))
+            self.assertTrue(image.date)
+
+    def test_filelisting(self):
+        site.index.rebuild()
+        filelisting = FileListing(self.DIRECTORY, sorting_by='filename_lower', site=site)
+        with patch.object(site.storage, 'listdir', side_effect=AssertionError):
+            self.assertEqual([f.path for f in filelisting.files_listing_total()], ['_test/uploads/folder', '_test/uploads/testimage.jpg'])
+            self.assertEqual(filelisting.results_walk_total(), 4)
+
+    def test_filelisting_fallback(self):
+        filelisting = FileListing(self.DIRECTORY, sorting_by='filename_lower', site=site)
+        self.assertEqual([f.path for f in filelisting.files_listing_total()], ['_test/uploads/folder', '_test/uploads/testimage.jpg'])
+
+    def test_update_and_remove(self):
+        site.index.rebuild()
+        os.remove(os.path.join(self.DIRECTORY_PATH, 'testimage.jpg'))
+        site.index.update('_test/uploads/testimage.jpg')
+        self.assertEqual(site.index.get('_test/uploads/testimage.jpg'), None)
+
+        site.index.remove('_test/uploads/folder')
+        self.assertEqual(site.index.listdir(self.DIRECTORY), [])
+        self.assertEqual(site.index.listdir('_test/uploads/folder/subfolder'), None)
+
+    def test_signals(self):
+        site.index.rebuild()
+        self.client.login(username=self.user.username, password='password')
+
+        # createdir
+        self.client.post(reverse('filebrowser:fb_createdir'), {'name': 'create'})
+        self.assertEqual(site.index.listdir('_test/uploads/create'), [])
+
+        # upload
+        url = '?'.join([reverse('filebrowser:fb_do_upload'), urlencode({'folder': 'create'})])
+        with open(self.STATIC_IMG_PATH, "rb") as f:
+            self.client.post(url, data={'qqfile': 'testimage.jpg', 'file': f}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual([f.filename for f in site.index.listdir('_test/uploads/create')], ['testimage.jpg'])
+
+        # rename
+        url = '?'.join([reverse('filebrowser:fb_detail'), urlencode({'dir': 'create', 'filename': 'testimage.jpg'})])
+        self.client.post(url, {'name': 'testpic.jpg'})
+        self.assertEqual([f.filename for f in site.index.listdir('_test/uploads/create')], ['testpic.jpg'])
+
+        # delete
+        self.client.get(reverse('filebrowser:fb_delete'), {'dir': 'create', 'filename': 'testpic.jpg'})
+        self.assertEqual(site.index.listdir('_test/uploads/create'), [])
+
+    def test_query(self):
+        site.index.rebuild()
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.DIRECTORY_PATH, 'a.jpg'))
+        with open(os.path.join(self.DIRECTORY_PATH, 'b.pdf'), 'w') as f:
+            f.write('pdf')
+        site.index.update('_test/uploads/a.jpg')
+        site.index.update('_test/uploads/b.pdf')
+
+        result = site.index.query(self.DIRECTORY, sorting_by='filename_lower', sorting_order='desc')
+        self.assertEqual(result.count(), 4)
+        self.assertEqual([f.filename for f in result[1:3]], ['folder', 'b.pdf'])
+        self.assertEqual(result[0].filename, 'testimage.jpg')
+
+        result = site.index.query(self.DIRECTORY, filetypes=['Document'], sorting_by='filesize')
+        self.assertEqual([f.filename for f in result], ['b.pdf', 'folder'])
+
+        result = site.index.query(self.DIRECTORY, filter_func=lambda filename: filename != 'a.jpg', search_func=lambda filename: 'test' in filename)
+        self.assertEqual([f.filename for f in result], ['folder', 'testimage.jpg'])
+
+        result = site.index.query(self.DIRECTORY, traverse=True, filetypes=['Image'], sorting_by='path')
+        self.assertEqual([f.path for f in result], [
+            '_test/uploads/a.jpg',
+            '_test/uploads/folder',
+            '_test/uploads/folder/subfolder',
+            '_test/uploads/folder/subfolder/testimage.jpg',
+            '_test/uploads/testimage.jpg',
+        ])
+
+        # sorting by attributes which are not part of the index
+        self.assertEqual(site.index.query(self.DIRECTORY, sorting_by='mimetype'), None)
+
+    def test_query_null_order(self):
+        # NULL values are sorted as with FileListing.sort_files (last, first in reverse order)
+        with open(os.path.join(self.DIRECTORY_PATH, 'b.pdf'), 'w') as f:
+            f.write('pdf')
+        site.index.rebuild()
+        site.index.connection.execute("UPDATE filebrowser_index SET filesize = NULL WHERE filename = 'folder'")
+        site.index.connection.commit()
+        result = site.index.query(self.DIRECTORY, sorting_by='filesize', sorting_order='asc')
+        self.assertEqual([f.filename for f in result], ['b.pdf', 'testimage.jpg', 'folder'])
+        result = site.index.query(self.DIRECTORY, sorting_by='filesize', sorting_order='desc')
+        self.assertEqual([f.filename for f in result], ['folder', 'testimage.jpg', 'b.pdf'])
+
+        filelisting = FileListing(self.DIRECTORY, sorting_by='filesize', site=site)
+        items = list(result)
+        for sorting_order, reverse in (('asc', False), ('desc', True)):
+            key = filelisting._sort_key(('filesize',), reverse=reverse)
+            self.assertEqual(
+                [f.filename for f in sorted(items, key=key, reverse=reverse)],
+                [f.filename for f in site.index.query(self.DIRECTORY, sorting_by='filesize', sorting_order=sorting_order)],
+            )
+
+    def test_browse(self):
+        site.index.rebuild()
+        self.client.login(username=self.user.username, password='password')
+        url = reverse('filebrowser:fb_browse')
+
+        with patch.object(site.storage, 'listdir', side_effect=AssertionError):
+            response = self.client.get(url, {'o': 'filename_lower', 'ot': 'asc'})
+            self.assertEqual([f.filename for f in response.context['page'].object_list], ['folder', 'testimage.jpg'])
+            self.assertEqual(response.context['filelisting'].results_total, 2)
+            self.assertEqual(response.context['filelisting'].results_current, 2)
+
+            response = self.client.get(url, {'type': 'document'})
+            self.assertEqual([f.filename for f in response.context['page'].object_list], ['folder'])
+            self.assertEqual(response.context['filelisting'].results_current, 1)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('fb_index_rebuild', 'folder', stdout=out)
+        self.assertIn('3 item(s) indexed', out.getvalue())
+        self.assertEqual(site.index.listdir(self.DIRECTORY), None)
+        self.assertEqual(len(site.index.listdir('_test/uploads/folder/subfolder')), 1)
+
+    def test_command_symlink_loop(self):
+        os.symlink(self.FOLDER_PATH, os.path.join(self.SUBFOLDER_PATH, 'loop'))
+        out = StringIO()
+        call_command('fb_index_rebuild', stdout=out)
+        self.assertIn('6 item(s) indexed', out.getvalue())
+        self.assertEqual(len(site.index.listdir('_test/uploads/folder/subfolder')), 2)
+        self.assertEqual(site.index.listdir('_test/uploads/folder/subfolder/loop'), [])
@@ -0,0 +1,114 @@
+import os
+import shutil
+import threading
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.template import Context, Template
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from filebrowser.base import FileObject
+from filebrowser.queues import SQLiteVersionQueue, ThreadPoolVersionQueue
+from filebrowser.sites import site
+from filebrowser.utils import get_dimensions_cache_key
+from . import FilebrowserTestCase as TestCase
+
+
+class VersionQueueTests(TestCase):
+
+    def setUp(self):
+        super(VersionQueueTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+
+        os.makedirs(self.PLACEHOLDER_PATH)
+        shutil.copy(self.STATIC_IMG_PATH, self.PLACEHOLDER_PATH)
+
+        self.queue = SQLiteVersionQueue(location=os.path.join(self.TEST_PATH, 'queue.sqlite3'))
+
+    def render(self, obj, suffix='large'):
+        t = Template('{% load fb_versions %}{% version obj suffix %}')
+        with patch('filebrowser.templatetags.fb_versions.get_version_queue', return_value=self.queue):
+            return t.render(Context({"obj": obj, "suffix": suffix}))
+
+    def test_placeholder_on_miss(self):
+        with patch.object(self.F_IMAGE, 'version_generate', side_effect=AssertionError):
+            r = self.render(self.F_IMAGE)
+        self.assertEqual(r, os.path.join(settings.MEDIA_URL, "_test/_versions/placeholders/testimage_large.jpg"))
+        self.assertFalse(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage_large.jpg')))
+
+        # jobs are only queued once
+        self.render(self.F_IMAGE)
+        self.render(self.F_IMAGE, 'small')
+        self.assertEqual(self.queue.count(), 2)
+
+        self.assertEqual(self.queue.process(), 2)
+        self.assertEqual(self.queue.count(), 0)
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage_large.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage_small.jpg')))
+
+        # up to date versions are not queued
+        r = self.render(self.F_IMAGE)
+        self.assertEqual(r, os.path.join(settings.MEDIA_URL, "_test/_versions/folder/testimage_large.jpg"))
+        self.assertEqual(self.queue.count(), 0)
+
+    @patch('filebrowser.queues.VERSION_QUEUE_PLACEHOLDER', False)
+    def test_original_on_miss(self):
+        r = self.render(self.F_IMAGE)
+        self.assertEqual(r, os.path.join(settings.MEDIA_URL, "_test/uploads/folder/testimage.jpg"))
+        self.assertEqual(self.queue.count(), 1)
+
+    def test_thread_pool(self):
+        self.queue = ThreadPoolVersionQueue(workers=1)
+        started = threading.Event()
+        self.queue.executor.submit(started.wait)
+        future = self.queue.enqueue(self.F_IMAGE, 'large')
+        # the job is still pending
+        self.assertEqual(self.queue.enqueue(self.F_IMAGE, 'large'), None)
+        started.set()
+        future.result()
+        self.assertEqual(self.queue.pending, set())
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage_large.jpg')))
+        self.queue.executor.shutdown()
+
+    def test_command(self):
+        self.render(self.F_IMAGE)
+        out = StringIO()
+        with patch('filebrowser.management.commands.fb_version_queue.get_version_queue', return_value=self.queue):
+            call_command('fb_version_queue', once=True, stdout=out)
+        self.assertIn('1 job(s) processed in total', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage_large.jpg')))
+
+    @patch('filebrowser.queues.UPLOAD_VERSIONS', ['large', 'small'])
+    @patch('filebrowser.utils.DIMENSIONS_CACHE', 'default')
+    def test_upload_versions(self):
+        self.queue = ThreadPoolVersionQueue(workers=1)
+        self.client.login(username=self.user.username, password='password')
+        url = '?'.join([reverse('filebrowser:fb_do_upload'), urlencode({'folder': self.F_SUBFOLDER.path_relative_directory})])
+        with patch('filebrowser.queues.get_upload_queue', return_value=self.queue):
+            with patch.object(FileObject, 'versions_generate', autospec=True, side_effect=FileObject.versions_generate) as versions_generate:
+                with open(self.STATIC_IMG_PATH, "rb") as f:
+                    self.client.post(url, data={'qqfile': 'testimage.jpg', 'file': f}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                self.queue.executor.shutdown(wait=True)
+
+        # a single job for both versions
+        self.assertEqual(versions_generate.call_count, 1)
+        self.assertEqual(versions_generate.call_args[0][1], ['large', 'small'])
+        self.assertEqual(self.queue.pending, set())
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'subfolder', 'testimage_large.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'subfolder', 'testimage_small.jpg')))
+
+        # the dimensions are cached with the versions
+        fileobject = FileObject(os.path.join(self.F_SUBFOLDER.path, 'testimage.jpg'), site=site)
+        self.assertEqual(tuple(caches['default'].get(get_dimensions_cache_key(fileobject.path, fileobject.date))), (1000, 750))
+
+    @patch('filebrowser.queues.UPLOAD_VERSIONS', ['large'])
+    def test_upload_versions_temporary(self):
+        with patch('filebrowser.queues.get_upload_queue') as get_upload_queue:
+            from filebrowser.queues import upload_versions
+            upload_versions(None, file=FileObject('_test/tempfolder/testimage.jpg', site=site), site=site)
+            upload_versions(None, file=FileObject(os.path.join(self.F_SUBFOLDER.path, 'test.txt'), site=site), site=site)
+        self.assertFalse(get_upload_queue.called)
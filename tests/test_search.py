@@ -0,0 +1,144 @@
+import os
+import shutil
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from filebrowser.base import FileObject
+from filebrowser.search import SQLiteSearchIndex, required_literals, trigrams
+from filebrowser.sites import site
+from . import FilebrowserTestCase as TestCase
+
+
+class RequiredLiteralsTests(SimpleTestCase):
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('test'), {'tes', 'est'})
+        self.assertEqual(trigrams('te'), set())
+
+    def test_required_literals(self):
+        self.assertEqual(required_literals('testimage'), ['testimage'])
+        self.assertEqual(required_literals('^test.*\\.jpg$'), ['test', '.jpg'])
+        self.assertEqual(required_literals('tests?image'), ['test', 'image'])
+        self.assertEqual(required_literals('te+st'), ['te', 'st'])
+        self.assertEqual(required_literals('test[0-9]{2}image'), ['test', 'image'])
+        self.assertEqual(required_literals('test\\dimage'), ['test', 'image'])
+        # escaped characters with a code
+        self.assertEqual(required_literals('foo\\x41bar'), ['foo', 'bar'])
+        self.assertEqual(required_literals('foo\\u00e9bar'), ['foo', 'bar'])
+        self.assertEqual(required_literals('foo\\U0001F600bar'), ['foo', 'bar'])
+        self.assertEqual(required_literals('foo\\N{LATIN SMALL LETTER A}bar'), ['foo', 'bar'])
+        self.assertEqual(required_literals('foo\\012bar'), ['foo', 'bar'])
+        self.assertEqual(required_literals('foo\\0bar'), ['foo', 'bar'])
+        self.assertEqual(required_literals('foo\\1bar'), [])
+        self.assertEqual(required_literals('test|image'), [])
+        self.assertEqual(required_literals('(test)?image'), [])
+
+
+class SQLiteSearchIndexTests(TestCase):
+    """
+    /_test/uploads/testimage.jpg
+    /_test/uploads/folder/
+    /_test/uploads/folder/subfolder/
+    /_test/uploads/folder/subfolder/testimage.jpg
+    /_test/uploads/folder/subfolder/other.pdf
+    """
+
+    def setUp(self):
+        super(SQLiteSearchIndexTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.SUBFOLDER_PATH)
+        shutil.copy(self.STATIC_IMG_PATH, self.DIRECTORY_PATH)
+        with open(os.path.join(self.SUBFOLDER_PATH, 'other.pdf'), 'w') as f:
+            f.write('pdf')
+        site.search_index = SQLiteSearchIndex(site, location=os.path.join(self.TEST_PATH, 'search.sqlite3'))
+
+    def tearDown(self):
+        site.search_index = None
+        super(SQLiteSearchIndexTests, self).tearDown()
+
+    def test_search(self):
+        self.assertEqual(site.search_index.search(self.DIRECTORY, 'test'), None)
+        self.assertEqual(site.search_index.rebuild(), 6)
+        self.assertEqual(site.search_index.count(self.DIRECTORY), 5)
+
+        self.assertEqual(site.search_index.search(self.DIRECTORY, 'image'), [
+            ('_test/uploads/folder', True),
+            ('_test/uploads/folder/subfolder', True),
+            ('_test/uploads/folder/subfolder/testimage.jpg', False),
+            ('_test/uploads/testimage.jpg', False),
+        ])
+        self.assertEqual(site.search_index.search('_test/uploads/folder', 'ot.*r'), [
+            ('_test/uploads/folder/subfolder', True),
+            ('_test/uploads/folder/subfolder/other.pdf', False),
+        ])
+        self.assertEqual(site.search_index.search(self.DIRECTORY, 'test\\x69mage'), [
+            ('_test/uploads/folder', True),
+            ('_test/uploads/folder/subfolder', True),
+            ('_test/uploads/folder/subfolder/testimage.jpg', False),
+            ('_test/uploads/testimage.jpg', False),
+        ])
+        self.assertEqual(site.search_index.search(self.DIRECTORY, 'pdf|jpg', filter_func=lambda filename: filename != 'testimage.jpg'), [
+            ('_test/uploads/folder', True),
+            ('_test/uploads/folder/subfolder', True),
+            ('_test/uploads/folder/subfolder/other.pdf', False),
+        ])
+
+    def test_signals(self):
+        site.search_index.rebuild()
+        self.client.login(username=self.user.username, password='password')
+
+        # upload
+        url = '?'.join([reverse('filebrowser:fb_do_upload'), urlencode({'folder': 'folder'})])
+        with open(self.STATIC_IMG_PATH, "rb") as f:
+            self.client.post(url, data={'qqfile': 'testimage.jpg', 'file': f}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn(('_test/uploads/folder/testimage.jpg', False), site.search_index.search(self.DIRECTORY, 'testimage'))
+
+        # rename
+        url = '?'.join([reverse('filebrowser:fb_detail'), urlencode({'dir': 'folder', 'filename': 'testimage.jpg'})])
+        self.client.post(url, {'name': 'renamed.jpg'})
+        self.assertNotIn(('_test/uploads/folder/testimage.jpg', False), site.search_index.search(self.DIRECTORY, 'testimage'))
+        self.assertIn(('_test/uploads/folder/renamed.jpg', False), site.search_index.search(self.DIRECTORY, 'renamed'))
+
+        # delete
+        self.client.get(reverse('filebrowser:fb_delete'), {'dir': 'folder', 'filename': 'renamed.jpg'})
+        self.assertNotIn(('_test/uploads/folder/renamed.jpg', False), site.search_index.search(self.DIRECTORY, 'renamed'))
+
+    @patch('filebrowser.sites.SEARCH_TRAVERSE', True)
+    def test_browse(self):
+        site.search_index.rebuild()
+        self.client.login(username=self.user.username, password='password')
+        url = reverse('filebrowser:fb_browse')
+
+        with patch.object(site.storage, 'listdir', side_effect=AssertionError):
+            response = self.client.get(url, {'q': 'testimage', 'o': 'path', 'ot': 'asc'})
+        self.assertEqual([f.path for f in response.context['page'].object_list], [
+            '_test/uploads/folder',
+            '_test/uploads/folder/subfolder',
+            '_test/uploads/folder/subfolder/testimage.jpg',
+            '_test/uploads/testimage.jpg',
+        ])
+        self.assertEqual(response.context['filelisting'].results_total, 5)
+        self.assertEqual(response.context['filelisting'].results_current, 4)
+        # only the current page is turned into FileObjects
+        self.assertTrue(all(isinstance(f, FileObject) for f in response.context['page'].object_list))
+
+        # same result without the search index
+        site.search_index = None
+        response = self.client.get(url, {'q': 'testimage', 'o': 'path', 'ot': 'asc'})
+        self.assertEqual([f.path for f in response.context['page'].object_list], [
+            '_test/uploads/folder',
+            '_test/uploads/folder/subfolder',
+            '_test/uploads/folder/subfolder/testimage.jpg',
+            '_test/uploads/testimage.jpg',
+        ])
+        self.assertEqual(response.context['filelisting'].results_total, 5)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('fb_index_rebuild', stdout=out)
+        self.assertIn('6 item(s) indexed for searching', out.getvalue())
+        self.assertEqual(site.search_index.count(self.DIRECTORY), 5)
@@ -1,14 +1,21 @@
+import io
 import os
 import json
 import shutil
+import zipfile
 from unittest.mock import patch
 
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.utils.http import urlencode
 
 from filebrowser.settings import VERSIONS, DEFAULT_PERMISSIONS
-from filebrowser.base import FileObject
+from filebrowser import signals
+from filebrowser.base import FileListing, FileObject
+from filebrowser.downloads import iter_zip, zip_items
 from filebrowser.sites import site
+from filebrowser.uploads import UPLOAD_RETRY_AFTER, UploadLimit
 from . import FilebrowserTestCase as TestCase
 
 
@@ -55,6 +62,58 @@ class BrowseViewTests(TestCase):
         self.assertContains(response, '<input type="hidden" name="CKEditorFuncNum" value="1" />')
 
 
+@patch('filebrowser.utils.LISTING_CACHE', 'default')
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        super(ListingCacheTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        caches['default'].clear()
+        self.url = reverse('filebrowser:fb_browse')
+        self.client.login(username=self.user.username, password='password')
+
+    def listing(self):
+        return [f.filename for f in FileListing(self.F_FOLDER.path, sorting_by='filename', site=site).files_listing_total()]
+
+    def test_listing_cache(self):
+        self.assertEqual(self.listing(), ['subfolder', 'testimage.jpg'])
+        with patch.object(site.storage, 'listdir_with_stats', side_effect=AssertionError):
+            self.assertEqual(self.listing(), ['subfolder', 'testimage.jpg'])
+
+        # changed with the FileBrowser (without changing the modification time)
+        with patch('filebrowser.base.os.stat', side_effect=OSError):
+            version = FileListing(self.F_FOLDER.path, site=site).listing_version()
+            signals.filebrowser_post_delete.send(sender=None, path=self.F_IMAGE.path, name=self.F_IMAGE.filename, site=site)
+            self.assertNotEqual(FileListing(self.F_FOLDER.path, site=site).listing_version(), version)
+
+        # changed outside of the FileBrowser (modification time of the folder)
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.FOLDER_PATH, 'other.jpg'))
+        self.assertEqual(self.listing(), ['other.jpg', 'subfolder', 'testimage.jpg'])
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url, {'dir': 'folder'})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('no-store', response['Cache-Control'])
+
+        response = self.client.get(self.url, {'dir': 'folder'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, {'dir': 'folder', 'o': 'filesize'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # deleting a file changes the ETag
+        self.client.get(reverse('filebrowser:fb_delete'), {'dir': 'folder', 'filename': 'testimage.jpg'})
+        response = self.client.get(self.url, {'dir': 'folder'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page'].object_list), 1)
+
+    def test_no_listing_cache(self):
+        with patch('filebrowser.utils.LISTING_CACHE', None):
+            response = self.client.get(self.url, {'dir': 'folder'})
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('no-store', response['Cache-Control'])
+
+
 class CreateDirViewTests(TestCase):
     def setUp(self):
         super(CreateDirViewTests, self).setUp()
@@ -170,6 +229,30 @@ class UploadFileViewTests(TestCase):
 
         self.assertEqual(site.storage.listdir(self.F_SUBFOLDER.path), ([], ['testimage.jpg']))
 
+    @patch('filebrowser.sites.OVERWRITE_EXISTING', True)
+    def test_overwrite_existing_rename(self):
+        """
+        Uploads streamed to disk are renamed into place (without copying)
+        """
+        with open(os.path.join(self.SUBFOLDER_PATH, 'testimage.jpg'), 'wb') as f:
+            f.write(b'old')
+        url = '?'.join([self.url, urlencode({'folder': self.F_SUBFOLDER.path_relative_directory})])
+        incoming = site.storage.path(os.path.join(self.F_TEMPFOLDER.path, 'incoming'))
+
+        with self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0):
+            with patch('filebrowser.storage.os.replace', wraps=os.replace) as replace:
+                with patch.object(site.storage, 'move') as move:
+                    with open(self.STATIC_IMG_PATH, "rb") as f:
+                        self.client.post(url, data={'qqfile': 'testimage.jpg', 'file': f}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertFalse(move.called)
+        self.assertEqual(replace.call_count, 1)
+        self.assertEqual(os.path.dirname(replace.call_args[0][0]), incoming)
+        self.assertEqual(os.listdir(incoming), [])
+        self.assertEqual(site.storage.listdir(self.F_SUBFOLDER.path), ([], ['testimage.jpg']))
+        with open(self.STATIC_IMG_PATH, "rb") as f, site.storage.open(os.path.join(self.F_SUBFOLDER.path, 'testimage.jpg')) as uploaded:
+            self.assertEqual(uploaded.read(), f.read())
+
     @patch('filebrowser.sites.OVERWRITE_EXISTING', False)
     def test_overwrite_existing_false(self):
         shutil.copy(self.STATIC_IMG_PATH, self.SUBFOLDER_PATH)
@@ -211,6 +294,310 @@ class UploadFileViewTests(TestCase):
             self.assertEqual(site.storage.listdir(self.F_SUBFOLDER.path), ([], ['test_image_000.jpg']))
 
 
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        super(ChunkedUploadTests, self).setUp()
+        self.url = '?'.join([reverse('filebrowser:fb_do_upload'), urlencode({'folder': self.F_SUBFOLDER.path_relative_directory})])
+        self.client.login(username=self.user.username, password='password')
+        with open(self.STATIC_IMG_PATH, "rb") as f:
+            self.content = f.read()
+
+    def post_chunk(self, offset, length, upload_id='abc123'):
+        chunk = SimpleUploadedFile('testimage.jpg', self.content[offset:offset + length])
+        return self.client.post(
+            self.url, data={'qqfile': 'testimage.jpg', 'file': chunk},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest', HTTP_X_UPLOAD_ID=upload_id,
+            HTTP_X_UPLOAD_OFFSET=str(offset), HTTP_X_UPLOAD_TOTAL=str(len(self.content)))
+
+    def get_offset(self, upload_id='abc123'):
+        response = self.client.get(self.url, HTTP_X_UPLOAD_ID=upload_id)
+        return json.loads(response.content.decode('utf-8'))['offset']
+
+    def test_chunked_upload(self):
+        uploaded_path = os.path.join(self.F_SUBFOLDER.path, 'testimage.jpg')
+        self.assertEqual(self.get_offset(), 0)
+
+        response = self.post_chunk(0, 1000)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {'success': True, 'complete': False, 'offset': 1000})
+        self.assertFalse(site.storage.exists(uploaded_path))
+
+        # resume after a failure (the client asks for the offset)
+        self.assertEqual(self.get_offset(), 1000)
+        # a chunk which has already been received
+        response = self.post_chunk(0, 1000)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['offset'], 1000)
+
+        response = self.post_chunk(1000, len(self.content))
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['filename'], 'testimage.jpg')
+        with site.storage.open(uploaded_path) as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.get_offset(), 0)
+        self.assertEqual(os.listdir(site.storage.path(os.path.join(self.F_TEMPFOLDER.path, 'incoming'))), [])
+
+    def test_invalid(self):
+        response = self.client.get(self.url, HTTP_X_UPLOAD_ID='../secret')
+        self.assertEqual(response.status_code, 400)
+        # larger than total
+        response = self.client.post(
+            self.url, data={'file': SimpleUploadedFile('testimage.jpg', b'datadata')},
+            HTTP_X_UPLOAD_ID='abc123', HTTP_X_UPLOAD_OFFSET='0', HTTP_X_UPLOAD_TOTAL='4')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            self.url, data={'file': SimpleUploadedFile('testimage.jpg', b'data')},
+            HTTP_X_UPLOAD_ID='abc123', HTTP_X_UPLOAD_OFFSET='x', HTTP_X_UPLOAD_TOTAL='4')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_offset(), 0)
+
+
+class UploadLimitTests(TestCase):
+    def setUp(self):
+        super(UploadLimitTests, self).setUp()
+        self.url = '?'.join([reverse('filebrowser:fb_do_upload'), urlencode({'folder': self.F_SUBFOLDER.path_relative_directory})])
+        self.client.login(username=self.user.username, password='password')
+
+    def tearDown(self):
+        caches['default'].clear()
+        super(UploadLimitTests, self).tearDown()
+
+    def post(self):
+        with open(self.STATIC_IMG_PATH, "rb") as f:
+            return self.client.post(self.url, data={'qqfile': 'testimage.jpg', 'file': f}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    @patch('filebrowser.uploads.UPLOAD_LIMIT', 2)
+    def test_limit(self):
+        busy = [UploadLimit(site), UploadLimit(site)]
+        self.assertTrue(busy[0].acquire())
+        self.assertTrue(busy[1].acquire())
+        self.assertFalse(UploadLimit(site).acquire())
+        self.assertEqual(UploadLimit(site).count(), 2)
+
+        response = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(UPLOAD_RETRY_AFTER))
+        self.assertFalse(site.storage.exists(os.path.join(self.F_SUBFOLDER.path, 'testimage.jpg')))
+
+        busy[0].release()
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(site.storage.exists(os.path.join(self.F_SUBFOLDER.path, 'testimage.jpg')))
+        # the slot of the upload has been released
+        self.assertEqual(UploadLimit(site).count(), 1)
+
+    def test_no_limit(self):
+        limit = UploadLimit(site)
+        self.assertTrue(limit.acquire())
+        self.assertEqual(limit.count(), 0)
+        self.assertEqual(self.post().status_code, 200)
+
+
+class DownloadViewTests(TestCase):
+    """
+    /_test/uploads/testimage.jpg
+    /_test/uploads/folder/
+    /_test/uploads/folder/testimage.jpg
+    /_test/uploads/folder/subfolder/
+    /_test/uploads/folder/subfolder/notes.txt
+    """
+
+    def setUp(self):
+        super(DownloadViewTests, self).setUp()
+        self.url = reverse('filebrowser:fb_download')
+        self.client.login(username=self.user.username, password='password')
+        shutil.copy(self.STATIC_IMG_PATH, self.DIRECTORY_PATH)
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        with open(os.path.join(self.SUBFOLDER_PATH, 'notes.txt'), 'w') as f:
+            f.write('notes ' * 1000)
+
+    def get_archive(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_folder(self):
+        response = self.client.get(self.url, {'dir': 'folder'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="folder.zip"')
+        archive = self.get_archive(response)
+        self.assertEqual(sorted(archive.namelist()), ['subfolder/notes.txt', 'testimage.jpg'])
+        self.assertIsNone(archive.testzip())
+        # images are stored (already compressed), other files are deflated
+        self.assertEqual(archive.getinfo('testimage.jpg').compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(archive.getinfo('subfolder/notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+        with open(self.STATIC_IMG_PATH, 'rb') as f:
+            self.assertEqual(archive.read('testimage.jpg'), f.read())
+        self.assertEqual(archive.read('subfolder/notes.txt'), b'notes ' * 1000)
+
+    def test_selection(self):
+        response = self.client.get(self.url, {'selected': ['testimage.jpg', 'folder', 'missing.jpg']})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="uploads.zip"')
+        archive = self.get_archive(response)
+        self.assertEqual(sorted(archive.namelist()), ['folder/subfolder/notes.txt', 'folder/testimage.jpg', 'testimage.jpg'])
+
+        response = self.client.get(self.url, {'dir': 'folder', 'filename': 'subfolder'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="subfolder.zip"')
+        self.assertEqual(self.get_archive(response).namelist(), ['subfolder/notes.txt'])
+
+        response = self.client.get(self.url, {'selected': ['../secret']})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('filebrowser.sites.EXCLUDE', [r'\.excluded$'])
+    def test_filtered(self):
+        # files which are not shown with the browse view are not downloaded
+        with open(os.path.join(self.FOLDER_PATH, '.hidden.txt'), 'w') as f:
+            f.write('hidden')
+        with open(os.path.join(self.SUBFOLDER_PATH, 'notes.excluded'), 'w') as f:
+            f.write('excluded')
+        os.makedirs(os.path.join(self.FOLDER_PATH, '.git'))
+        with open(os.path.join(self.FOLDER_PATH, '.git', 'config'), 'w') as f:
+            f.write('config')
+        response = self.client.get(self.url, {'dir': 'folder'})
+        self.assertEqual(sorted(self.get_archive(response).namelist()), ['subfolder/notes.txt', 'testimage.jpg'])
+        response = self.client.get(self.url, {'dir': 'folder/subfolder', 'filename': 'notes.excluded'})
+        self.assertEqual(self.get_archive(response).namelist(), [])
+
+    @patch('filebrowser.downloads.ZIP_CHUNK_SIZE', 1024)
+    def test_streaming(self):
+        pieces = list(iter_zip(site, zip_items(site, self.F_FOLDER.path)))
+        # the archive is yielded while the files are read
+        self.assertGreater(len(pieces), 10)
+        self.assertLess(max(len(piece) for piece in pieces), 2048)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(pieces)))
+        self.assertIsNone(archive.testzip())
+
+
+class BulkActionViewTests(TestCase):
+    """
+    /_test/uploads/folder/image_0.jpg ... image_4.jpg
+    /_test/uploads/folder/notes.txt
+    /_test/uploads/folder/subfolder/
+    """
+
+    def setUp(self):
+        super(BulkActionViewTests, self).setUp()
+        self.url = reverse('filebrowser:fb_bulk_action') + '?' + urlencode({'dir': 'folder'})
+        self.client.login(username=self.user.username, password='password')
+        self.names = ['image_%d.jpg' % i for i in range(5)]
+        for name in self.names:
+            shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.FOLDER_PATH, name))
+        with open(os.path.join(self.FOLDER_PATH, 'notes.txt'), 'w') as f:
+            f.write('notes')
+        self.size = FileObject(os.path.join(self.F_FOLDER.path, self.names[0]), site=site).dimensions
+        self.signals = []
+        signals.filebrowser_actions_pre_apply.connect(self.pre_apply)
+        signals.filebrowser_actions_post_apply.connect(self.post_apply)
+
+    def tearDown(self):
+        signals.filebrowser_actions_pre_apply.disconnect(self.pre_apply)
+        signals.filebrowser_actions_post_apply.disconnect(self.post_apply)
+        super(BulkActionViewTests, self).tearDown()
+
+    def pre_apply(self, sender, action_name, fileobject, site, **kwargs):
+        self.signals.append(('pre', action_name, sorted(f.filename for f in fileobject)))
+
+    def post_apply(self, sender, action_name, fileobject, site, result, **kwargs):
+        self.signals.append(('post', action_name, sorted(f.filename for f in fileobject)))
+
+    def assertRotated(self, names):
+        for name in names:
+            fileobject = FileObject(os.path.join(self.F_FOLDER.path, name), site=site)
+            self.assertEqual(fileobject.dimensions, self.size[::-1])
+
+    @patch('filebrowser.sites.ACTION_BATCH_SIZE', 2)
+    def test_redirect(self):
+        response = self.client.post(self.url, {
+            'action': 'rotate_90_clockwise',
+            'selected': self.names + ['notes.txt', 'subfolder', 'missing.jpg'],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse('filebrowser:fb_browse') + '?dir=folder')
+        self.assertRotated(self.names)
+        # the signals are sent once per batch (files the action does not apply to are skipped)
+        pre = [names for signal, action_name, names in self.signals if signal == 'pre']
+        post = [names for signal, action_name, names in self.signals if signal == 'post']
+        self.assertEqual([len(names) for names in pre], [2, 2, 1])
+        self.assertEqual(sorted(sum(pre, [])), self.names)
+        self.assertEqual(sorted(post), sorted(pre))
+
+        response = self.client.post(self.url, {'action': 'rotate_90_clockwise', 'selected': ['notes.txt']})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(self.signals), 6)
+
+    @patch('filebrowser.sites.ACTION_BATCH_SIZE', 2)
+    def test_messages(self):
+        # messages added by the action on the pool threads are kept
+        response = self.client.post(self.url, {
+            'action': 'rotate_90_clockwise',
+            'selected': self.names,
+        }, follow=True)
+        self.assertEqual(
+            sorted(str(m) for m in response.context['messages']),
+            ["Action applied successfully to '%s'" % name for name in self.names],
+        )
+
+    @patch('filebrowser.sites.ACTION_BATCH_SIZE', 1)
+    def test_streaming(self):
+        response = self.client.post(self.url, {
+            'action': 'rotate_90_clockwise',
+            'selected': self.names + ['notes.txt'],
+        }, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        results = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([result['done'] for result in results], [1, 2, 3, 4, 5])
+        self.assertEqual({result['total'] for result in results}, {5})
+        self.assertEqual(sorted(result['filename'] for result in results), self.names)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(
+            sorted(sum((result['messages'] for result in results), [])),
+            ["Action applied successfully to '%s'" % name for name in self.names],
+        )
+        self.assertRotated(self.names)
+        self.assertEqual(len(self.signals), 10)
+
+    def test_failure(self):
+        def fail_on_second(request, fileobjects):
+            if any(f.filename == 'image_1.jpg' for f in fileobjects):
+                raise OSError('Failed')
+
+        site.add_action(fail_on_second)
+        try:
+            with patch('filebrowser.sites.ACTION_BATCH_SIZE', 1), self.assertLogs('filebrowser', 'ERROR'):
+                response = self.client.post(self.url, {
+                    'action': 'fail_on_second',
+                    'selected': self.names,
+                }, HTTP_ACCEPT='application/x-ndjson')
+                results = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+                self.assertEqual([r['filename'] for r in results if not r['success']], ['image_1.jpg'])
+                # no post_apply for the failed batch
+                self.assertEqual(len([s for s in self.signals if s[0] == 'pre']), 5)
+                self.assertEqual(len([s for s in self.signals if s[0] == 'post']), 4)
+
+                response = self.client.post(self.url, {'action': 'fail_on_second', 'selected': ['image_1.jpg']}, follow=True)
+                self.assertIn('Action failed for image_1.jpg', [str(m) for m in response.context['messages']])
+        finally:
+            site.disable_action('fail_on_second')
+            del site._global_actions['fail_on_second']
+
+    def test_invalid(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 405)
+        response = self.client.post(self.url, {'action': 'missing', 'selected': self.names})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {'action': 'rotate_90_clockwise', 'selected': ['../testimage.jpg']})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.signals, [])
+
+    def test_listing(self):
+        response = self.client.get(reverse('filebrowser:fb_browse'), {'dir': 'folder'})
+        self.assertContains(response, 'name="selected" value="image_0.jpg"')
+        self.assertContains(response, reverse('filebrowser:fb_bulk_action'))
+        response = self.client.get(reverse('filebrowser:fb_browse'), {'dir': 'folder', 'pop': '1'})
+        self.assertNotContains(response, 'name="selected"')
+
+
 class DetailViewTests(TestCase):
     def setUp(self):
         super(DetailViewTests, self).setUp()
@@ -0,0 +1,208 @@
+import hashlib
+import posixpath
+import time
+from types import SimpleNamespace
+
+from django.core.files.storage import Storage
+from django.test import SimpleTestCase, override_settings
+
+from filebrowser.base import FileListing
+from filebrowser.storage import S3BotoStorageMixin
+
+
+class FakeKey:
+    def __init__(self, bucket, name, content=b''):
+        self.bucket = bucket
+        self.name = name
+        self.size = len(content)
+        self.etag = '"%s"' % hashlib.md5(content).hexdigest()
+        self.last_modified = '2024-05-01T10:00:00.000Z'
+
+    def delete(self):
+        self.bucket.requests.append(('delete', self.name))
+        del self.bucket.keys[self.name]
+
+
+class FakePrefix:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeDeleteError:
+    def __init__(self, key):
+        self.key = key
+
+
+class FakeBucket:
+    """
+    In-memory bucket with the parts of the boto API used with
+    S3BotoStorageMixin (every request is recorded).
+    """
+    name = 'bucket'
+
+    def __init__(self, names):
+        self.keys = {}
+        self.requests = []
+        self.failing = set()
+        for name in names:
+            self.keys[name] = FakeKey(self, name, name.encode('utf-8'))
+
+    def list(self, prefix='', delimiter=''):
+        self.requests.append(('list', prefix, delimiter))
+        prefixes = set()
+        for name in sorted(self.keys):
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                common_prefix = prefix + rest[:rest.index(delimiter) + 1]
+                if common_prefix not in prefixes:
+                    prefixes.add(common_prefix)
+                    yield FakePrefix(common_prefix)
+                continue
+            yield self.keys[name]
+
+    def delete_keys(self, key_names, quiet=False):
+        self.requests.append(('delete_keys', len(key_names)))
+        errors = []
+        for name in key_names:
+            if name in self.failing:
+                errors.append(FakeDeleteError(name))
+            else:
+                self.keys.pop(name, None)
+        return SimpleNamespace(deleted=[], errors=errors)
+
+    def copy_key(self, new_key_name, src_bucket_name, src_key_name):
+        self.requests.append(('copy', src_key_name, new_key_name))
+        if src_key_name not in self.keys:
+            return None
+        key = FakeKey(self, new_key_name)
+        key.size = self.keys[src_key_name].size
+        self.keys[new_key_name] = key
+        return key
+
+
+class FakeS3Storage(S3BotoStorageMixin, Storage):
+    location = 'media'
+
+    def __init__(self, names):
+        self.bucket = FakeBucket(names)
+
+    def _clean_name(self, name):
+        return name.replace('\\', '/')
+
+    def _normalize_name(self, name):
+        return posixpath.join(self.location, name)
+
+    def _encode_name(self, name):
+        return name
+
+    def exists(self, name):
+        self.bucket.requests.append(('head', name))
+        return self._normalize_name(name) in self.bucket.keys
+
+    def delete(self, name):
+        self.bucket.requests.append(('delete', name))
+        self.bucket.keys.pop(self._normalize_name(name), None)
+
+    def size(self, name):
+        self.bucket.requests.append(('head', name))
+        return self.bucket.keys[self._normalize_name(name)].size
+
+
+class S3BotoStorageMixinTests(SimpleTestCase):
+
+    def setUp(self):
+        self.storage = FakeS3Storage([
+            'media/uploads/a.jpg',
+            'media/uploads/folder/',
+            'media/uploads/folder/b.pdf',
+            'media/uploads/folder/subfolder/c.jpg',
+            'media/uploads/folder2.txt',
+        ])
+        self.site = SimpleNamespace(name='s3', storage=self.storage, directory='uploads/')
+
+    def test_isdir(self):
+        self.assertTrue(self.storage.isdir(''))
+        self.assertTrue(self.storage.isdir('uploads/folder'))
+        self.assertTrue(self.storage.isdir('uploads/folder/'))
+        self.assertFalse(self.storage.isdir('uploads/fold'))
+        self.assertFalse(self.storage.isdir('uploads/a.jpg'))
+        # a single listing without HEAD requests
+        self.assertEqual([request[0] for request in self.storage.bucket.requests], ['list'] * 4)
+
+    @override_settings(USE_TZ=True)
+    def test_listdir_with_stats(self):
+        self.assertEqual(self.storage.listdir_with_stats('uploads/folder'), [
+            ('subfolder', {'exists': True, 'is_folder': True, 'filesize': None, 'date': None}),
+            ('b.pdf', {
+                'exists': True,
+                'is_folder': False,
+                'filesize': len('media/uploads/folder/b.pdf'),
+                'date': time.mktime((2024, 5, 1, 10, 0, 0, 2, 122, 0)),
+                'etag': '"%s"' % hashlib.md5(b'media/uploads/folder/b.pdf').hexdigest(),
+            }),
+        ])
+        self.assertEqual(self.storage.bucket.requests, [('list', 'media/uploads/folder/', '/')])
+
+    def test_filelisting(self):
+        filelisting = FileListing('uploads/', sorting_by='filesize', sorting_order='asc', site=self.site)
+        files = filelisting.files_listing_total()
+        self.assertEqual([(f.filename, f.is_folder, f.filesize) for f in files], [
+            ('a.jpg', False, 19), ('folder2.txt', False, 25), ('folder', True, None)])
+        self.assertEqual(files[0].etag, self.storage.bucket.keys['media/uploads/a.jpg'].etag)
+        self.assertTrue(files[0].date)
+        # isdir (listing of uploads/) and the listing itself, no HEAD requests per key
+        self.assertEqual([request[0] for request in self.storage.bucket.requests], ['list', 'list'])
+
+    def test_delete_many(self):
+        names = ['uploads/many/%d.jpg' % i for i in range(2500)]
+        for name in names:
+            self.storage.bucket.keys['media/' + name] = FakeKey(self.storage.bucket, 'media/' + name)
+        self.storage.bucket.failing.add('media/uploads/many/7.jpg')
+        self.assertEqual(self.storage.delete_many(names + ['uploads/missing.jpg']), ['uploads/many/7.jpg'])
+        self.assertEqual(self.storage.bucket.requests, [('delete_keys', 1000), ('delete_keys', 1000), ('delete_keys', 501)])
+        self.assertEqual([k for k in self.storage.bucket.keys if '/many/' in k], ['media/uploads/many/7.jpg'])
+
+    def test_rmtree(self):
+        self.storage.rmtree('uploads/folder')
+        self.assertEqual(sorted(self.storage.bucket.keys), ['media/uploads/a.jpg', 'media/uploads/folder2.txt'])
+        self.assertEqual(self.storage.bucket.requests, [('list', 'media/uploads/folder/', ''), ('delete_keys', 3)])
+
+    def test_move(self):
+        self.storage.move('uploads/a.jpg', 'uploads/b.jpg')
+        self.assertIn('media/uploads/b.jpg', self.storage.bucket.keys)
+        self.assertNotIn('media/uploads/a.jpg', self.storage.bucket.keys)
+        with self.assertRaises(FileExistsError):
+            self.storage.move('uploads/b.jpg', 'uploads/folder2.txt')
+        self.storage.move('uploads/b.jpg', 'uploads/folder2.txt', allow_overwrite=True)
+        self.assertEqual(sorted(self.storage.bucket.keys), [
+            'media/uploads/folder/',
+            'media/uploads/folder/b.pdf',
+            'media/uploads/folder/subfolder/c.jpg',
+            'media/uploads/folder2.txt',
+        ])
+
+    def test_move_folder(self):
+        self.storage.move('uploads/folder', 'uploads/moved')
+        self.assertEqual(sorted(self.storage.bucket.keys), [
+            'media/uploads/a.jpg',
+            'media/uploads/folder2.txt',
+            'media/uploads/moved/',
+            'media/uploads/moved/b.pdf',
+            'media/uploads/moved/subfolder/c.jpg',
+        ])
+        self.assertEqual(self.storage.bucket.keys['media/uploads/moved/b.pdf'].size, len('media/uploads/folder/b.pdf'))
+        # server-side copies and a single delete request (no downloads)
+        self.assertEqual(sorted(set(request[0] for request in self.storage.bucket.requests)), ['copy', 'delete_keys', 'head', 'list'])
+        self.assertIn(('delete_keys', 3), self.storage.bucket.requests)
+        with self.assertRaises(FileExistsError):
+            self.storage.move('uploads/moved', 'uploads/moved/subfolder')
+
+    def test_move_folder_failed_delete(self):
+        self.storage.bucket.failing.add('media/uploads/folder/b.pdf')
+        with self.assertRaises(OSError):
+            self.storage.move('uploads/folder', 'uploads/moved')
+        # copied, but the key which could not be deleted is still in place
+        self.assertIn('media/uploads/moved/b.pdf', self.storage.bucket.keys)
+        self.assertIn('media/uploads/folder/b.pdf', self.storage.bucket.keys)
@@ -3,11 +3,15 @@ import shutil
 from unittest.mock import patch
 
 from django.conf import settings
+from django.core.cache import caches
 from django.template import Context, Template, TemplateSyntaxError
+from django.test import override_settings
 
-from filebrowser.settings import STRICT_PIL
-from filebrowser import utils
-from filebrowser.utils import scale_and_crop, process_image
+from filebrowser.base import FileObject
+from filebrowser.settings import STRICT_PIL, VERSIONS
+from filebrowser import signals, utils
+from filebrowser.sites import site
+from filebrowser.utils import scale_and_crop, scale_and_crop_ratio, process_image
 from . import FilebrowserTestCase as TestCase
 
 if STRICT_PIL:
@@ -29,6 +33,10 @@ def processor_mark_2(im, **kwargs):
     return im
 
 
+def processor_unchanged(im, **kwargs):
+    return None
+
+
 class ImageProcessorsTests(TestCase):
     def setUp(self):
         super(ImageProcessorsTests, self).setUp()
@@ -167,6 +175,240 @@ class ScaleAndCropTests(TestCase):
         self.assertEqual(version.size, (500, 375))
 
 
+class VersionsGenerateTests(TestCase):
+    def setUp(self):
+        super(VersionsGenerateTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+
+    def test_scale_and_crop_ratio(self):
+        self.assertEqual(scale_and_crop_ratio((1000, 750), 500, "", ""), 0.5)
+        self.assertEqual(scale_and_crop_ratio((1000, 750), 60, 60, "crop"), 0.08)
+        self.assertEqual(scale_and_crop_ratio((1000, 750), 1500, "", ""), 1.0)
+        self.assertEqual(scale_and_crop_ratio((1000, 750), 1500, "", "upscale"), 1.5)
+
+    def test_versions_generate(self):
+        storage_open = site.storage.open
+        with patch.object(site.storage, 'open', side_effect=storage_open) as mock_open:
+            versions = self.F_IMAGE.versions_generate(list(VERSIONS))
+        self.assertEqual(mock_open.call_count, 1)
+
+        self.assertEqual(sorted(versions), sorted(VERSIONS))
+        for version_suffix, version in versions.items():
+            self.assertEqual(version.path, self.F_IMAGE.version_path(version_suffix))
+            self.assertTrue(version.exists)
+            width, height = Image.open(version.path_full).size
+            expected = process_image(Image.open(self.F_IMAGE.path_full), VERSIONS[version_suffix]).size
+            # decoding a reduced image may change the size by one pixel
+            self.assertAlmostEqual(width, expected[0], delta=1)
+            self.assertAlmostEqual(height, expected[1], delta=1)
+
+        # versions are up to date
+        with patch.object(site.storage, 'open', side_effect=AssertionError):
+            versions = self.F_IMAGE.versions_generate(['large', 'small'])
+        self.assertEqual(versions['large'].path, self.F_IMAGE.version_path('large'))
+
+    @patch('filebrowser.utils.VERSION_PROCESSORS', [
+        'filebrowser.utils.scale_and_crop',
+        'tests.test_versions.processor_mark_1',
+    ])
+    def test_versions_generate_custom_processors(self):
+        utils._default_processors = None
+        try:
+            versions = self.F_IMAGE.versions_generate(['large', 'small'])
+        finally:
+            utils._default_processors = None
+        self.assertEqual(Image.open(versions['large'].path_full).size, (680, 511))
+        self.assertEqual(Image.open(versions['small'].path_full).size, (140, 106))
+
+    @patch('filebrowser.utils.VERSION_PROCESSORS', [
+        'tests.test_versions.processor_unchanged',
+    ])
+    def test_versions_generate_unchanged(self):
+        # processors returning None leave the image unchanged
+        utils._default_processors = None
+        try:
+            versions = self.F_IMAGE.versions_generate(['large'])
+        finally:
+            utils._default_processors = None
+        self.assertEqual(Image.open(versions['large'].path_full).size, Image.open(self.F_IMAGE.path_full).size)
+
+
+@patch('filebrowser.utils.VERSIONS_CACHE', 'default')
+class VersionsCacheTests(TestCase):
+    def setUp(self):
+        super(VersionsCacheTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        caches['default'].clear()
+
+    def render(self):
+        t = Template('{% load fb_versions %}{% version obj.path "large" %}')
+        return t.render(Context({"obj": self.F_IMAGE}))
+
+    def test_warm_render(self):
+        url = os.path.join(settings.MEDIA_URL, "_test/_versions/folder/testimage_large.jpg")
+        self.assertEqual(self.render(), url)
+        with patch.object(site.storage, 'isfile', side_effect=AssertionError), \
+                patch.object(site.storage, 'get_modified_time', side_effect=AssertionError):
+            self.assertEqual(self.render(), url)
+            self.assertEqual(self.F_IMAGE.versions_generate(['large'])['large'].path, self.F_IMAGE.version_path('large'))
+
+    def test_manifest(self):
+        self.F_IMAGE.versions_generate(['large', 'small'])
+        manifest = self.F_IMAGE._version_manifest()
+        self.assertEqual(sorted(manifest), [self.F_IMAGE.version_path('large'), self.F_IMAGE.version_path('small')])
+        self.assertEqual(manifest[self.F_IMAGE.version_path('large')], FileObject(self.F_IMAGE.path, site=site).date)
+
+        # a different date of the original is checked with the storage
+        fileobject = FileObject(self.F_IMAGE.path, site=site, stat={'date': 1.0})
+        with patch.object(site.storage, 'isfile', return_value=False) as mock_isfile:
+            self.assertTrue(fileobject._version_outdated(self.F_IMAGE.version_path('large')))
+        self.assertEqual(mock_isfile.call_count, 1)
+
+    def test_invalidation(self):
+        self.F_IMAGE.version_generate('large')
+        self.assertTrue(self.F_IMAGE._version_manifest())
+        self.F_IMAGE.delete_versions()
+        self.assertEqual(self.F_IMAGE._version_manifest(), {})
+        self.assertFalse(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage_large.jpg')))
+
+        # the version is generated again
+        self.render()
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage_large.jpg')))
+
+        for signal, kwargs in [
+            (signals.filebrowser_post_upload, {'path': 'folder', 'file': self.F_IMAGE}),
+            (signals.filebrowser_post_delete, {'path': self.F_IMAGE.path, 'name': self.F_IMAGE.filename}),
+            (signals.filebrowser_post_rename, {'path': self.F_IMAGE.path, 'name': self.F_IMAGE.filename, 'new_name': 'new.jpg'}),
+        ]:
+            self.F_IMAGE.version_generate('large')
+            self.assertTrue(self.F_IMAGE._version_manifest())
+            signal.send(sender=None, site=site, **kwargs)
+            self.assertEqual(self.F_IMAGE._version_manifest(), {})
+
+    def test_version_changed(self):
+        version = self.F_IMAGE.version_generate('large')
+        self.assertTrue(self.F_IMAGE._version_manifest())
+        # a version deleted outside of the FileBrowser (see fb_watch)
+        os.remove(version.path_full)
+        signals.filebrowser_post_change.send(sender=None, path=version.path, event='deleted', is_folder=False, site=site)
+        self.assertEqual(self.F_IMAGE._version_manifest(), {})
+        self.F_IMAGE.version_generate('large')
+        self.assertTrue(os.path.exists(version.path_full))
+
+    def test_timeout(self):
+        with patch.object(caches['default'], 'set', wraps=caches['default'].set) as mock_set:
+            self.F_IMAGE.version_generate('large')
+        self.assertEqual(mock_set.call_args.args[2], utils.VERSIONS_CACHE_TIMEOUT)
+
+
+class StorageWithoutStats:
+    "A storage without listdir_with_stats (no StorageMixin)"
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getattr__(self, name):
+        if name == 'listdir_with_stats':
+            raise AttributeError(name)
+        return getattr(self.storage, name)
+
+
+class VersionsTemplateTagTests(TestCase):
+    """Test the versions tag
+
+    Eg:
+    {% versions fileobjects "large" as var %}
+
+    """
+
+    def setUp(self):
+        super(VersionsTemplateTagTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.FOLDER_PATH, 'testimage2.jpg'))
+        with open(os.path.join(self.FOLDER_PATH, 'testfile.pdf'), 'w') as f:
+            f.write('pdf')
+
+        os.makedirs(self.PLACEHOLDER_PATH)
+        shutil.copy(self.STATIC_IMG_PATH, self.PLACEHOLDER_PATH)
+
+        self.fileobjects = [
+            self.F_IMAGE,
+            FileObject(os.path.join(self.DIRECTORY, 'folder', 'testimage2.jpg'), site=site),
+            FileObject(os.path.join(self.DIRECTORY, 'folder', 'testfile.pdf'), site=site),
+        ]
+
+    def render(self, fileobjects):
+        t = Template('{% load fb_versions %}{% versions fileobjects "large" as large_versions %}{% for fileobject, version in large_versions %}{{ version.path }};{% endfor %}')
+        c = Context({"fileobjects": fileobjects})
+        return t.render(c), c['large_versions']
+
+    def test_wrong_token(self):
+        self.assertRaises(TemplateSyntaxError, lambda: Template('{% load fb_versions %}{% versions fileobjects "large" %}'))
+        self.assertRaises(TemplateSyntaxError, lambda: Template('{% load fb_versions %}{% versions fileobjects "large" to var %}'))
+
+    def test_versions(self):
+        r, large_versions = self.render(self.fileobjects)
+        self.assertEqual(r, "_test/_versions/folder/testimage_large.jpg;_test/_versions/folder/testimage2_large.jpg;;")
+        self.assertEqual([fileobject for fileobject, version in large_versions], self.fileobjects)
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage_large.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, 'folder', 'testimage2_large.jpg')))
+
+        # existing versions are found with a single listing
+        fileobjects = [FileObject(f.path, site=site) for f in self.fileobjects]
+        listdir_with_stats = site.storage.listdir_with_stats
+        with patch.object(site.storage, 'listdir_with_stats', side_effect=listdir_with_stats) as mock_listdir, \
+                patch.object(site.storage, 'isfile', side_effect=AssertionError), \
+                patch.object(site.storage, 'open', side_effect=AssertionError):
+            r, large_versions = self.render(fileobjects)
+        self.assertEqual(mock_listdir.call_count, 1)
+        self.assertEqual(r, "_test/_versions/folder/testimage_large.jpg;_test/_versions/folder/testimage2_large.jpg;;")
+
+    def test_storage_without_stats(self):
+        self.render(self.fileobjects)
+        with patch.object(site, 'storage', StorageWithoutStats(site.storage)):
+            fileobjects = [FileObject(f.path, site=site) for f in self.fileobjects]
+            r, large_versions = self.render(fileobjects)
+        self.assertEqual(r, "_test/_versions/folder/testimage_large.jpg;_test/_versions/folder/testimage2_large.jpg;;")
+
+    @override_settings(TEMPLATE_DEBUG=False)
+    def test_storage_error(self):
+        with patch('filebrowser.templatetags.fb_versions.lookup_versions', side_effect=OSError):
+            r, large_versions = self.render(self.fileobjects)
+        self.assertEqual(r, ";;;")
+        self.assertEqual([version for fileobject, version in large_versions], ["", "", ""])
+
+    def test_outdated(self):
+        self.render(self.fileobjects)
+        version_path = os.path.join(self.VERSIONS_PATH, 'folder', 'testimage2_large.jpg')
+        os.utime(version_path, (0, 0))
+
+        fileobjects = [FileObject(f.path, site=site) for f in self.fileobjects]
+        with patch('filebrowser.base.FileObject.version_generate', autospec=True, side_effect=FileObject.version_generate) as mock_generate:
+            self.render(fileobjects)
+        self.assertEqual([call.args[0].filename for call in mock_generate.call_args_list], ['testimage2.jpg'])
+        self.assertGreater(os.path.getmtime(version_path), 0)
+
+    @patch('filebrowser.templatetags.fb_versions.FORCE_PLACEHOLDER', True)
+    def test_force_placeholder(self):
+        r, large_versions = self.render(self.fileobjects)
+        self.assertEqual(r, "_test/_versions/placeholders/testimage_large.jpg;" * 2 + ";")
+
+    @patch('filebrowser.templatetags.fb_versions.SHOW_PLACEHOLDER', True)
+    def test_show_placeholder(self):
+        fileobjects = self.fileobjects + [
+            FileObject(os.path.join(self.DIRECTORY, 'folder', 'missing.jpg'), site=site),
+            FileObject(os.path.join(self.DIRECTORY, 'folder'), site=site),
+        ]
+        r, large_versions = self.render(fileobjects)
+        self.assertEqual(r, "_test/_versions/folder/testimage_large.jpg;_test/_versions/folder/testimage2_large.jpg;;_test/_versions/placeholders/testimage_large.jpg;;")
+
+    def test_invalid_version(self):
+        t = Template('{% load fb_versions %}{% versions fileobjects "invalid" as invalid_versions %}')
+        c = Context({"fileobjects": self.fileobjects})
+        self.assertEqual(t.render(c), "")
+        self.assertEqual(c['invalid_versions'], [(fileobject, "") for fileobject in self.fileobjects])
+
+
 class VersionTemplateTagTests(TestCase):
     """Test basic version uses
 
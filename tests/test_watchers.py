@@ -0,0 +1,118 @@
+import os
+import shutil
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.core.management import call_command
+
+from filebrowser.search import SQLiteSearchIndex
+from filebrowser.sites import site
+from filebrowser.watchers import PollingWatcher, VersionsWatcher
+from . import FilebrowserTestCase as TestCase
+
+
+class PollingWatcherTests(TestCase):
+    """
+    /_test/uploads/testimage.jpg
+    /_test/uploads/folder/
+    /_test/uploads/folder/subfolder/
+    """
+
+    def setUp(self):
+        super(PollingWatcherTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.DIRECTORY_PATH)
+        self.watcher = PollingWatcher(site)
+        self.watcher.start()
+
+    def touch(self, path, content='test'):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_poll(self):
+        self.assertEqual(sorted(self.watcher.folders), ['_test/uploads', '_test/uploads/folder', '_test/uploads/folder/subfolder'])
+        self.assertEqual(self.watcher.poll(), [])
+
+        self.touch(os.path.join(self.SUBFOLDER_PATH, 'new.txt'))
+        os.makedirs(os.path.join(self.DIRECTORY_PATH, 'created', 'inner'))
+        self.touch(os.path.join(self.DIRECTORY_PATH, 'created', 'inner', 'file.txt'))
+        os.remove(os.path.join(self.DIRECTORY_PATH, 'testimage.jpg'))
+        self.assertEqual(self.watcher.poll(), [
+            ('created', '_test/uploads/created', True),
+            ('deleted', '_test/uploads/testimage.jpg', False),
+            ('created', '_test/uploads/folder/subfolder/new.txt', False),
+        ])
+        self.assertIn('_test/uploads/created/inner', self.watcher.folders)
+        self.assertEqual(self.watcher.poll(), [])
+
+        # changed in place, only detected with a full poll
+        self.touch(os.path.join(self.SUBFOLDER_PATH, 'new.txt'), 'changed')
+        self.assertEqual(self.watcher.poll(full=True), [
+            ('modified', '_test/uploads/folder/subfolder/new.txt', False),
+        ])
+
+        # a folder replaced with a file
+        shutil.rmtree(os.path.join(self.DIRECTORY_PATH, 'created'))
+        self.touch(os.path.join(self.DIRECTORY_PATH, 'created'))
+        self.assertEqual(self.watcher.poll(), [
+            ('deleted', '_test/uploads/created', True),
+            ('created', '_test/uploads/created', False),
+        ])
+        self.assertNotIn('_test/uploads/created/inner', self.watcher.folders)
+
+    def test_notify(self):
+        site.search_index = SQLiteSearchIndex(site, location=os.path.join(self.TEST_PATH, 'search.sqlite3'))
+        try:
+            site.search_index.rebuild()
+            self.touch(os.path.join(self.FOLDER_PATH, 'outside.txt'))
+            os.remove(os.path.join(self.DIRECTORY_PATH, 'testimage.jpg'))
+            self.watcher.notify(self.watcher.poll())
+            self.assertEqual(site.search_index.search(self.DIRECTORY, 'outside|testimage'), [
+                ('_test/uploads/folder', True),
+                ('_test/uploads/folder/outside.txt', False),
+                ('_test/uploads/folder/subfolder', True),
+            ])
+        finally:
+            site.search_index = None
+
+    def test_command(self):
+        out = StringIO()
+
+        def sleep(seconds):
+            if os.path.exists(os.path.join(self.FOLDER_PATH, 'outside.txt')):
+                raise KeyboardInterrupt
+            self.touch(os.path.join(self.FOLDER_PATH, 'outside.txt'))
+
+        with patch('filebrowser.management.commands.fb_watch.time.sleep', side_effect=sleep):
+            call_command('fb_watch', stdout=out)
+        self.assertIn('Watching _test/uploads/ (3 folder(s))', out.getvalue())
+        self.assertIn('created _test/uploads/folder/outside.txt', out.getvalue())
+
+    @patch('filebrowser.utils.VERSIONS_CACHE', 'default')
+    def test_versions(self):
+        caches['default'].clear()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        version = self.F_IMAGE.version_generate('large')
+        watcher = VersionsWatcher(site)
+        watcher.start()
+        self.assertIn('_test/_versions/folder', watcher.folders)
+
+        # a version removed outside of the FileBrowser
+        os.remove(version.path_full)
+        watcher.notify(watcher.poll())
+        self.assertEqual(self.F_IMAGE._version_manifest(), {})
+        self.F_IMAGE.version_generate('large')
+        self.assertTrue(os.path.exists(version.path_full))
+
+        # a folder of versions removed
+        self.assertTrue(self.F_IMAGE._version_manifest())
+        shutil.rmtree(os.path.join(self.VERSIONS_PATH, 'folder'))
+        watcher.notify(watcher.poll())
+        self.assertEqual(self.F_IMAGE._version_manifest(), {})
+
+    def test_command_versions(self):
+        os.makedirs(self.VERSIONS_PATH)
+        out = StringIO()
+        with patch('filebrowser.management.commands.fb_watch.time.sleep', side_effect=KeyboardInterrupt):
+            call_command('fb_watch', stdout=out)
+        self.assertIn('Watching _test/_versions/ (1 folder(s))', out.getvalue())